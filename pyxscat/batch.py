@@ -0,0 +1,686 @@
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+
+from pyFAI.io.ponifile import PoniFile
+from pyxscat.gi_integrator import GIIntegrator
+from pyxscat.h5_integrator import H5GIIntegrator
+from pyxscat.metadata import MetadataBase, FILENAMES, NAMES
+from pyxscat.other.column_methods import to_array
+from pyxscat.other.frame_methods import read_frame
+from pyxscat.other.integrator_methods import *
+from pyxscat.other.other_functions import dict_to_str, merge_dictionaries
+from pyxscat.poni_methods import open_poni
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from pyxscat.logger_config import setup_logger
+logger = setup_logger()
+
+DEFAULT_CHUNKSIZE = 4
+DEFAULT_INCIDENT_ANGLE = 0.0
+DEFAULT_TILT_ANGLE = 0.0
+DEFAULT_NORM_FACTOR = 1.0
+DEFAULT_CHUNK_ROWS = 64
+DEFAULT_COMPRESSION = 'gzip'
+DEFAULT_COMPRESSION_LEVEL = 4
+FORMAT_STRING = h5py.string_dtype('UTF-8')
+FORMAT_FLOAT = 'float64'
+METADATA_GROUP_KEY = 'metadata'
+INTENSITY_KEY = 'intensity'
+AXIS_KEY = 'x'
+# Axis of every row, only created if the axis of a frame differs from the axis of the first one
+ROW_AXIS_KEY = 'x_rows'
+
+ERROR_BATCH_SOURCE = "The source of the batch is not a H5GIIntegrator nor a MetadataBase instance."
+ERROR_BATCH_PONI = "There is no valid .poni to run a batch integration."
+
+BatchTask = namedtuple('BatchTask', ['filename', 'incident_angle', 'tilt_angle', 'norm_factor'])
+
+# Integrator of every worker process, initialized once by _init_worker
+_worker_gi = None
+_worker_list_dict_integration = []
+
+def logger_info(func):
+    def wrapper(*args, **kwargs):
+        logger.info(f'We entered into function: {func.__name__}')
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _init_worker(poni_dict=dict(), qz_parallel=True, qr_parallel=True, list_dict_integration=list()):
+    """
+    Initializer of every worker process: builds its own GIIntegrator (own geometry and cached arrays)
+
+    Keyword Arguments:
+        poni_dict -- dictionary from PoniFile.as_dict() (default: {dict()})
+        qz_parallel -- inversion of the qz axis (default: {True})
+        qr_parallel -- inversion of the qr axis (default: {True})
+        list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+    """
+    global _worker_gi, _worker_list_dict_integration
+    _worker_gi = _build_integrator(
+        poni_dict=poni_dict,
+        qz_parallel=qz_parallel,
+        qr_parallel=qr_parallel,
+    )
+    _worker_list_dict_integration = list_dict_integration
+
+
+def _build_integrator(poni_dict=dict(), qz_parallel=True, qr_parallel=True) -> GIIntegrator:
+    # Every frame of a batch is integrated once, no need to keep the results
+    gi = GIIntegrator(use_result_cache=False)
+    gi.update_poni(poni=PoniFile(data=poni_dict))
+    gi.update_orientation(
+        qz_parallel=qz_parallel,
+        qr_parallel=qr_parallel,
+    )
+    return gi
+
+
+def _integrate_task(task=None) -> tuple:
+    """
+    Opens one frame and performs every integration with the integrator of the worker
+
+    Keyword Arguments:
+        task -- BatchTask instance (default: {None})
+
+    Returns:
+        tuple with the task and the list of results (None if the frame could not be integrated)
+    """
+    return task, integrate_frame(
+        gi=_worker_gi,
+        task=task,
+        list_dict_integration=_worker_list_dict_integration,
+    )
+
+
+def integrate_frame(gi=None, task=None, list_dict_integration=list()) -> list:
+    """
+    Updates the angles of the integrator and performs the integrations of one frame
+
+    Keyword Arguments:
+        gi -- GIIntegrator instance (default: {None})
+        task -- BatchTask instance (default: {None})
+        list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+
+    Returns:
+        list with the results of the integrations, one per dictionary
+    """
+    try:
+        # Plain files or frames of a container ('path::index'), read-only
+        data = read_frame(filename=task.filename)
+    except Exception as e:
+        logger.error(f'{e}: {task.filename} could not be opened.')
+        return
+
+    gi.update_incident_angle(incident_angle=task.incident_angle)
+    gi.update_tilt_angle(tilt_angle=task.tilt_angle)
+
+    results = list(
+        gi.generate_integration(
+            data=data,
+            norm_factor=task.norm_factor,
+            list_dict_integration=list_dict_integration,
+        )
+    )
+    return results
+
+
+def _get_values(values=None, nfiles=0, default=0.0) -> list:
+    """
+    Returns a list of floats with the same length as the files, falling back on the default value
+    """
+    if values is None or len(values) != nfiles:
+        return [default] * nfiles
+
+    list_values = []
+    for value in values:
+        try:
+            list_values.append(float(value))
+        except Exception:
+            list_values.append(default)
+    return list_values
+
+
+@logger_info
+def get_batch_tasks(source=None, entry_name='', iangle_key='', tangle_key='', norm_key='') -> list:
+    """
+    Builds the list of tasks (filename, incident angle, tilt angle, norm. factor) of one entry
+
+    Keyword Arguments:
+        source -- H5GIIntegrator or MetadataBase instance (default: {None})
+        entry_name -- name of the entry/sample (default: {''})
+        iangle_key -- metadata key of the incident angle (default: {''})
+        tangle_key -- metadata key of the tilt angle (default: {''})
+        norm_key -- metadata key of the normalization factor (default: {''})
+
+    Returns:
+        list of BatchTask instances
+    """
+    if isinstance(source, H5GIIntegrator):
+        list_files = source.get_all_filenames_from_sample(sample_name=entry_name)
+        iangle_values = source.get_dataset_incident_angle(sample_name=entry_name)
+        tangle_values = source.get_dataset_tilt_angle(sample_name=entry_name)
+        norm_values = source.get_dataset_norm_factor(sample_name=entry_name)
+    elif isinstance(source, MetadataBase):
+        list_files = source.get_files_in_entry(entry_name=entry_name)
+        iangle_values = source.get_metadata_in_entry(entry_name=entry_name, metadata_key=iangle_key) if iangle_key else None
+        tangle_values = source.get_metadata_in_entry(entry_name=entry_name, metadata_key=tangle_key) if tangle_key else None
+        norm_values = source.get_metadata_in_entry(entry_name=entry_name, metadata_key=norm_key) if norm_key else None
+    else:
+        logger.error(ERROR_BATCH_SOURCE)
+        return []
+
+    if not list_files:
+        logger.error(f'No files were found in entry {entry_name}.')
+        return []
+
+    nfiles = len(list_files)
+    norm_values = [
+        value if value != 0.0 else DEFAULT_NORM_FACTOR
+        for value in _get_values(values=norm_values, nfiles=nfiles, default=DEFAULT_NORM_FACTOR)
+    ]
+    list_tasks = [
+        BatchTask(*task) for task in zip(
+            list_files,
+            _get_values(values=iangle_values, nfiles=nfiles, default=DEFAULT_INCIDENT_ANGLE),
+            _get_values(values=tangle_values, nfiles=nfiles, default=DEFAULT_TILT_ANGLE),
+            norm_values,
+        )
+    ]
+    return list_tasks
+
+
+def _decode_values(values=()) -> list:
+    return [value.decode() if isinstance(value, bytes) else value for value in values]
+
+
+@logger_info
+def get_batch_metadata(source=None, entry_name='') -> dict:
+    """
+    Returns the metadata columns (counters and motors of the headers) of one entry,
+    with one value per file, in the same order as the tasks of get_batch_tasks
+
+    Keyword Arguments:
+        source -- H5GIIntegrator or MetadataBase instance (default: {None})
+        entry_name -- name of the entry/sample (default: {''})
+
+    Returns:
+        dictionary with the metadata key and the list of values
+    """
+    dict_metadata = dict()
+    if isinstance(source, H5GIIntegrator):
+        nfiles = len(source.get_all_filenames_from_sample(sample_name=entry_name))
+        for metadata_key in source.get_all_metadata_keys_from_sample(sample_name=entry_name) or []:
+            try:
+                dataset = source.get_metadata_dataset(sample_name=entry_name, key_metadata=metadata_key)
+            except Exception:
+                continue
+            # Only the groups with one value per file are metadata
+            if dataset is not None and np.ndim(dataset) == 1 and len(dataset) == nfiles:
+                dict_metadata[metadata_key] = _decode_values(values=dataset.tolist())
+    elif isinstance(source, MetadataBase):
+        for metadata_key in source.get_all_metadata_in_entry(entry_name=entry_name) or []:
+            if metadata_key in (FILENAMES, NAMES):
+                continue
+            dict_metadata[metadata_key] = list(source.get_metadata_in_entry(entry_name=entry_name, metadata_key=metadata_key))
+    else:
+        logger.error(ERROR_BATCH_SOURCE)
+    return dict_metadata
+
+
+@logger_info
+def save_batch_result(folder_output='', task=None, list_dict_integration=list(), list_results=list()) -> str:
+    """
+    Saves the integrations of one frame in a .csv file, with the same format as the 1D chart
+
+    Keyword Arguments:
+        folder_output -- directory where the .csv file is saved (default: {''})
+        task -- BatchTask instance (default: {None})
+        list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+        list_results -- list of results, one per dictionary (default: {list()})
+
+    Returns:
+        str with the output filename
+    """
+    filename_out = Path(folder_output).joinpath(Path(task.filename).stem)
+    filename_out = str(filename_out)
+
+    merge_dict = merge_dictionaries(list_dicts=list_dict_integration)
+    str_header = dict_to_str(dictionary=task._asdict() | merge_dict)
+
+    dict_results = {}
+    for dict_int, res in zip(list_dict_integration, list_results):
+        if res is None:
+            continue
+        if dict_int[KEY_INTEGRATION] == CAKE_LABEL:
+            dict_results[f"{dict_int[CAKE_KEY_UNIT]}_{dict_int[CAKE_KEY_SUFFIX]}"] = res[0]
+        elif dict_int[KEY_INTEGRATION] == BOX_LABEL:
+            dict_results[f"{dict_int[BOX_KEY_OUTPUT_UNIT]}_{dict_int[BOX_KEY_SUFFIX]}"] = res[0]
+
+        dict_results[f"Intensity_{dict_int[CAKE_KEY_SUFFIX]}"] = res[1]
+        filename_out += f"_{dict_int[CAKE_KEY_SUFFIX]}"
+    filename_out += '.csv'
+
+    dataframe = pd.DataFrame.from_dict(dict_results, orient='index')
+    dataframe = dataframe.transpose()
+
+    with open(filename_out, 'w') as f:
+        f.write(f'{str_header}\n')
+    dataframe.to_csv(filename_out, sep=',', mode='a', index=False, header=True)
+    return filename_out
+
+
+class H5StreamWriter:
+    """
+    Writes the integrations of a series of frames into resizable, chunked and compressed HDF5 datasets:
+    one (n_frames x n_bins) dataset per integration and one dataset per metadata column, aligned by row.
+    The rows are buffered up to one chunk, so the memory does not depend on the length of the series.
+    The axis of an integration is taken from its first frame; if a later frame has another axis,
+    the axis of every row is also stored in a (n_frames x n_bins) dataset.
+    """
+
+    def __init__(
+        self,
+        filename='',
+        entry_name='',
+        list_dict_integration=list(),
+        chunk_rows=DEFAULT_CHUNK_ROWS,
+        compression=DEFAULT_COMPRESSION,
+        compression_opts=DEFAULT_COMPRESSION_LEVEL,
+        dict_metadata=dict(),
+        ) -> None:
+        """
+        Keyword Arguments:
+            filename -- path of the output .h5 file, opened in append mode (default: {''})
+            entry_name -- name of the NXentry group, overwritten if it exists (default: {''})
+            list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+            chunk_rows -- number of frames per chunk (default: {DEFAULT_CHUNK_ROWS})
+            compression -- h5py compression filter (default: {DEFAULT_COMPRESSION})
+            compression_opts -- options of the compression filter (default: {DEFAULT_COMPRESSION_LEVEL})
+            dict_metadata -- header columns, one value per appended frame, see get_batch_metadata (default: {dict()})
+        """
+        self._filename = str(filename)
+        self._entry_name = entry_name
+        self._list_dict_integration = list(list_dict_integration)
+        self._chunk_rows = max(int(chunk_rows), 1)
+        self._compression = compression
+        self._compression_opts = compression_opts if compression == 'gzip' else None
+        self._file = None
+        self._nrows = 0
+        self._buffer_tasks = []
+        self._buffer_results = []
+        # '/' would create subgroups, the names of the BatchTask fields are already used
+        self._metadata = {
+            str(metadata_key).replace('/', '_') : to_array(values=values)
+            for metadata_key, values in dict_metadata.items()
+            if str(metadata_key).replace('/', '_') not in BatchTask._fields
+        }
+        self._x_vectors = dict()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def nrows(self):
+        return self._nrows + len(self._buffer_tasks)
+
+    def _get_integration_name(self, dict_integration=dict()) -> str:
+        return dict_integration.get(CAKE_KEY_SUFFIX) or dict_integration.get(CAKE_KEY_NAME)
+
+    def _create_dataset(self, group=None, name='', row_shape=(), dtype=FORMAT_FLOAT):
+        return group.create_dataset(
+            name=name,
+            shape=(0,) + row_shape,
+            maxshape=(None,) + row_shape,
+            chunks=(self._chunk_rows,) + row_shape,
+            dtype=dtype,
+            compression=self._compression,
+            compression_opts=self._compression_opts,
+            shuffle=self._compression is not None,
+        )
+
+    def open(self) -> None:
+        self._file = h5py.File(self._filename, 'a')
+        if self._entry_name in self._file:
+            del self._file[self._entry_name]
+        entry = self._file.create_group(self._entry_name)
+        entry.attrs['NX_class'] = 'NXentry'
+
+        metadata = entry.create_group(METADATA_GROUP_KEY)
+        metadata.attrs['NX_class'] = 'NXcollection'
+        self._create_dataset(group=metadata, name='filename', dtype=FORMAT_STRING)
+        for field in BatchTask._fields[1:]:
+            self._create_dataset(group=metadata, name=field)
+        for metadata_key, values in self._metadata.items():
+            self._create_dataset(
+                group=metadata,
+                name=metadata_key,
+                dtype=FORMAT_FLOAT if values.dtype == np.float64 else FORMAT_STRING,
+            )
+
+    def append(self, task=None, list_results=list()) -> None:
+        """
+        Buffers the results of one frame, written to the file every chunk_rows frames
+        """
+        self._buffer_tasks.append(task)
+        self._buffer_results.append(list_results)
+        if len(self._buffer_tasks) >= self._chunk_rows:
+            self.flush()
+
+    def _get_group(self, dict_integration=dict(), x_vector=None):
+        """
+        Returns the NXdata group of an integration, created with the axis of the first valid result
+        """
+        entry = self._file[self._entry_name]
+        name = self._get_integration_name(dict_integration=dict_integration)
+        if name in entry:
+            group = entry[name]
+            if name not in self._x_vectors:
+                self._x_vectors[name] = group[AXIS_KEY][()]
+            return group
+        if x_vector is None:
+            return
+
+        group = entry.create_group(name)
+        group.attrs['NX_class'] = 'NXdata'
+        group.attrs['signal'] = INTENSITY_KEY
+        group.attrs['axes'] = ['.', AXIS_KEY]
+        group.attrs['integration'] = dict_to_str(dictionary=dict_integration)
+        group.create_dataset(name=AXIS_KEY, data=np.asarray(x_vector, dtype=FORMAT_FLOAT))
+        self._x_vectors[name] = group[AXIS_KEY][()]
+        dataset = self._create_dataset(group=group, name=INTENSITY_KEY, row_shape=(len(x_vector),))
+        # Frames integrated before the first valid result
+        dataset.resize((self._nrows, len(x_vector)))
+        dataset[:] = np.nan
+        return group
+
+    def flush(self) -> None:
+        if not self._buffer_tasks:
+            return
+
+        nrows = len(self._buffer_tasks)
+        new_size = self._nrows + nrows
+
+        metadata = self._file[self._entry_name][METADATA_GROUP_KEY]
+        for field, values in zip(BatchTask._fields, zip(*self._buffer_tasks)):
+            metadata[field].resize((new_size,))
+            metadata[field][self._nrows:] = [str(value) for value in values] if field == 'filename' else values
+        for metadata_key, values in self._metadata.items():
+            block = values[self._nrows:new_size]
+            if len(block) < nrows:
+                # More frames than values in the column
+                missing = np.nan if values.dtype == np.float64 else ''
+                block = np.concatenate([block, np.full(nrows - len(block), missing, dtype=values.dtype)])
+            metadata[metadata_key].resize((new_size,))
+            metadata[metadata_key][self._nrows:] = block
+
+        for index_integration, dict_integration in enumerate(self._list_dict_integration):
+            list_res = [
+                list_results[index_integration] if list_results is not None else None
+                for list_results in self._buffer_results
+            ]
+            x_vector = next((res[0] for res in list_res if res is not None), None)
+            group = self._get_group(dict_integration=dict_integration, x_vector=x_vector)
+            if group is None:
+                continue
+
+            dataset = group[INTENSITY_KEY]
+            nbins = dataset.shape[1]
+            x_axis = self._x_vectors[self._get_integration_name(dict_integration=dict_integration)]
+            block = np.full((nrows, nbins), np.nan, dtype=FORMAT_FLOAT)
+            block_x = np.full((nrows, nbins), np.nan, dtype=FORMAT_FLOAT)
+            new_axis = False
+            for index_row, res in enumerate(list_res):
+                if res is None:
+                    continue
+                if len(res[1]) != nbins:
+                    logger.error(f'{self._buffer_tasks[index_row].filename}: {len(res[1])} bins instead of {nbins}.')
+                    continue
+                block[index_row] = res[1]
+                block_x[index_row] = res[0]
+                if not np.allclose(res[0], x_axis, equal_nan=True):
+                    new_axis = True
+            dataset.resize((new_size, nbins))
+            dataset[self._nrows:] = block
+
+            if new_axis or ROW_AXIS_KEY in group:
+                self._write_row_axis(group=group, block_x=block_x, new_size=new_size)
+
+        self._nrows = new_size
+        self._buffer_tasks.clear()
+        self._buffer_results.clear()
+        self._file.flush()
+
+    def _write_row_axis(self, group=None, block_x=None, new_size=0) -> None:
+        if ROW_AXIS_KEY not in group:
+            # The previous rows share the axis of the first frame
+            logger.warning(f'The axis of {group.name} changes between frames, the axis of every row is stored in {ROW_AXIS_KEY}.')
+            x_axis = group[AXIS_KEY][()]
+            dataset_x = self._create_dataset(group=group, name=ROW_AXIS_KEY, row_shape=(len(x_axis),))
+            dataset_x.resize((self._nrows, len(x_axis)))
+            if self._nrows:
+                dataset_x[:] = np.broadcast_to(x_axis, (self._nrows, len(x_axis)))
+        dataset_x = group[ROW_AXIS_KEY]
+        dataset_x.resize((new_size, dataset_x.shape[1]))
+        dataset_x[self._nrows:] = block_x
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self.flush()
+            # Integrations without any valid result until the end
+            for dict_integration in self._list_dict_integration:
+                if self._get_group(dict_integration=dict_integration) is None:
+                    logger.error(f'No valid results for {self._get_integration_name(dict_integration=dict_integration)}.')
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class BatchIntegrator:
+    """
+    Headless engine that integrates every frame of an entry in a pool of processes.
+    Every worker holds its own GIIntegrator, so the geometry is built once per process and not per frame.
+    """
+
+    def __init__(
+        self,
+        poni=None,
+        list_dict_integration=list(),
+        qz_parallel=True,
+        qr_parallel=True,
+        processes=None,
+        chunksize=DEFAULT_CHUNKSIZE,
+        ) -> None:
+        """
+        Keyword Arguments:
+            poni -- PoniFile instance or ponifile string path (default: {None})
+            list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+            qz_parallel -- inversion of the qz axis (default: {True})
+            qr_parallel -- inversion of the qr axis (default: {True})
+            processes -- number of worker processes, cpu count if None, in-process if 1 (default: {None})
+            chunksize -- number of frames sent to a worker at once (default: {DEFAULT_CHUNKSIZE})
+        """
+        poni = open_poni(poni=poni)
+        if poni is None:
+            raise ValueError(ERROR_BATCH_PONI)
+
+        self._poni_dict = poni.as_dict()
+        self._list_dict_integration = list(list_dict_integration)
+        self._qz_parallel = qz_parallel
+        self._qr_parallel = qr_parallel
+        self._processes = processes or cpu_count()
+        self._chunksize = max(int(chunksize), 1)
+
+    @property
+    def list_dict_integration(self):
+        return self._list_dict_integration
+
+    @logger_info
+    def generate_batch(self, list_tasks=list()):
+        """
+        Yields the integrations of every task, in the same order as the input list
+
+        Keyword Arguments:
+            list_tasks -- list of BatchTask instances (default: {list()})
+
+        Yields:
+            tuple with the task and the list of results
+        """
+        if not list_tasks:
+            return
+
+        init_args = (
+            self._poni_dict,
+            self._qz_parallel,
+            self._qr_parallel,
+            self._list_dict_integration,
+        )
+
+        processes = min(self._processes, len(list_tasks))
+        if processes <= 1:
+            gi = _build_integrator(*init_args[:3])
+            for task in list_tasks:
+                yield task, integrate_frame(
+                    gi=gi,
+                    task=task,
+                    list_dict_integration=self._list_dict_integration,
+                )
+            return
+
+        with Pool(processes=processes, initializer=_init_worker, initargs=init_args) as pool:
+            for task, list_results in pool.imap(_integrate_task, list_tasks, chunksize=self._chunksize):
+                yield task, list_results
+
+    @logger_info
+    def generate_batch_files(self, list_tasks=list(), folder_output=''):
+        """
+        Yields the integrations of every task as they arrive, saving a .csv file per frame.
+        Nothing is kept in memory: the caller decides what to do with every result.
+
+        Keyword Arguments:
+            list_tasks -- list of BatchTask instances (default: {list()})
+            folder_output -- if any, a .csv file is saved per frame in this directory (default: {''})
+
+        Yields:
+            tuple with the task and the list of results (None if the frame could not be integrated)
+        """
+        nframes = 0
+        for task, list_results in self.generate_batch(list_tasks=list_tasks):
+            if list_results is not None:
+                nframes += 1
+                if folder_output:
+                    try:
+                        save_batch_result(
+                            folder_output=folder_output,
+                            task=task,
+                            list_dict_integration=self._list_dict_integration,
+                            list_results=list_results,
+                        )
+                    except Exception as e:
+                        logger.error(f'{e}: the results of {task.filename} could not be saved.')
+            yield task, list_results
+        logger.info(f'Batch integration finished: {nframes}/{len(list_tasks)} frames.')
+
+    @logger_info
+    def integrate_entry(
+        self,
+        source=None,
+        entry_name='',
+        folder_output='',
+        iangle_key='',
+        tangle_key='',
+        norm_key='',
+        ) -> list:
+        """
+        Integrates every file of one entry (H5GIIntegrator or MetadataBase)
+        The results are returned in a list, use generate_batch_files or stream_entry for long series
+
+        Keyword Arguments:
+            source -- H5GIIntegrator or MetadataBase instance (default: {None})
+            entry_name -- name of the entry/sample (default: {''})
+            folder_output -- if any, a .csv file is saved per frame in this directory (default: {''})
+            iangle_key -- metadata key of the incident angle, MetadataBase only (default: {''})
+            tangle_key -- metadata key of the tilt angle, MetadataBase only (default: {''})
+            norm_key -- metadata key of the normalization factor, MetadataBase only (default: {''})
+
+        Returns:
+            list of tuples with the task and the list of results
+        """
+        list_tasks = get_batch_tasks(
+            source=source,
+            entry_name=entry_name,
+            iangle_key=iangle_key,
+            tangle_key=tangle_key,
+            norm_key=norm_key,
+        )
+
+        batch_results = [
+            (task, list_results)
+            for task, list_results in self.generate_batch_files(list_tasks=list_tasks, folder_output=folder_output)
+            if list_results is not None
+        ]
+        return batch_results
+
+    @logger_info
+    def stream_entry(
+        self,
+        source=None,
+        entry_name='',
+        output_filename='',
+        iangle_key='',
+        tangle_key='',
+        norm_key='',
+        chunk_rows=DEFAULT_CHUNK_ROWS,
+        compression=DEFAULT_COMPRESSION,
+        ) -> int:
+        """
+        Integrates every file of one entry (time-resolved series) and streams the results into an HDF5 file:
+        one (n_frames x n_bins) dataset per integration, the metadata of every frame (task and header) in the same row.
+        The frames are read lazily and the results are written by chunks, nothing is kept in memory.
+
+        Keyword Arguments:
+            source -- H5GIIntegrator or MetadataBase instance (default: {None})
+            entry_name -- name of the entry/sample (default: {''})
+            output_filename -- path of the output .h5 file (default: {''})
+            iangle_key -- metadata key of the incident angle, MetadataBase only (default: {''})
+            tangle_key -- metadata key of the tilt angle, MetadataBase only (default: {''})
+            norm_key -- metadata key of the normalization factor, MetadataBase only (default: {''})
+            chunk_rows -- number of frames per HDF5 chunk (default: {DEFAULT_CHUNK_ROWS})
+            compression -- h5py compression filter, None to disable it (default: {DEFAULT_COMPRESSION})
+
+        Returns:
+            int with the number of frames written
+        """
+        list_tasks = get_batch_tasks(
+            source=source,
+            entry_name=entry_name,
+            iangle_key=iangle_key,
+            tangle_key=tangle_key,
+            norm_key=norm_key,
+        )
+        if not list_tasks:
+            return 0
+
+        with H5StreamWriter(
+            filename=output_filename,
+            entry_name=str(entry_name).strip('/').replace('/', '_') or 'entry',
+            list_dict_integration=self._list_dict_integration,
+            chunk_rows=chunk_rows,
+            compression=compression,
+            dict_metadata=get_batch_metadata(source=source, entry_name=entry_name),
+            ) as writer:
+            for task, list_results in self.generate_batch(list_tasks=list_tasks):
+                writer.append(task=task, list_results=list_results)
+            nrows = writer.nrows
+        logger.info(f'{nrows} frames of {entry_name} were streamed into {output_filename}.')
+        return nrows
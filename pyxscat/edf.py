@@ -3,8 +3,12 @@ warnings.filterwarnings("ignore")
 
 from datetime import datetime
 from os.path import basename, dirname, exists, getctime, splitext
+import os
 from pygix.transform import Transform
 
+from pyxscat.other.cache_methods import geometry_key, get_mesh_cache
+from pyxscat.other.edf_methods import is_edf_file, open_edf_memmap, as_dtype, read_raw_header
+from pyxscat.other.frame_methods import get_frame_cache
 from pyxscat.other.setup_methods import get_dict_setup
 from pyxscat.other.other_functions import np_weak_lims
 from pyxscat.other.plots import plot_mesh, plot_image
@@ -56,14 +60,28 @@ POS_NAME = ['pos']
 class FullHeader():
     def __init__(self, filename) -> None:
         self._filename = filename
+
+    def get_edf_header(self):
+        """
+        Returns the EdfHeader (raw header, binary offset, dtype and shape) reading only the header blocks, None if not an .edf file
+        """
+        if not is_edf_file(self._filename):
+            return
+        try:
+            return get_frame_cache().get_edf_header(filename=self._filename)
+        except:
+            return
     
     def get_raw_header(self):
         """
-        Returns the raw header using the FabIO header
+        Returns the raw header, without reading the pixels for .edf, .cbf and TIFF files, using the FabIO header for other formats
         """
+        edf_header = self.get_edf_header()
+        if edf_header is not None:
+            return dict(edf_header.header)
         try:
-            header = fabio.open(self._filename).header
-            return header
+            # Header-only readers for .cbf and TIFF files, fabio for the rest
+            return read_raw_header(filename=self._filename)
         except:
             return
 
@@ -208,6 +226,14 @@ class EdfClass(Transform):
             filename=filename,
         )
 
+        # Parsed header, read lazily and only once while the file does not change
+        self._header_cache = None
+        self._header_stat = None
+
+        # Memory-mapped frame of uncompressed .edf files
+        self._frame = None
+        self._frame_stat = None
+
         # Update the dictionary with setup information
         self._dict_setup = get_dict_setup(
             dict_setup=dict_setup,
@@ -388,14 +414,39 @@ class EdfClass(Transform):
         """
         return DICT_SAMPLE_ORIENTATIONS[(self._qz_parallel, self._qr_parallel)]
 
+    def get_frame(self, dtype=None) -> np.array:
+        """
+            Return the data of the file without copies: the frame in memory if it was already read (or prefetched),
+            if not, a read-only memory-map for uncompressed .edf files (only the accessed pages are read).
+            The rest of the files (compressed, other formats) are decoded once and kept in the process-wide frame cache.
+            If a dtype is given, a converted copy is returned only if the dtype is different
+        """
+        stat = self._get_file_stat()
+        if self._frame is None or stat is None or stat != self._frame_stat:
+            frame = get_frame_cache().peek(filename=self.filename)
+            if frame is None and is_edf_file(self.filename):
+                try:
+                    frame = open_edf_memmap(filename=self.filename)
+                except:
+                    frame = None
+            if frame is None:
+                try:
+                    frame = get_frame_cache().get_frame(filename=self.filename)
+                except:
+                    return None
+            self._frame = frame
+            self._frame_stat = stat
+        return as_dtype(data=self._frame, dtype=dtype)
+
     def get_data(self) -> np.array:
         """
-            Return the numpy array of data opened with Fabio, already normalized or not
+            Return the numpy array of data (int32 copy), built from get_frame:
+            uncompressed .edf files are read from the memory-map and do not fill the frame cache
         """
-        try:
-            return fabio.open(self.filename).data.astype(np.int32)
-        except:
+        frame = self.get_frame()
+        if frame is None:
             return None
+        return np.array(frame, dtype=np.int32)
 
     def get_detector_array(self) -> np.array:
         """
@@ -429,57 +480,29 @@ class EdfClass(Transform):
     def get_mesh_matrix(self, unit='q_nm^-1', data=None):
         """
             Return both horizontal and vertical mesh matrix, ready to plot, returns also the corrected data without the missing wedge
+            The mesh matrix are taken from the shared cache (memory and disk) if the geometry was already used
         """
         if self.tranform_bool:
             unit = get_pyfai_unit(unit)
-            det_array = self.get_detector_array()
-
-            if unit in UNITS_Q:
-                # scat_z, scat_x = qz, qxy
-                if self._transform_q:
-                    try:
-                        scat_z, scat_x = self._transform_q.calc_q(
-                            d1=det_array[0,:,:],
-                            d2=det_array[1,:,:],
-                        )
-                    except:
-                        scat_z, scat_x = None, None
-                else:
-                    try:
-                        scat_z, scat_x = self.calc_q(
-                            d1=det_array[0,:,:],
-                            d2=det_array[1,:,:],
-                        )
-                    except:
-                        scat_z, scat_x = None, None
+            transform = self._transform_q if self._transform_q else self
+            mesh_cache = get_mesh_cache()
+            try:
+                key = ('mesh', geometry_key(geometry=transform), tuple(self.get_shape()), unit)
+                mesh = mesh_cache.get(key)
+            except:
+                key, mesh = None, None
 
-            elif unit in UNITS_THETA:
-                # scat_z, scat_x = alpha, tth
-                if self._transform_q:
-                    try:
-                        scat_z, scat_x = self._transform_q.calc_angles(
-                            d1=det_array[0,:,:],
-                            d2=det_array[1,:,:],
-                        )
-                    except:
-                        scat_z, scat_x = None, None
-                else:
-                    try:
-                        scat_z, scat_x = self.calc_angles(
-                            d1=det_array[0,:,:],
-                            d2=det_array[1,:,:],
-                        )
-                    except:
-                        scat_z, scat_x = None, None
+            if mesh is not None:
+                scat_x, scat_z = mesh
             else:
-                scat_z, scat_x = None, None
-            
-            # Transform units
-            if (scat_z is not None) and (scat_x is not None):
-                DICT_PLOT = DICT_UNIT_PLOTS.get(unit, DICT_PLOT_DEFAULT)
-                scat_z *= DICT_PLOT['SCALE']
-                scat_x *= DICT_PLOT['SCALE']
+                scat_x, scat_z = self._calc_mesh_matrix(
+                    transform=transform,
+                    unit=unit,
+                )
+                if (scat_z is not None) and (scat_x is not None) and (key is not None):
+                    scat_x, scat_z = mesh_cache.set(key, (scat_x, scat_z))
 
+            if (scat_z is not None) and (scat_x is not None):
                 if data is None:
                     data = self.get_data()
 
@@ -494,6 +517,42 @@ class EdfClass(Transform):
 
             return scat_x, scat_z, data
 
+    def _calc_mesh_matrix(self, transform=None, unit='q_nm^-1'):
+        """
+            Return both horizontal and vertical mesh matrix, already scaled to the unit
+        """
+        det_array = self.get_detector_array()
+
+        if unit in UNITS_Q:
+            # scat_z, scat_x = qz, qxy
+            try:
+                scat_z, scat_x = transform.calc_q(
+                    d1=det_array[0,:,:],
+                    d2=det_array[1,:,:],
+                )
+            except:
+                scat_z, scat_x = None, None
+
+        elif unit in UNITS_THETA:
+            # scat_z, scat_x = alpha, tth
+            try:
+                scat_z, scat_x = transform.calc_angles(
+                    d1=det_array[0,:,:],
+                    d2=det_array[1,:,:],
+                )
+            except:
+                scat_z, scat_x = None, None
+        else:
+            scat_z, scat_x = None, None
+        
+        # Transform units
+        if (scat_z is not None) and (scat_x is not None):
+            DICT_PLOT = DICT_UNIT_PLOTS.get(unit, DICT_PLOT_DEFAULT)
+            scat_z *= DICT_PLOT['SCALE']
+            scat_x *= DICT_PLOT['SCALE']
+
+        return scat_x, scat_z
+
     def plot_Qmesh(self, data=None, unit='q_nm^-1', auto_lims=True, **kwargs) -> None:
         """
             Plot the Q map only if the EdfClass instance contains a Geometry instance (with ponifile information)
@@ -514,21 +573,51 @@ class EdfClass(Transform):
 
     def get_raw_header(self):
         """
-        Returns the raw header using the FabIO header
+        Returns the raw header, reading only the header blocks for .edf files, using the FabIO header for other formats
+        """
+        header = FullHeader(filename=self.filename).get_raw_header()
+        return dict(header) if header else {}
+
+
+    def _get_file_stat(self) -> tuple:
+        """
+            Returns the modification time and size of the file, to check if the cached header is still valid
         """
         try:
-            header = dict(fabio.open(self.filename).header)
-            return header
+            stat = os.stat(self.filename)
+            return (stat.st_mtime_ns, stat.st_size)
         except:
-            return {}
+            return
 
+    def _get_cached_header(self) -> dict:
+        """
+            Returns the parsed header (nemonics expanded, float values), read only once while the file does not change
+            The returned dictionary is shared, it must not be modified
+        """
+        stat = self._get_file_stat()
+        if self._header_cache is None or stat is None or stat != self._header_stat:
+            self._header_cache = self._parse_header(search_nmemonics=True)
+            self._header_stat = stat
+        return self._header_cache
+
+    def clear_header_cache(self) -> None:
+        self._header_cache = None
+        self._header_stat = None
 
     def get_header(self, search_nmemonics=True, to_float=True) -> dict:
         """
             Return the header read with Fabio and modified if necessary
         """
+        if search_nmemonics:
+            return dict(self._get_cached_header())
+        return self._parse_header(search_nmemonics=search_nmemonics)
 
-        # First, take the original header using fabio
+    def _parse_header(self, search_nmemonics=True) -> dict:
+        """
+            Reads and parses the header of the file
+        """
+
+        # First, take the original header
         header = self.get_raw_header()
 
         # Check for nemonic values (list/strings inside keys)
@@ -649,22 +738,23 @@ class EdfClass(Transform):
         if isinstance(keys, str):
             keys = [keys]
 
+        header = self._get_cached_header()
         for key in keys:
             if '*' in key:
                 # It is a product of keys
-                return np.product([self.get_header()[item]] for item in key.split('*'))
+                return np.prod([header[item] for item in key.split('*')])
 
             elif '/' in key:
                 list_keys = key.split('/')
                 # It is a relation between two keys
-                return np.divide(self.get_header()[list_keys[0]], self.get_header()[list_keys[1]])
+                return np.divide(header[list_keys[0]], header[list_keys[1]])
 
             else:
                 try:
-                    if self.get_header()[key] in unacceptable_values:
+                    if header[key] in unacceptable_values:
                         pass
                     else:
-                        return self.get_header()[key]
+                        return header[key]
                 except:
                     pass
         return return_error
@@ -759,9 +849,12 @@ class EdfClass(Transform):
 
     def roi(self, roi=[]):
         """
-            Returns a numpy array, which is the region of interest of the full edf data
+            Returns a numpy array (int32 copy), which is the region of interest of the full edf data
+            Only the region is read from the memory-map and copied
         """
+        frame = self.get_frame()
+        if frame is None:
+            return None
         if roi:
-            return self.get_data()[roi[0]:roi[1],roi[2]:roi[3]]
-        else:
-            return self.get_data()
\ No newline at end of file
+            frame = frame[roi[0]:roi[1],roi[2]:roi[3]]
+        return np.array(frame, dtype=np.int32)
\ No newline at end of file
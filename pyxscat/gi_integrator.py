@@ -1,10 +1,14 @@
 
 from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
 from pygix.transform import Transform
+from pygix import grazing_units
 from pygix.grazing_units import TTH_DEG, TTH_RAD, Q_A, Q_NM
 from pyxscat.other.integrator_methods import *
 from pyxscat.other.setup_methods import *
 from pyxscat.other.units import *
+from pyxscat.other.cache_methods import LRUCache, ByteLRUCache, array_digest, freeze, geometry_key, poni_key, get_mesh_cache, get_geometry_pool, quantize_angle, DEFAULT_ANGLE_TOLERANCE
+from pyxscat.other.lut_methods import build_lut, integrate_lut, stack_luts, integrate_fused
+from pyxscat.other.unit_methods import UnitConverter, get_unit_converter, is_q_unit
 from pyxscat.poni_methods import open_poni
 import numpy as np
 
@@ -37,6 +41,15 @@ UNIT_GI = {
 
 POLARIZATION_FACTOR = 0.99
 NPT_RADIAL = int(100)
+LUT_CACHE_SIZE = 32
+FUSED_CACHE_SIZE = 8
+RESULT_CACHE_BYTES = 64 * 1024**2
+RESHAPE_CACHE_BYTES = 128 * 1024**2
+NPT_RAD_RESHAPE = 1000
+NPT_AZIM_RESHAPE = 360
+UNIT_RESHAPE = 'q_nm^-1'
+# The CSR engine is kept by pyFAI and reused while the geometry and the parameters do not change
+METHOD_RESHAPE = ('bbox', 'csr', 'cython')
 
 ERROR_RAW_INTEGRATION = "Failed at detect integration type."
 
@@ -59,12 +72,21 @@ class GIIntegrator(Transform):
         Transform -- inherits the methods from Transform class (pygix)
     """    
 
-    def __init__(self) -> None:
+    def __init__(self, use_lut=True, use_result_cache=True, angle_tolerance=DEFAULT_ANGLE_TOLERANCE) -> None:
         super().__init__()
+        self.angle_tolerance = angle_tolerance
+        self._geometry_pool = get_geometry_pool()
         self.init_transform()
         self.init_ai()
         self.active_ponifile=''
         self._poni = None
+        self.use_lut = use_lut
+        self._lut_cache = LRUCache(maxsize=LUT_CACHE_SIZE)
+        self._fused_cache = LRUCache(maxsize=FUSED_CACHE_SIZE)
+        self.use_result_cache = use_result_cache
+        self._result_cache = ByteLRUCache(maxbytes=RESULT_CACHE_BYTES)
+        self._reshape_cache = ByteLRUCache(maxbytes=RESHAPE_CACHE_BYTES)
+        self._mesh_cache = get_mesh_cache()
 
     @logger_info
     def init_transform(self):
@@ -78,6 +100,7 @@ class GIIntegrator(Transform):
     def update_incident_angle(self, incident_angle=0.0):
         """
         Updates the parameter incident_angle in GrazingGeometry instance
+        The angle is rounded to angle_tolerance and the arrays of the geometry are taken from the pool if they were already calculated
 
         Keyword Arguments:
             incident_angle -- pitch angle, projection of the beam into the surface-sample (default: {0.0})
@@ -88,16 +111,23 @@ class GIIntegrator(Transform):
             except Exception as e:
                 logger.error(f'{e}: {incident_angle} is not a valid incident angle. Set up as 0.0')
                 incident_angle = 0.0
-        
+
+        incident_angle = quantize_angle(angle=incident_angle, tolerance=self.angle_tolerance)
+        if incident_angle == self._incident_angle:
+            return
+
+        self._geometry_pool.save(geometry=self)
         self.set_incident_angle(
             incident_angle=incident_angle,
         )
+        self._geometry_pool.restore(geometry=self)
         logger.info(f'Incident angle set up as {incident_angle}.')
 
     @logger_info
     def update_tilt_angle(self, tilt_angle=0.0):
         """
         Updates the parameter tilt_angle in GrazingGeometry instance
+        The angle is rounded to angle_tolerance and the arrays of the geometry are taken from the pool if they were already calculated
 
         Keyword Arguments:
             tilt_angle -- roll angle of the sample surface (default: {0.0})
@@ -108,10 +138,16 @@ class GIIntegrator(Transform):
             except Exception as e:
                 logger.error(f'{e}: {tilt_angle} is not a valid tilt angle. Set up as 0.0')
                 tilt_angle = 0.0
-        
+
+        tilt_angle = quantize_angle(angle=tilt_angle, tolerance=self.angle_tolerance)
+        if tilt_angle == self._tilt_angle:
+            return
+
+        self._geometry_pool.save(geometry=self)
         self.set_tilt_angle(
             tilt_angle=tilt_angle,
         )
+        self._geometry_pool.restore(geometry=self)
         logger.info(f'Tilt angle set up as {tilt_angle}.')
 
     @logger_info
@@ -204,7 +240,7 @@ class GIIntegrator(Transform):
     #####################################
 
     @logger_info
-    def generate_integration(self, data=None, norm_factor=1.0, list_dict_integration=list()) -> list:
+    def generate_integration(self, data=None, norm_factor=1.0, list_dict_integration=list(), fused=True) -> list:
         """
         Yields an integration: azimuthal (pyFAI), radial (pyFAI) or box (pygix)
 
@@ -212,10 +248,19 @@ class GIIntegrator(Transform):
             data -- 2D array to be integrated (default: {None})
             norm_factor -- normalization factor to be used during integration (default: {1.0})
             list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+            fused -- if True, all the integrations are performed in a single pass over the frame (default: {True})
 
         Yields:
             numpy array with the results of the integration
         """        
+        if fused and self.use_lut and (data is not None) and (len(list_dict_integration) > 1):
+            for res in self.fused_integration(
+                data=data,
+                norm_factor=norm_factor,
+                list_dict_integration=list_dict_integration,
+            ):
+                yield res
+            return
 
         for dict_integration in list_dict_integration:
             res = self.raw_integration(
@@ -225,14 +270,156 @@ class GIIntegrator(Transform):
             )
             yield res
 
+    @logger_info
+    def fused_integration(self, data=None, norm_factor=1.0, list_dict_integration=list()) -> list:
+        """
+        Performs several integrations of the same frame in a single pass:
+        the sparse matrices (pixel coordinates and polarization already included) are stacked and
+        the frame is converted and multiplied only once. Results already in cache are not recomputed.
+
+        Keyword Arguments:
+            data -- 2D array to be integrated (default: {None})
+            norm_factor -- normalization factor to be used during integration (default: {1.0})
+            list_dict_integration -- list of dictionaries with integration instructions (default: {list()})
+
+        Returns:
+            list with the results of the integrations, same order as the dictionaries
+        """
+        list_results = [None] * len(list_dict_integration)
+        list_keys = [None] * len(list_dict_integration)
+
+        digest = array_digest(data) if self.use_result_cache else ''
+        list_pending, list_lut_keys, list_luts = [], [], []
+        for ind, dict_integration in enumerate(list_dict_integration):
+            if self.use_result_cache:
+                list_keys[ind] = self.get_result_key(
+                    norm_factor=norm_factor,
+                    dict_integration=dict_integration,
+                    digest=digest,
+                )
+                res = self._result_cache.get(list_keys[ind])
+                if res is not None:
+                    list_results[ind] = res.copy()
+                    continue
+
+            parameters = self.get_integration_parameters(dict_integration=dict_integration)
+            try:
+                lut_key = self._get_lut_key(shape=data.shape, polarization_factor=POLARIZATION_FACTOR, **parameters)
+                lut = self.get_lut(shape=data.shape, polarization_factor=POLARIZATION_FACTOR, **parameters)
+            except Exception as e:
+                # Invalid dictionaries go through the single integration, which reports the error
+                logger.error(f'{e}: {dict_integration} could not be fused.')
+                list_results[ind] = self.raw_integration(
+                    data=data,
+                    norm_factor=norm_factor,
+                    dict_integration=dict_integration,
+                )
+                continue
+            list_pending.append(ind)
+            list_lut_keys.append(lut_key)
+            list_luts.append(lut)
+
+        if not list_pending:
+            return list_results
+
+        fused_key = tuple(list_lut_keys)
+        fused = self._fused_cache.get(fused_key)
+        if fused is None:
+            fused = stack_luts(list_lut=list_luts)
+            self._fused_cache.set(fused_key, fused)
+
+        list_intensities = integrate_fused(
+            fused=fused,
+            data=data,
+            normalization_factor=float(norm_factor),
+        )
+
+        for ind, lut, y_vector in zip(list_pending, list_luts, list_intensities):
+            dict_integration = list_dict_integration[ind]
+            x_vector = self._transform_axis(
+                x_vector=lut.x.copy(),
+                dict_integration=dict_integration,
+            )
+            res = np.array([x_vector, y_vector])
+            if self.use_result_cache:
+                self._result_cache.set(list_keys[ind], res.copy())
+            list_results[ind] = res
+
+        logger.info(f'{len(list_pending)} integrations performed in a single pass.')
+        return list_results
 
-    def custom_key(self, arr, s, f):
-        arr_hash = hashkey(arr.tobytes()) if isinstance(arr, np.ndarray) else arr
-        return hashkey(arr_hash, s, f)
+    def get_result_key(self, data=None, norm_factor=1.0, dict_integration=dict(), digest='') -> tuple:
+        """
+        Returns the key of an integration result: digest of the frame, norm. factor, dictionary, geometry and mask
+
+        Keyword Arguments:
+            data -- 2D array to be integrated (default: {None})
+            norm_factor -- normalization factor to be used during integration (default: {1.0})
+            dict_integration -- dictionary with integration instructions (default: {dict()})
+            digest -- digest of the frame, if already calculated (default: {''})
+
+        Returns:
+            hashable tuple
+        """
+        try:
+            norm_factor = float(norm_factor)
+        except Exception:
+            pass
+        return (
+            digest or array_digest(data),
+            norm_factor,
+            freeze(dict_integration),
+            self.get_geometry_key(),
+            self.get_mask_key(),
+            self.use_lut,
+        )
 
     @logger_info
-    # @cached(cache=LRUCache(maxsize=10), key=self.custom_key)
     def raw_integration(self, data=None, norm_factor=1.0, dict_integration=dict()) -> np.array:
+        """
+        Performs an integration and keeps the result in a cache bounded by bytes.
+        The same frame with the same dictionary and geometry is not integrated twice.
+
+        Keyword Arguments:
+            data -- 2D array to be integrated (default: {None})
+            norm_factor -- normalization factor to be used during integration (default: {1.0})
+            dict_integration -- dictionary with integration instructions (default: {dict()})
+
+        Returns:
+            numpy array with the results of the integration
+        """
+        if (not self.use_result_cache) or (data is None) or (not dict_integration):
+            return self._raw_integration(
+                data=data,
+                norm_factor=norm_factor,
+                dict_integration=dict_integration,
+            )
+
+        try:
+            key = self.get_result_key(
+                data=data,
+                norm_factor=norm_factor,
+                dict_integration=dict_integration,
+            )
+        except Exception as e:
+            logger.error(f'{e}: the integration could not be cached.')
+            key = None
+
+        res = self._result_cache.get(key) if key is not None else None
+        if res is not None:
+            logger.info('Integration retrieved from cache.')
+            return res.copy()
+
+        res = self._raw_integration(
+            data=data,
+            norm_factor=norm_factor,
+            dict_integration=dict_integration,
+        )
+        if (res is not None) and (key is not None):
+            self._result_cache.set(key, res.copy())
+        return res
+
+    def _raw_integration(self, data=None, norm_factor=1.0, dict_integration=dict()) -> np.array:
 
         if dict_integration[KEY_INTEGRATION] == CAKE_LABEL:
 
@@ -291,34 +478,16 @@ class GIIntegrator(Transform):
         if not is_cake_dictionary(dict_integration=dict_integration):
             logger.error(f'{dict_integration} is not a valid dict for cake integration.')
             return
-        
-        p0_range=dict_integration[CAKE_KEY_RRANGE]
-        p1_range=dict_integration[CAKE_KEY_ARANGE]
-        unit=dict_integration[CAKE_KEY_UNIT]
-        npt = dict_integration[CAKE_KEY_ABINS]
 
-        if npt == 0:
-            try:
-                npt=self.calculate_bins(
-                    radial_range=p0_range,
-                    unit=unit,
-                )
-            except Exception as e:
-                logger.error(f'{e} Error during calculating bins. p0_range:{p0_range}, unit: {unit}')
-                npt = 1000
-                logger.info(f'npt set to 1000')
+        parameters = self._parameters_azimuthal(dict_integration=dict_integration)
 
         try:
-            logger.info(f"Trying azimuthal integration with: data-shape={data.shape} bins={npt}, p0_range={p0_range}, p1_range={p1_range}, unit={unit}")
-            y_vector, x_vector = self.integrate_1d(
-                process='sector',
+            logger.info(f"Trying azimuthal integration with: data-shape={data.shape} {parameters}")
+            y_vector, x_vector = self.integrate_1d_lut(
                 data=data,
-                npt=npt,
-                p0_range=p0_range,
-                p1_range=p1_range,
-                unit=UNIT_GI[unit],
                 normalization_factor=float(norm_factor),
                 polarization_factor=POLARIZATION_FACTOR,
+                **parameters,
             )
             logger.info("Azimuthal integration performed.")
         except Exception as e:
@@ -354,22 +523,15 @@ class GIIntegrator(Transform):
             return
 
         # Do the integration with pygix/pyFAI
-        npt  = int(dict_integration[CAKE_KEY_ABINS])
-        p0_range = dict_integration[CAKE_KEY_RRANGE]
-        p1_range = dict_integration[CAKE_KEY_ARANGE]
-        unit = UNIT_GI[dict_integration[CAKE_KEY_UNIT]]
+        parameters = self._parameters_radial(dict_integration=dict_integration)
         
         try:
-            logger.info(f"Trying radial integration with: npt={npt}, p0_range={p0_range}, p1_range={p1_range}, unit={unit}")
-            y_vector, x_vector = self.integrate_1d(
-                process='chi',
+            logger.info(f"Trying radial integration with: {parameters}")
+            y_vector, x_vector = self.integrate_1d_lut(
                 data=data,
-                npt=npt,
-                p0_range=p1_range,
-                p1_range=p0_range,
-                unit=unit,
                 normalization_factor=float(norm_factor),
                 polarization_factor=POLARIZATION_FACTOR,
+                **parameters,
             )
             logger.info("Radial integration performed.")
         except:
@@ -404,6 +566,93 @@ class GIIntegrator(Transform):
             logger.error(f'{dict_integration} is not a valid dict for box integration.')
             return
 
+        parameters = self._parameters_box(dict_integration=dict_integration)
+        if parameters is None:
+            return
+
+        # Do the integration with pygix/pyFAI
+        try:
+            logger.info(f"Trying box integration with: {parameters}")
+            y_vector, x_vector = self.integrate_1d_lut(
+                data=data,
+                normalization_factor=float(norm_factor),
+                polarization_factor=POLARIZATION_FACTOR,
+                **parameters,
+            )
+            x_vector = self._transform_axis(
+                x_vector=x_vector,
+                dict_integration=dict_integration,
+            )
+
+            logger.info("Integration performed.")
+        except:
+            logger.info("Error during box integration.")
+            return
+
+        return np.array([x_vector, y_vector])
+
+    @logger_info
+    def get_integration_parameters(self, dict_integration=dict()) -> dict:
+        """
+        Returns the parameters of integrate_1d_lut (process, npt, p0_range, p1_range, unit) for an integration dictionary
+
+        Keyword Arguments:
+            dict_integration -- dictionary with integration instructions (default: {dict()})
+
+        Returns:
+            dictionary with the parameters, None if the dictionary is not valid
+        """
+        if not dict_integration:
+            return
+
+        if dict_integration.get(KEY_INTEGRATION) == CAKE_LABEL:
+            if not is_cake_dictionary(dict_integration=dict_integration):
+                return
+            if dict_integration[CAKE_KEY_TYPE] == CAKE_KEY_TYPE_AZIM:
+                return self._parameters_azimuthal(dict_integration=dict_integration)
+            elif dict_integration[CAKE_KEY_TYPE] == CAKE_KEY_TYPE_RADIAL:
+                return self._parameters_radial(dict_integration=dict_integration)
+        elif dict_integration.get(KEY_INTEGRATION) == BOX_LABEL:
+            if not is_box_dictionary(dict_integration=dict_integration):
+                return
+            return self._parameters_box(dict_integration=dict_integration)
+
+    def _parameters_azimuthal(self, dict_integration=dict()) -> dict:
+        p0_range=dict_integration[CAKE_KEY_RRANGE]
+        p1_range=dict_integration[CAKE_KEY_ARANGE]
+        unit=dict_integration[CAKE_KEY_UNIT]
+        npt = dict_integration[CAKE_KEY_ABINS]
+
+        if npt == 0:
+            try:
+                npt=self.calculate_bins(
+                    radial_range=p0_range,
+                    unit=unit,
+                )
+            except Exception as e:
+                logger.error(f'{e} Error during calculating bins. p0_range:{p0_range}, unit: {unit}')
+                npt = 1000
+                logger.info(f'npt set to 1000')
+
+        return {
+            'process' : 'sector',
+            'npt' : npt,
+            'p0_range' : p0_range,
+            'p1_range' : p1_range,
+            'unit' : UNIT_GI[unit],
+        }
+
+    def _parameters_radial(self, dict_integration=dict()) -> dict:
+        # The output axis of pygix 'chi' process is the azimuthal one
+        return {
+            'process' : 'chi',
+            'npt' : int(dict_integration[CAKE_KEY_ABINS]),
+            'p0_range' : dict_integration[CAKE_KEY_ARANGE],
+            'p1_range' : dict_integration[CAKE_KEY_RRANGE],
+            'unit' : UNIT_GI[dict_integration[CAKE_KEY_UNIT]],
+        }
+
+    def _parameters_box(self, dict_integration=dict()) -> dict:
         # Get the direction of the box
         process = DICT_BOX_ORIENTATION[dict_integration[BOX_KEY_DIRECTION]]
         unit=dict_integration[BOX_KEY_INPUT_UNIT]
@@ -433,46 +682,211 @@ class GIIntegrator(Transform):
         else:
             return
 
-        # Transform input units if necessary
-        p0_range = [self.get_q_nm(
-            value=position,
+        # Transform input units if necessary, both ranges at once
+        ranges = self.get_q_nm(
+            value=np.array([p0_range, p1_range], dtype=np.float64),
             input_unit=unit,
             direction=dict_integration[BOX_KEY_DIRECTION],
-        ) for position in p0_range]
+        )
+        if ranges is None:
+            return
+        p0_range, p1_range = np.asarray(ranges).tolist()
 
-        p1_range = [self.get_q_nm(
-            value=position,
-            input_unit=unit,
+        return {
+            'process' : process,
+            'npt' : npt,
+            'p0_range' : p0_range,
+            'p1_range' : p1_range,
+            'unit' : UNIT_GI[unit],
+        }
+
+    def _transform_axis(self, x_vector=None, dict_integration=dict()) -> np.array:
+        """
+        Transforms the output axis of a box integration into the output unit of the dictionary
+        """
+        if dict_integration.get(KEY_INTEGRATION) != BOX_LABEL:
+            return x_vector
+
+        return self.transform_q_units(
+            x_vector=x_vector,
+            input_unit=dict_integration[BOX_KEY_INPUT_UNIT],
+            output_unit=dict_integration[BOX_KEY_OUTPUT_UNIT],
             direction=dict_integration[BOX_KEY_DIRECTION],
-        ) for position in p1_range]
+        )
 
-        # Do the integration with pygix/pyFAI
-        try:
-            logger.info(f"Trying box integration with: process={process}, npt={npt}, p0_range={p0_range}, p1_range={p1_range}, unit={unit}")
-            y_vector, x_vector = self.integrate_1d(
-                process=process,
-                data=data,
-                npt=npt,
-                p0_range=p0_range,
-                p1_range=p1_range,
-                unit=UNIT_GI[unit],
-                normalization_factor=float(norm_factor),
-                polarization_factor=POLARIZATION_FACTOR,
-                # method='bbox',
-            )
-            x_vector = self.transform_q_units(
-                x_vector=x_vector,
-                input_unit=dict_integration[BOX_KEY_INPUT_UNIT],
-                output_unit=dict_integration[BOX_KEY_OUTPUT_UNIT],
-                direction=dict_integration[BOX_KEY_DIRECTION],
-            )
+    @logger_info
+    def get_geometry_key(self) -> tuple:
+        """
+        Returns a hashable key with the parameters that define the geometry: .poni, angles and sample orientation
 
-            logger.info("Integration performed.")
-        except:
-            logger.info("Error during box integration.")
-            return
+        Returns:
+            tuple with the geometry parameters
+        """
+        return geometry_key(geometry=self)
 
-        return np.array([x_vector, y_vector])
+    def get_mask_key(self) -> str:
+        """
+        Returns the digest of the mask of the detector, '' if there is no mask.
+        The content is hashed in every call, so a mask changed in place also changes the key
+
+        Returns:
+            str with the digest of the mask
+        """
+        mask = self.mask
+        if mask is None:
+            return ''
+        return array_digest(mask)
+
+    def _get_lut_key(
+        self,
+        process='sector',
+        shape=(),
+        npt=100,
+        p0_range=(),
+        p1_range=(),
+        unit=Q_NM,
+        polarization_factor=POLARIZATION_FACTOR,
+        ) -> tuple:
+        return (
+            self.get_geometry_key(),
+            self.get_mask_key(),
+            tuple(shape),
+            process,
+            int(npt),
+            freeze(p0_range),
+            freeze(p1_range),
+            grazing_units.to_unit(unit).REPR,
+            polarization_factor,
+        )
+
+    @logger_info
+    def get_lut(
+        self,
+        process='sector',
+        shape=(),
+        npt=100,
+        p0_range=(),
+        p1_range=(),
+        unit=Q_NM,
+        polarization_factor=POLARIZATION_FACTOR,
+        ):
+        """
+        Returns the sparse pixel-to-bin matrix of an integration, built once per geometry and stored in cache
+
+        Keyword Arguments:
+            process -- 'sector', 'chi', 'opbox' or 'ipbox' (pygix) (default: {'sector'})
+            shape -- shape of the data (default: {()})
+            npt -- number of bins (default: {100})
+            p0_range -- range of the output axis, in the units of the output axis (default: {()})
+            p1_range -- range of the integrated axis (default: {()})
+            unit -- pygix unit (default: {Q_NM})
+            polarization_factor -- polarization factor, None for no correction (default: {POLARIZATION_FACTOR})
+
+        Returns:
+            IntegrationLUT instance
+        """
+        unit = grazing_units.to_unit(unit)
+        key = self._get_lut_key(
+            process=process,
+            shape=shape,
+            npt=npt,
+            p0_range=p0_range,
+            p1_range=p1_range,
+            unit=unit,
+            polarization_factor=polarization_factor,
+        )
+
+        lut = self._lut_cache.get(key)
+        if lut is not None:
+            return lut
+
+        # Same unit conversion of the ranges as pygix.Transform.integrate_1d
+        scale = unit.scale
+        if process == 'chi':
+            p0_range = tuple(np.deg2rad(i) + np.pi for i in p0_range)
+        else:
+            p0_range = tuple(i / scale for i in p0_range)
+        if process == 'sector':
+            p1_range = tuple(np.deg2rad(i) + np.pi for i in p1_range)
+        else:
+            p1_range = tuple(i / scale for i in p1_range)
+
+        pos1, pos0 = self.giarray_from_unit(shape, process, "center", unit)
+        delta_pos1, delta_pos0 = self.giarray_from_unit(shape, process, "delta", unit)
+        polarization = None if polarization_factor is None else self.polarization(shape, float(polarization_factor))
+
+        lut = build_lut(
+            pos0=pos0,
+            delta_pos0=delta_pos0,
+            pos1=pos1,
+            delta_pos1=delta_pos1,
+            bins=npt,
+            pos0_range=p0_range,
+            pos1_range=p1_range,
+            mask=self.mask,
+            polarization=polarization,
+        )
+
+        # Bin centers in the output units
+        if process == 'chi':
+            x = np.rad2deg(lut.x - np.pi)
+        else:
+            x = lut.x * scale
+        lut = lut._replace(x=x)
+
+        self._lut_cache.set(key, lut)
+        logger.info(f'New LUT stored in cache: process={process}, npt={npt}, shape={shape}')
+        return lut
+
+    @logger_info
+    def integrate_1d_lut(
+        self,
+        process='sector',
+        data=None,
+        npt=100,
+        p0_range=None,
+        p1_range=None,
+        unit=Q_NM,
+        normalization_factor=1.0,
+        polarization_factor=POLARIZATION_FACTOR,
+        ):
+        """
+        Same as pygix integrate_1d (method 'bbox'), but with a cached sparse matrix per geometry.
+        Falls back on pygix if use_lut is False, if there are no ranges or if the matrix could not be built.
+
+        Returns:
+            intensity and bin centers (same order as pygix)
+        """
+        if self.use_lut and p0_range and p1_range:
+            try:
+                lut = self.get_lut(
+                    process=process,
+                    shape=data.shape,
+                    npt=npt,
+                    p0_range=p0_range,
+                    p1_range=p1_range,
+                    unit=unit,
+                    polarization_factor=polarization_factor,
+                )
+                y_vector = integrate_lut(
+                    lut=lut,
+                    data=data,
+                    normalization_factor=normalization_factor,
+                )
+                return y_vector, lut.x.copy()
+            except Exception as e:
+                logger.error(f'{e}: LUT integration failed. Back to pygix integration.')
+
+        return self.integrate_1d(
+            process=process,
+            data=data,
+            npt=npt,
+            p0_range=p0_range,
+            p1_range=p1_range,
+            unit=unit,
+            normalization_factor=normalization_factor,
+            polarization_factor=polarization_factor,
+        )
 
     #####################################
     ###### UNIT-TRANSFORMATION METHODS ##
@@ -514,36 +928,40 @@ class GIIntegrator(Transform):
 
         return int(round(self._dist / self.get_pixel1() * (np.tan(twotheta2) - np.tan(twotheta1))))
 
+    @logger_info
+    def get_unit_converter(self) -> UnitConverter:
+        """
+        Returns the UnitConverter with the coefficients of the current wavelength and incident angle
+
+        Returns:
+            UnitConverter instance, None if there is no wavelength
+        """
+        try:
+            return get_unit_converter(
+                wavelength=float(self._wavelength),
+                incident_angle=float(self._incident_angle or 0.0),
+            )
+        except Exception as e:
+            logger.error(f'{e} There is no wavelength to transform the units.')
+            return
+
     @logger_info
     def q_to_twotheta(self, q=0.0, unit='q_nm^-1', degree=False) -> float:
         """
         Transforms q into 2theta
 
         Keyword Arguments:
-            q -- modulus of q, scattering vector (default: {0.0})
+            q -- modulus of q, scattering vector, value or array (default: {0.0})
             unit -- 'q_nm^-1' or 'q_A^-1' (default: {'q_nm^-1'})
             degree -- the result will be in degrees (True) or radians (False) (default: {False})
 
         Returns:
             twotheta value
         """
-        try:
-            wavelength = self._wavelength
-        except Exception as e:
-            logger.error(f'{e} There is no wavelength to transform q into 2theta')
-            return
-
-        if unit in QNM_ALIAS:
-            twotheta = 2 * np.arcsin((q * wavelength * 1e9) / (4 * np.pi))
-        elif unit in QA_ALIAS:
-            twotheta = 2 * np.arcsin((q * wavelength * 1e10) / (4 * np.pi))
-        else:
+        converter = self.get_unit_converter()
+        if converter is None:
             return
-
-        if degree:
-            twotheta = np.rad2deg(twotheta)
-
-        return twotheta
+        return converter.q_to_twotheta(q=q, unit=unit, degree=degree)
 
     @logger_info
     def twotheta_to_q(self, twotheta=0.0, degree_input=True, direction='vertical', output_unit='q_nm^-1',) -> float:
@@ -551,60 +969,35 @@ class GIIntegrator(Transform):
         Transforms 2theta into q
 
         Keyword Arguments:
-            twotheta -- exit angle (default: {0.0})
+            twotheta -- exit angle, value or array (default: {0.0})
             degree_input -- if True, the input twotheta is degrees, if not, radians (default: {True})
             direction -- if vertical, q is taken as qz, if horizontal, is taken as qxy (default: {'vertical'})
             output_unit -- 'q_nm^-1' or 'q_A^-1' (default: {'q_nm^-1'})
 
         Returns:
             modulus of q, scattering vector
-        """        
-        try:
-            wavelength = self._wavelength
-            wavelength_nm = wavelength * 1e9
-        except Exception as e:
-            logger.error(f'{e} There is no wavelength to transform 2theta into q.')
-            return
-
-        if degree_input:
-            twotheta = np.radians(twotheta)
-        
-        try:
-            alpha_inc = np.radians(self._incident_angle)
-        except:
-            alpha_inc = 0.0
-        
-        q_horz = 2 * np.pi / wavelength_nm * (np.cos(alpha_inc) * np.sin(twotheta))
-        q_vert = 2 * np.pi / wavelength_nm * (np.sin(twotheta) + np.sin(alpha_inc))
-
-        if output_unit in QNM_ALIAS:
-            pass
-        elif output_unit in QA_ALIAS:
-            q_horz /= 10
-            q_vert /= 10
-
-        if direction == BOX_KEY_TYPE_VERT:
-            return q_horz
-        elif direction == BOX_KEY_TYPE_HORZ:
-            return q_vert
-        else:
+        """
+        converter = self.get_unit_converter()
+        if converter is None:
             return
+        return converter.twotheta_to_q(
+            twotheta=twotheta,
+            degree_input=degree_input,
+            direction=direction,
+            output_unit=output_unit,
+        )
 
     @logger_info
     def get_q_nm(self, value=0.0, direction='vertical', input_unit='q_nm^-1') -> float:
         """
-            Return a q(nm-1) value from another unit
+            Return a q(nm-1) value (or array) from another unit
         """
-        if input_unit in QNM_ALIAS:
-            return value
-        elif input_unit in Q_ALIAS:
+        if is_q_unit(input_unit):
             return value
-        elif input_unit in DEG_ALIAS:
-            return self.twotheta_to_q(twotheta=value, direction=direction, degree_input=True)
-        elif input_unit in RAD_ALIAS:
-            return self.twotheta_to_q(twotheta=value, degree_input=False)
-        else:
-            return None
+        converter = self.get_unit_converter()
+        if converter is None:
+            return
+        return converter.get_q_nm(value=value, direction=direction, input_unit=input_unit)
 
     @logger_info
     def transform_q_units(
@@ -614,62 +1007,63 @@ class GIIntegrator(Transform):
         output_unit=None, 
         direction='vertical',
         ):
+        """
+        Transforms a value or an array between q and 2theta units
 
+        Keyword Arguments:
+            x_vector -- value or array (default: {None})
+            input_unit -- 'q_nm^-1', 'q_A^-1', '2th_deg' or '2th_rad' (default: {None})
+            output_unit -- 'q_nm^-1', 'q_A^-1', '2th_deg' or '2th_rad' (default: {None})
+            direction -- 'vertical' or 'horizontal', used from 2theta into q (default: {'vertical'})
+
+        Returns:
+            transformed array
+        """
         if x_vector is None:
             return
 
         if input_unit == output_unit:
             return x_vector
-        
-        # From Q
-        if input_unit in UNITS_Q:
-            if output_unit in UNITS_Q:
-                if output_unit in QNM_ALIAS:
-                    x_vector *= 10
-                elif output_unit in QA_ALIAS:
-                    x_vector /= 10
-                return x_vector
-
-            elif output_unit in UNITS_THETA:
-                if output_unit in DEG_ALIAS:
-                    x_vector = self.q_to_twotheta(
-                        q=x_vector,
-                        unit=input_unit,
-                        degree=True,
-                    )
-                    return x_vector
-                elif output_unit in RAD_ALIAS:
-                    x_vector = self.q_to_twotheta(
-                        q=x_vector,
-                        unit=input_unit,
-                        degree=False,
-                    )
-                    return x_vector
-        # From TTH
-        elif input_unit in UNITS_THETA:
-            if output_unit in UNITS_THETA:
-                if output_unit in DEG_ALIAS:
-                    return x_vector*180/np.pi
-                elif output_unit in RAD_ALIAS:
-                    return x_vector*np.pi/180
-            elif output_unit in UNITS_Q:
-                if input_unit in DEG_ALIAS:
-                    vector_nm = self.twotheta_to_q(
-                        twotheta=x_vector,
-                        direction=direction,
-                        degree_input=True,
-                    )
-                elif input_unit in RAD_ALIAS:
-                    vector_nm = self.twotheta_to_q(
-                        twotheta=x_vector,
-                        direction=direction,
-                        degree_input=False,
-                    )
-
-                if output_unit in QNM_ALIAS:
-                    return vector_nm
-                elif output_unit in QA_ALIAS:
-                    return vector_nm/10
+
+        converter = self.get_unit_converter()
+        if converter is None:
+            return
+        return converter.convert(
+            x_vector=x_vector,
+            input_unit=input_unit,
+            output_unit=output_unit,
+            direction=direction,
+        )
+
+    @logger_info
+    def transform_q_units_batch(
+        self,
+        list_vectors=list(),
+        input_unit=None,
+        output_unit=None,
+        direction='vertical',
+        ) -> list:
+        """
+        Transforms a list of arrays (x-axis of many 1D results) with only one conversion
+
+        Keyword Arguments:
+            list_vectors -- list of values or arrays (default: {list()})
+            input_unit -- 'q_nm^-1', 'q_A^-1', '2th_deg' or '2th_rad' (default: {None})
+            output_unit -- 'q_nm^-1', 'q_A^-1', '2th_deg' or '2th_rad' (default: {None})
+            direction -- 'vertical' or 'horizontal', used from 2theta into q (default: {'vertical'})
+
+        Returns:
+            list of transformed arrays
+        """
+        converter = self.get_unit_converter()
+        if converter is None:
+            return
+        return converter.convert_batch(
+            list_vectors=list_vectors,
+            input_unit=input_unit,
+            output_unit=output_unit,
+            direction=direction,
+        )
 
     #####################################
     ###### DETECTOR-ARRAY TRANSFORMATION METHODS ##
@@ -719,6 +1113,13 @@ class GIIntegrator(Transform):
             logger.info(f"Shape is None. Returns.")
             return
 
+        # Meshes are kept in memory and on disk for the same geometry
+        key = ('mesh', self.get_geometry_key(), tuple(shape), unit)
+        mesh = self._mesh_cache.get(key)
+        if mesh is not None:
+            logger.info(f"Mesh matrix retrieved from cache.")
+            return mesh
+
         # Get the detector array, it is always the same shape (RAW MATRIX SHAPE!), no rotations yet
         # shape = data.shape
         det_array = self.get_detector_array(shape=shape)
@@ -758,32 +1159,67 @@ class GIIntegrator(Transform):
             logger.info(f"Changing the scale of the matriz q units. Scale: {DICT_PLOT['SCALE']}")
         else:
             return
+        scat_xy, scat_z = self._mesh_cache.set(key, (scat_xy, scat_z))
         return scat_xy, scat_z
 
     @logger_info
-    def map_reshaping(self, data=None):
+    def map_reshaping(
+        self,
+        data=None,
+        npt_rad=NPT_RAD_RESHAPE,
+        npt_azim=NPT_AZIM_RESHAPE,
+        unit=UNIT_RESHAPE,
+        method=METHOD_RESHAPE,
+        ):
 
         """
         Generates the reshaped map according to .poni parameters
+        The results are cached by the content of the frame and the parameters
 
         Keyword Arguments:
             data -- 2D matrix to be reshaped (default: {None})
+            npt_rad -- number of radial bins (default: {NPT_RAD_RESHAPE})
+            npt_azim -- number of azimuthal bins (default: {NPT_AZIM_RESHAPE})
+            unit -- radial unit, pyFAI style (default: {UNIT_RESHAPE})
+            method -- pyFAI integration method (default: {METHOD_RESHAPE})
 
         Returns:
             data_reshape -- 2D matrix with transformed coordinates (polar-q)
             q -- Azimuthal grid
             chi -- Polar grid
-        """        
+        """
         try:
-            data_reshape, q, chi = self._ai.integrate2d(
-                data=data,
-                npt_rad=1000,
-                unit="q_nm^-1",
+            reshape_key = (
+                array_digest(data),
+                int(npt_rad),
+                int(npt_azim),
+                str(unit),
+                freeze(method),
+                poni_key(geometry=self._ai),
             )
         except Exception as e:
             logger.error(f'{e}: Reshaped_map could not retrieved.')
-            data_reshape, q, chi = None, None, None
-
-        return data_reshape, q, chi
+            return None, None, None
 
+        result = self._reshape_cache.get(reshape_key)
+        if result is not None:
+            return result
 
+        try:
+            data_reshape, q, chi = self._ai.integrate2d(
+                data=data,
+                npt_rad=npt_rad,
+                npt_azim=npt_azim,
+                unit=unit,
+                method=method,
+            )
+        except Exception as e:
+            logger.error(f'{e}: Reshaped_map could not retrieved.')
+            return None, None, None
+
+        # Shared by all the calls with the same frame, read-only
+        result = tuple(np.asarray(arr) for arr in (data_reshape, q, chi))
+        for arr in result:
+            arr.flags.writeable = False
+        self._reshape_cache.set(reshape_key, result)
+        return result
@@ -0,0 +1,61 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from pyxscat.batch import get_batch_tasks
+
+from pyxscat.logger_config import setup_logger
+logger = setup_logger()
+
+
+class BatchWorker(QObject):
+    """
+    Runs a BatchIntegrator out of the GUI thread (moved into a QThread).
+    Every result is saved as soon as it arrives and then dropped, only the progress is sent to the GUI.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, int)
+    error = pyqtSignal(str)
+
+    def __init__(self, batch=None, source=None, entry_name='', folder_output='') -> None:
+        """
+        Keyword Arguments:
+            batch -- BatchIntegrator instance (default: {None})
+            source -- H5GIIntegrator or MetadataBase instance (default: {None})
+            entry_name -- name of the entry/sample (default: {''})
+            folder_output -- directory where the .csv files are saved (default: {''})
+        """
+        super().__init__()
+        self._batch = batch
+        self._source = source
+        self._entry_name = entry_name
+        self._folder_output = folder_output
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Stops the batch after the current frame, the worker processes are terminated
+        """
+        self._cancelled = True
+
+    def run(self) -> None:
+        nframes, ntasks = 0, 0
+        try:
+            list_tasks = get_batch_tasks(
+                source=self._source,
+                entry_name=self._entry_name,
+            )
+            ntasks = len(list_tasks)
+            for index, (task, list_results) in enumerate(
+                self._batch.generate_batch_files(list_tasks=list_tasks, folder_output=self._folder_output),
+                start=1,
+                ):
+                if list_results is not None:
+                    nframes += 1
+                self.progress.emit(index, ntasks)
+                if self._cancelled:
+                    logger.info(f'Batch integration cancelled after {index}/{ntasks} frames.')
+                    break
+        except Exception as e:
+            self.error.emit(f"{e}: the batch integration could not be performed.")
+        finally:
+            self.finished.emit(nframes, ntasks)
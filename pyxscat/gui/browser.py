@@ -12,6 +12,7 @@ from pyxscat.gui import combobox_methods as cb
 from pyxscat.gui import table_methods as tm
 from pyxscat.observer import RootDirObserver
 from pyxscat.gui.data_handler import DataHandler
+from pyxscat.other.frame_methods import FramePrefetcher
 
 from watchdog.observers import Observer
 from watchdog.events import LoggingEventHandler, FileSystemEventHandler
@@ -55,6 +56,7 @@ class Browser(BrowserLayout):
     def __init__(self):
         super(Browser, self).__init__()
         self.data_handler = DataHandler(pattern=self.get_pattern(), parent=self)
+        self.prefetcher = FramePrefetcher()
         self._init_attributes()
         self._init_callbacks()
         self.update_integration_cb()
@@ -563,7 +565,21 @@ class Browser(BrowserLayout):
         
     @log_info
     def _slot_active_index_changed(self):
-        self.active_index = tm.selected_rows(self.table_files)
+        index = tm.selected_rows(self.table_files)
+        self._prefetch_frames(index=index)
+        self.active_index = index
+
+    def _prefetch_frames(self, index:list):
+        # Read the frames around the selected ones in background threads
+        if not self.meta or not self._active_entry or not index:
+            return
+        try:
+            self.prefetcher.prefetch(
+                list_filenames=self.meta.get_files_in_entry(entry_name=self._active_entry),
+                index=index,
+            )
+        except Exception as e:
+            logger.info(f"{e}: frames could not be prefetched.")
         
 
         
@@ -649,6 +665,7 @@ class Browser(BrowserLayout):
                     pattern=pattern,
                     update_metadata=True,
                     json_file="",
+                    columnar=True,
                 )
                 self._save_meta_file(output_directory=output_directory)
                 
@@ -663,6 +680,7 @@ class Browser(BrowserLayout):
                     pattern=pattern,
                     update_metadata=True,
                     json_file=json_file,
+                    columnar=True,
                 )
                 return True
             except Exception as e:
@@ -6,6 +6,10 @@ from pygix.grazing_units import TTH_DEG, TTH_RAD, Q_A, Q_NM
 from pyFAI.io.ponifile import PoniFile
 import logging
 from pyxscat.edf import FullHeader
+from pyxscat.other.frame_methods import get_frame_cache, accumulate_frames, AVERAGE_WORKERS
+from pyxscat.other.source_methods import is_frame_address, get_source_pool
+from pyxscat.other.unit_methods import get_unit_converter, is_q_unit
+from pyxscat.other.mask_methods import get_mask_engine, apply_mask
 import numpy as np
 import fabio
 from pydantic import BaseModel, ValidationError
@@ -562,7 +566,8 @@ class DataHandler(Transform):
             data = self._average_data(list_filenames=list_filenames)
         else:
             try:
-                data = fabio.open(list_filenames[0]).data
+                # Copy of the cached frame, the data is cleaned in place
+                data = np.array(get_frame_cache().get_frame(filename=list_filenames[0]))
             except Exception as e:
                 logger.warning(f"{list_filenames[0]} could not be opened")
                 data = None
@@ -570,7 +575,7 @@ class DataHandler(Transform):
             
     def _average_data(self, list_filenames:list):
         try:
-            data_avg = np.average([fabio.open(file).data for file in list_filenames], axis=0)
+            data_avg = accumulate_frames(list_filenames=list_filenames, max_workers=AVERAGE_WORKERS).get_mean()
         except:
             logger.warning(f"{list_filenames} not valid for data average")
             data_avg = None
@@ -630,12 +635,18 @@ class DataHandler(Transform):
             list_headers = []
             for filename in filename_list: 
                 try:
-                    header = FullHeader(filename=str(filename)).get_header()
+                    header = self._read_header(filename=filename)
                     list_headers.append(header)
                 except:
                     pass
         self.list_headers = list_headers
             
+    def _read_header(self, filename):
+        # Frames of multi-frame containers are addressed as 'path::index'
+        if is_frame_address(filename):
+            return get_source_pool().get_header(address=filename)
+        return FullHeader(filename=str(filename)).get_header()
+
     def _get_metadata_value(self, key):
         if len(self._list_headers):
             return self._get_one_metadata_value(key=key)
@@ -652,7 +663,7 @@ class DataHandler(Transform):
         
     def _get_acquisitiontime_from_file(self, filename):
         if self._acquisitiontime_key:
-            header = FullHeader(filename=str(filename)).get_header()
+            header = self._read_header(filename=filename)
             try:
                 value = float(header.get(self._acquisitiontime_key))
                 return value
@@ -860,17 +871,13 @@ class DataHandler(Transform):
             p0_range = config.get("ip_range")
             p1_range = config.get("oop_range")    
                 
-        p0_range = [self.get_q_nm(
-            value=position,
-            input_unit=unit,
-            direction=config.get("direction"),
-        ) for position in p0_range]
-
-        p1_range = [self.get_q_nm(
-            value=position,
+        ranges = self.get_q_nm(
+            value=np.array([p0_range, p1_range], dtype=np.float64),
             input_unit=unit,
             direction=config.get("direction"),
-        ) for position in p1_range]
+        )
+        if ranges is not None:
+            p0_range, p1_range = np.asarray(ranges).tolist()
         
         config["p0_range"] = p0_range
         config["p1_range"] = p1_range
@@ -931,27 +938,33 @@ class DataHandler(Transform):
                 list_results.append(res1d)
         self.results1d = list_results
                 
+    def get_unit_converter(self):
+        try:
+            return get_unit_converter(
+                wavelength=float(self._ai._wavelength),
+                incident_angle=float(self._incident_angle or 0.0),
+            )
+        except Exception as e:
+            logger.error(f'{e} There is no wavelength to transform the units.')
+            return
+
     def get_q_nm(self, value=0.0, direction='vertical', input_unit='q_nm^-1') -> float:
         """
-            Return a q(nm-1) value from another unit
+            Return a q(nm-1) value (or array) from another unit
         """
-        if input_unit in QNM_ALIAS:
-            return value
-        elif input_unit in Q_ALIAS:
+        if is_q_unit(input_unit):
             return value
-        elif input_unit in DEG_ALIAS:
-            return self.twotheta_to_q(twotheta=value, direction=direction, degree_input=True)
-        elif input_unit in RAD_ALIAS:
-            return self.twotheta_to_q(twotheta=value, degree_input=False)
-        else:
-            return None
+        converter = self.get_unit_converter()
+        if converter is None:
+            return
+        return converter.get_q_nm(value=value, direction=direction, input_unit=input_unit)
         
     def twotheta_to_q(self, twotheta=0.0, degree_input=True, direction='vertical', output_unit='q_nm^-1',) -> float:
         """
         Transforms 2theta into q
 
         Keyword Arguments:
-            twotheta -- exit angle (default: {0.0})
+            twotheta -- exit angle, value or array (default: {0.0})
             degree_input -- if True, the input twotheta is degrees, if not, radians (default: {True})
             direction -- if vertical, q is taken as qz, if horizontal, is taken as qxy (default: {'vertical'})
             output_unit -- 'q_nm^-1' or 'q_A^-1' (default: {'q_nm^-1'})
@@ -959,36 +972,15 @@ class DataHandler(Transform):
         Returns:
             modulus of q, scattering vector
         """        
-        try:
-            wavelength = self._ai._wavelength
-            wavelength_nm = wavelength * 1e9
-        except Exception as e:
-            logger.error(f'{e} There is no wavelength to transform 2theta into q.')
-            return
-
-        if degree_input:
-            twotheta = np.radians(twotheta)
-        
-        try:
-            alpha_inc = np.radians(self._incident_angle)
-        except:
-            alpha_inc = 0.0
-        
-        q_horz = 2 * np.pi / wavelength_nm * (np.cos(alpha_inc) * np.sin(twotheta))
-        q_vert = 2 * np.pi / wavelength_nm * (np.sin(twotheta) + np.sin(alpha_inc))
-
-        if output_unit in QNM_ALIAS:
-            pass
-        elif output_unit in QA_ALIAS:
-            q_horz /= 10
-            q_vert /= 10
-
-        if direction == "vertical":
-            return q_horz
-        elif direction == "horizontal":
-            return q_vert
-        else:
+        converter = self.get_unit_converter()
+        if converter is None:
             return
+        return converter.twotheta_to_q(
+            twotheta=twotheta,
+            degree_input=degree_input,
+            direction=direction,
+            output_unit=output_unit,
+        )
         
     def _mask_array(self, config:dict):
         if config.get("type") in ("azimuthal", "radial"):
@@ -1000,28 +992,23 @@ class DataHandler(Transform):
     def _mask_array_cake(self, config:dict):
         config_validated = self.validate_config_cake(config=config)
         if config_validated:
-            unit = config.get("unit")
-            dict_plot = DICT_UNIT_PLOTS.get(unit, DICT_PLOT_DEFAULT)
-            p0_range = config.get("radial_range")
-            p1_range = config.get("azimuth_range")
-            pos0_scale = dict_plot['SCALE']
-            p0_range = tuple([i / pos0_scale for i in p0_range])
-            p1_range = tuple([np.deg2rad(i) + np.pi for i in p1_range]) 
-            
-            chi, pos0 = self.giarray_from_unit(self._data.shape, "sector", "center", unit)
-            
-            pos0 = np.where(((pos0 > p0_range[0]) & (pos0 < p0_range[1])), pos0, 0)
-            pos0 = np.where(pos0 == 0, pos0, 1.0)
-            pos0 = np.where(pos0 != 0, pos0, np.nan)
-
-            chi = np.where(((chi > p1_range[0]) & (chi < p1_range[1])), chi, 0)
-            chi = np.where(chi == 0, chi, 1.0)
-            chi = np.where(chi != 0, chi, np.nan)
-
-            mask = chi * pos0
-            return self._data * mask
+            mask = get_mask_engine().cake_mask(
+                geometry=self,
+                shape=self._data.shape,
+                unit=config.get("unit"),
+                radial_range=config.get("radial_range"),
+                azimuth_range=config.get("azimuth_range"),
+            )
+            return apply_mask(data=self._data, mask=mask)
             
     def _mask_array_box(self, config:dict):
         config_validated = self.validate_config_box(config=config)
         if config_validated:
-            horz_q, vert_q = self.giarray_from_unit(self._data.shape, "opbox", "center", UNIT_GI[config.get("unit")])
\ No newline at end of file
+            mask = get_mask_engine().box_mask(
+                geometry=self,
+                shape=self._data.shape,
+                unit=config.get("input_unit"),
+                ip_range=config.get("ip_range"),
+                oop_range=config.get("oop_range"),
+            )
+            return apply_mask(data=self._data, mask=mask)
@@ -5,7 +5,7 @@ from pathlib import Path
 from pyFAI import __file__ as pyfai_file
 from PyQt5.QtWidgets import QFileDialog, QSplashScreen, QMessageBox
 from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtCore import QTimer, QThread, pyqtSignal
 from scipy import ndimage
 
 from pyFAI.io.ponifile import PoniFile
@@ -23,7 +23,11 @@ from pyxscat.gui.gui_layout import GUIPyXMWidgetLayout
 from pyxscat.gui.gui_layout import LABEL_CAKE_BINS_OPT, LABEL_CAKE_BINS_MAND
 from pyxscat.gui.gui_layout import INDEX_TAB_1D_INTEGRATION, INDEX_TAB_RAW_MAP, INDEX_TAB_Q_MAP, INDEX_TAB_RESHAPE_MAP, DEFAULT_BINNING
 from pyxscat.h5_integrator import H5GIIntegrator
+from pyxscat.batch import BatchIntegrator
+from pyxscat.gui.batch_worker import BatchWorker
 from pyxscat.gi_integrator import UNIT_GI
+from pyxscat.other.mask_methods import get_mask_engine, apply_mask
+from pyxscat.other.frame_methods import FramePrefetcher
 from pyxscat.gui.gui_layout import QZ_BUTTON_LABEL, QR_BUTTON_LABEL, MIRROR_BUTTON_LABEL
 from PyQt5.QtWidgets import QComboBox
 
@@ -148,6 +152,7 @@ class GUIPyXMWidget(GUIPyXMWidgetLayout):
         self._poni_cache = None
 
         self._data_cache = None
+        self._prefetcher = FramePrefetcher()
         self.scat_horz_cache = None
         self.scat_vert_cache = None
         self.data_bin_cache = None
@@ -167,6 +172,8 @@ class GUIPyXMWidget(GUIPyXMWidgetLayout):
         self._scattersize_cache = DEFAULT_SCATTER_SIZE
         self._terminal_visible = True
         self._live = False
+        self._batch_thread = None
+        self._batch_worker = None
         
         self._active_h5 = pyqtSignal()
         self.active_h5 = None
@@ -2201,6 +2208,9 @@ class GUIPyXMWidget(GUIPyXMWidgetLayout):
         if not self.active_index:
             return
 
+        # Read the neighbour frames in the background
+        self.prefetch_frames()
+
         # Update data cache
         self._data_cache = self.get_final_data(
             sample_name=self.active_entry,
@@ -2225,6 +2235,20 @@ class GUIPyXMWidget(GUIPyXMWidgetLayout):
             graph_2D_q=True,
         )
 
+    @log_info
+    def prefetch_frames(self) -> None:
+        """
+        Starts reading (in background threads) the frames around the active index, so the next click is served from memory
+        """
+        try:
+            list_filenames = self._active_h5.get_all_filenames_from_sample(sample_name=self.active_entry)
+            self._prefetcher.prefetch(
+                list_filenames=list_filenames,
+                index=self.active_index,
+            )
+        except Exception as e:
+            logger.info(f"{e}: frames could not be prefetched.")
+
     ##########################
     ### PYFAI-CALIB METHODS ##
     ##########################
@@ -3800,69 +3824,22 @@ class GUIPyXMWidget(GUIPyXMWidgetLayout):
         self.log_explorer_info(f"Dictionary of integration to be masked: {dict_integration}")
         shape = data.shape
 
-        # Mask for Azimuthal or Radial integration
-        if dict_integration[KEY_INTEGRATION] == CAKE_LABEL:
-            try:
-                unit = dict_integration[CAKE_KEY_UNIT]
-                dict_plot = DICT_UNIT_PLOTS.get(unit, DICT_PLOT_DEFAULT)
-                p0_range = dict_integration[CAKE_KEY_RRANGE]
-                p1_range = dict_integration[CAKE_KEY_ARANGE]
-                pos0_scale = dict_plot['SCALE']
-                p0_range = tuple([i / pos0_scale for i in p0_range])
-                p1_range = tuple([np.deg2rad(i) + np.pi for i in p1_range]) 
-
-                self.log_explorer_info(f"Parameters to mask the array. Shape: {shape}, unit: {unit}, \
-                    p0_range: {p0_range}, p1_range: {p1_range}, pos0_scale: {pos0_scale}.")
-                chi, pos0 = self._active_h5.gi.giarray_from_unit(shape, "sector", "center", unit)
-            except:
-                logger.error(f"Chi and pos0 matrix could not be generated. The parameters were: \
-                    Shape: {shape}, unit: {unit}, p0_range: {p0_range}, p1_range: {p1_range}, pos0_scale: {pos0_scale}.")
-                return
-
-            pos0 = np.where(((pos0 > p0_range[0]) & (pos0 < p0_range[1])), pos0, 0)
-            pos0 = np.where(pos0 == 0, pos0, 1.0)
-            pos0 = np.where(pos0 != 0, pos0, np.nan)
-
-            chi = np.where(((chi > p1_range[0]) & (chi < p1_range[1])), chi, 0)
-            chi = np.where(chi == 0, chi, 1.0)
-            chi = np.where(chi != 0, chi, np.nan)
-
-            mask = chi * pos0
-            self.log_explorer_info("The mask was generated.")   
-
-        # Mask for Box integration
-        elif dict_integration[KEY_INTEGRATION] == BOX_LABEL:
-            try:
-                unit = dict_integration[BOX_KEY_INPUT_UNIT]
-                dict_plot = DICT_UNIT_PLOTS.get(unit, DICT_PLOT_DEFAULT)
-                unit_gi = UNIT_GI[unit]                
-                oop_range = dict_integration[BOX_KEY_OOPRANGE]
-                ip_range = dict_integration[BOX_KEY_IPRANGE]
-                q_scale = dict_plot['SCALE']
-                oop_range = tuple([ii / q_scale for ii in oop_range])
-                ip_range = tuple([ii / q_scale for ii in ip_range])
-
-                self.log_explorer_info(f"Parameters to mask the array. Shape: {shape}, unit: {unit}, \
-                    oop_range: {oop_range}, ip_range: {ip_range}, q_scale: {q_scale}.")
-                horz_q, vert_q = self._active_h5.gi.giarray_from_unit(shape, "opbox", "center", unit_gi)
-            except Exception as e:
-                logger.error(f"{e} horz_q and vert_q matrix could not be generated with {dict_integration} and shape {shape}")
-                return
-
-            horz_q = np.where(((horz_q > ip_range[0]) & (horz_q < ip_range[1])), horz_q, 0)
-            horz_q = np.where(horz_q == 0, horz_q, 1.0)
-            horz_q = np.where(horz_q != 0, horz_q, np.nan)
-
-            vert_q = np.where(((vert_q > oop_range[0]) & (vert_q < oop_range[1])), vert_q, 0)
-            vert_q = np.where(vert_q == 0, vert_q, 1.0)
-            vert_q = np.where(vert_q != 0, vert_q, np.nan)
-
-            mask = horz_q * vert_q
+        # Boolean mask of the integration region, cached per geometry, dictionary and shape
+        try:
+            mask = get_mask_engine().integration_mask(
+                geometry=self._active_h5.gi,
+                dict_integration=dict_integration,
+                shape=shape,
+            )
+        except Exception as e:
+            logger.error(f"{e}: the mask could not be generated with {dict_integration} and shape {shape}")
+            return
 
-        else:
+        if mask is None:
             return
-        plt.plot(mask)
-        data_mask = data * mask
+        self.log_explorer_info("The mask was generated.")
+
+        data_mask = apply_mask(data=data, mask=mask)
         self.log_explorer_info("The mask was completed.")        
 
         return data_mask
@@ -4070,49 +4047,78 @@ class GUIPyXMWidget(GUIPyXMWidgetLayout):
     def batch_clicked(self, _):
         """
         Apply the integration that is in the chart to all the files in selected folder and save the files
+        The batch runs in a QThread, every result is saved as it arrives and is not kept in memory
         """
-        self._write_output("Batch integration not available for the moment.")
-        return
-        # confirm_batch = QMessageBox.question(self, 'MessageBox', "Are you sure you want to run a batch integration? It may take some minutes+", QMessageBox.Yes | QMessageBox.No)
-        # if confirm_batch == QMessageBox.Yes:
-        #     files_in_selected_folder = []
-        #     files_in_selected_folder += self._dict_files[self.clicked_folder]
-
-        #     # Create folder to save the files
-        #     dateprefix = date_prefix()
-        #     if le.text(self.lineedit_savefolder):
-        #         folder_output = join(
-        #             le.text(self.lineedit_savefolder),
-        #             f"{basename(self.clicked_folder)}_fittings_{dateprefix}",
-        #         )
-        #         makedir(folder_output)
-        #     else:
-        #         return
-
-        #     for file in files_in_selected_folder:
-
-        #         edf = self.get_Edf_instance(filename=file)
-
-        #         for df in self.integrate_data(
-        #             data=edf.get_data(),
-        #             norm_factor=edf.normfactor,
-        #             dicts_integration=le.get_clean_list(
-        #                 lineedit=self.lineedit_integrations
-        #             ),
-        #         ):
-        #             # Dict to string
-        #             str_header = dict_to_str(dictionary= edf.get_dict() | self.dict_cache)
-
-        #             filename_out = join(
-        #                 folder_output, 
-        #                 edf.basename.replace('.edf', f"_{le.text(lineedit=self.lineedit_integrations).replace(',','_')}.csv",
-        #                 ),
-        #             )
-
-        #             mode = 'w' if exists(filename_out) else 'a'
-
-        #             with open(filename_out, mode) as f:
-        #                 f.write(f'{str_header}\n')
-        #             df.to_csv(filename_out, sep='\t', mode='a', index=False, header=True)
-        # else:
-        #     return
\ No newline at end of file
+        if not self._active_h5:
+            return
+
+        if self._batch_thread is not None and self._batch_thread.isRunning():
+            self._write_output("A batch integration is already running.")
+            return
+
+        if not self.active_entry:
+            self._write_output("Select a folder to run a batch integration.")
+            return
+
+        list_integration_names = self.combobox_integration.currentData()
+        if not list_integration_names:
+            self._write_output("Select at least one integration to run a batch integration.")
+            return
+
+        list_dict_integration = [get_dict_from_name(name=name, path_integration=INTEGRATION_PATH) for name in list_integration_names]
+
+        if not le.text(self.lineedit_savefolder):
+            self._write_output("Write an output folder to save the batch integration.")
+            return
+
+        confirm_batch = QMessageBox.question(self, 'MessageBox', "Are you sure you want to run a batch integration? It may take some minutes+", QMessageBox.Yes | QMessageBox.No)
+        if confirm_batch != QMessageBox.Yes:
+            return
+
+        # Create folder to save the files
+        folder_output = Path(le.text(self.lineedit_savefolder)).joinpath(
+            f"{Path(self.active_entry).name}_batch_{date_prefix()}",
+        )
+        folder_output.mkdir(parents=True, exist_ok=True)
+
+        try:
+            batch = BatchIntegrator(
+                poni=self._active_h5.get_poni(),
+                list_dict_integration=list_dict_integration,
+                qz_parallel=self.state_qz,
+                qr_parallel=self.state_qr,
+            )
+        except Exception as e:
+            self.log_explorer_error(f"{e}: the batch integration could not be performed.")
+            return
+
+        self._batch_folder_output = folder_output
+        self._batch_thread = QThread()
+        self._batch_worker = BatchWorker(
+            batch=batch,
+            source=self._active_h5,
+            entry_name=self.active_entry,
+            folder_output=folder_output,
+        )
+        self._batch_worker.moveToThread(self._batch_thread)
+        self._batch_thread.started.connect(self._batch_worker.run)
+        self._batch_worker.progress.connect(self._batch_progress)
+        self._batch_worker.error.connect(self.log_explorer_error)
+        self._batch_worker.finished.connect(self._batch_finished)
+        # The thread and the worker are kept until the next batch, a running QThread cannot be garbage collected
+        self._batch_worker.finished.connect(self._batch_thread.quit)
+
+        self.button_batch.setEnabled(False)
+        self._write_output(f"Batch integration started: {self.active_entry}")
+        self._batch_thread.start()
+
+    def _batch_progress(self, index=0, ntasks=0):
+        """
+        Writes the progress of the batch integration, every tenth of the frames
+        """
+        if index == ntasks or index % max(ntasks // 10, 1) == 0:
+            self._write_output(f"Batch integration: {index}/{ntasks} frames")
+
+    def _batch_finished(self, nframes=0, ntasks=0):
+        self._write_output(f"Batch integration finished: {nframes}/{ntasks} files saved in {self._batch_folder_output}")
+        self.button_batch.setEnabled(True)
@@ -5,7 +5,11 @@ from os.path import getctime
 
 from pyFAI.io.ponifile import PoniFile
 from pyxscat.edf import EdfClass
+from pyxscat.metadata import read_header_safe
+from pyxscat.other.frame_methods import get_frame_cache, accumulate_frames, AVERAGE_WORKERS
 from pyxscat.other.other_functions import date_prefix, get_dict_files, get_dict_difference
+from pyxscat.other.column_methods import FLOAT, append_row, column_kind, parse_header, to_array
+from pyxscat.other.walk_methods import DirectoryWalker
 from pyxscat.other.units import *
 
 import h5py
@@ -17,7 +21,7 @@ from pyxscat.other.integrator_methods import *
 from pyxscat.other.setup_methods import *
 import os
 from typing import List, Any
-from multiprocessing import Pool
+from multiprocessing import Pool, cpu_count
 
 ENCODING_FORMAT = "UTF-8"
 FORMAT_STRING = h5py.string_dtype(ENCODING_FORMAT)
@@ -102,25 +106,31 @@ def logger_info(func):
     return wrapper
 
 
-def get_dict_entry(pattern, entry):
-    d_entry = defaultdict(list)
-
-    for file in entry.glob(pattern):
-        d_entry['filenames'].append(str(file))
-        d_entry['names'].append(str(file.name))
-
-        header = EdfClass(filename=str(file)).get_header()
-        for metadata_key,metadata_value in header.items():
-            try:
-                metadata_value = float(metadata_value)
-            except:
-                metadata_value = str(metadata_value)
-            d_entry[metadata_key].append(metadata_value)
-    
-    return d_entry
-
+def read_entry_rows(list_files=()) -> tuple:
+    """
+    Reads the headers of a list of files, the task of one directory in H5GIIntegrator.update_new_data_fast.
+    The errors are returned instead of raised (see read_header_safe), a bad file does not stop the others
 
+    Keyword arguments:
+    list_files -- sorted paths of the files (default: {()})
 
+    Returns:
+    tuple: rows (filename, name and parsed header of every file) and dictionary of the failed files with their error
+    """
+    list_rows = []
+    dict_failed = dict()
+    for file in list_files:
+        header, error = read_header_safe(filename=str(file))
+        if error:
+            dict_failed[str(file)] = error
+            continue
+        row = {
+            'filenames' : str(file),
+            'names' : Path(file).name,
+        }
+        row.update(parse_header(header=header))
+        list_rows.append(row)
+    return list_rows, dict_failed
 
 
 class H5GIIntegrator():
@@ -132,6 +142,8 @@ class H5GIIntegrator():
 
         logger.info("H5GIIntegrator instance was created.")
         self.dict_data = defaultdict(lambda : defaultdict(list))  
+        self._walker = None
+        self._failed_files = dict()
 
         if input_h5_filename:
 
@@ -219,6 +231,22 @@ class H5GIIntegrator():
 
     def set_root_directory(self, root_directory=''):
         self._root_dir = Path(root_directory)
+        self._walker = None
+
+    def _get_walker(self, pattern=None) -> DirectoryWalker:
+        """
+        Returns the DirectoryWalker of the root directory, a new one if the pattern of the data files changes
+
+        Keyword arguments:
+        pattern -- filename string pattern, the current one if None (default: {None})
+        """
+        if self._walker is None or (pattern is not None and pattern != self._walker.pattern):
+            self._walker = DirectoryWalker(
+                directory=self._root_dir,
+                pattern=pattern or '*.edf',
+                poni_pattern=WILDCARDS_PONI,
+            )
+        return self._walker
 
     def set_h5_filename(self, h5_filename=''):
         self._h5_filename = Path(h5_filename)
@@ -694,7 +722,9 @@ class H5GIIntegrator():
         
         try:
             # Absolute paths of .poni files in the root folder
-            searched_ponifiles = sorted(file.as_posix() for file in self._root_dir.rglob(WILDCARDS_PONI))
+            walker = self._get_walker()
+            walker.scan()
+            searched_ponifiles = [Path(file).as_posix() for file in walker.get_ponifiles()]
             if new_files:
                 # Filter only the new files
                 ponifiles_in_h5 = self.get_all_ponifiles(get_relative_address=False)
@@ -1127,29 +1157,56 @@ class H5GIIntegrator():
     def update_new_data_fast(
         self,
         pattern: str = '*.edf',
+        processes: int = None,
         ) -> dict:
+        """
+        Reads the metadata of the new files of every subdirectory in a pool of processes, one subdirectory per task
 
-        attrs = [
-            (
-                pattern, 
-                subdir,
-            ) 
-            for subdir in self._root_dir.rglob('**/')
-        ]
-
-        with Pool(processes=4) as pool:  # creating a pool with 4 worker processes
-            results = pool.starmap(get_dict_entry, attrs)
-
-        for result, entry in zip(results, self._root_dir.rglob('**/')):
-            self.dict_data[str(entry)] = result
-
-        #works extremely fast but needs a filter 
-            
-
-            
+        Keyword arguments:
+        pattern -- filename string pattern (default: {'*.edf'})
+        processes -- number of worker processes, the number of CPUs if None (default: {None})
 
+        Returns:
+        dict: metadata collected from the new files
+        """
+        # One walk for all the directories, only those modified since the last update are listed again
+        walker = self._get_walker(pattern=pattern)
+        walker.scan()
+
+        # Only the files not stored yet (or failed in a previous update) are read, the same sorted lists for the tasks and the results
+        dict_new_files = dict()
+        for entry, list_files in walker.get_files().items():
+            stored_files = set(self.dict_data[entry]['filenames']) if entry in self.dict_data else set()
+            list_new_files = [file for file in list_files if file not in stored_files]
+            if list_new_files:
+                dict_new_files[entry] = list_new_files
+
+        processes = min(processes or cpu_count(), len(dict_new_files))
+        if processes > 1:
+            with Pool(processes=processes) as pool:
+                results = pool.map(read_entry_rows, dict_new_files.values())
+        else:
+            results = [read_entry_rows(list_files=list_files) for list_files in dict_new_files.values()]
 
+        # Aligned columns: the missing keys are backfilled with None
+        dict_new_data = defaultdict(lambda : defaultdict(list))
+        for entry, (list_rows, dict_failed) in zip(dict_new_files, results):
+            for filename in dict_new_files[entry]:
+                self._failed_files.pop(filename, None)
+            for filename, error in dict_failed.items():
+                self._failed_files[filename] = error
+                logger.warning(f"{error}: the file {filename} was not added to the database.")
+            for row in list_rows:
+                append_row(metadata=dict_new_data[entry], row=row)
+                append_row(metadata=self.dict_data[entry], row=row)
+        walker.commit()
+        return dict_new_data
 
+    def get_failed_files(self) -> dict:
+        """
+        Returns the files whose header could not be read in the last updates, with the error
+        """
+        return dict(self._failed_files)
 
     @logger_info
     def update_new_data(
@@ -1166,52 +1223,48 @@ class H5GIIntegrator():
         """   
         dict_new_data = defaultdict(lambda : defaultdict(list))
 
+        # One walk for data files and .poni files, the directories not modified since the last update are not listed
+        walker = self._get_walker(pattern=pattern)
+        walker.scan()
+
         # If there is no stored data so far, append directly without checking
         if not self.dict_data:
 
-            for file in self._root_dir.rglob(pattern):
-                dict_new_data[str(file.parent)]['filenames'].append(str(file))
-                dict_new_data[str(file.parent)]['names'].append(str(file.name))
+            for file in (Path(file) for list_files in walker.get_files().values() for file in list_files):
                 header = EdfClass(filename=str(file)).get_header()
-                for metadata_key,metadata_value in header.items():
-                    try:
-                        metadata_value = float(metadata_value)
-                    except:
-                        metadata_value = str(metadata_value)
-                    dict_new_data[str(file.parent)][metadata_key].append(metadata_value)
+                row = {
+                    'filenames' : str(file),
+                    'names' : str(file.name),
+                }
+                row.update(parse_header(header=header))
+                append_row(metadata=dict_new_data[str(file.parent)], row=row)
 
             # Search also for .poni files
-            for file in self._root_dir.rglob('*.poni'):
+            for file in walker.get_ponifiles():
                 dict_new_data['ponifiles']['files'].append(str(file))
 
             self.dict_data = dict_new_data
 
         # If there are stored data, check if it is redundant
         else:
-            for file in self._root_dir.rglob(pattern):
+            for file in (Path(file) for list_files in walker.get_files(changed_only=True).values() for file in list_files):
                 if str(file) not in self.dict_data[str(file.parent)]['filenames']:
-
-                    dict_new_data[str(file.parent)]['filenames'].append(str(file))
-                    dict_new_data[str(file.parent)]['names'].append(str(file.name))
-                    self.dict_data[str(file.parent)]['filenames'].append(str(file))
-                    self.dict_data[str(file.parent)]['names'].append(str(file.name))
-
                     header = EdfClass(filename=str(file)).get_header()
-                    for metadata_key,metadata_value in header.items():
-                        try:
-                            metadata_value = float(metadata_value)
-                        except:
-                            metadata_value = str(metadata_value)
-
-                        dict_new_data[str(file.parent)][metadata_key].append(metadata_value)
-                        self.dict_data[str(file.parent)][metadata_key].append(metadata_value)
+                    row = {
+                        'filenames' : str(file),
+                        'names' : str(file.name),
+                    }
+                    row.update(parse_header(header=header))
+                    append_row(metadata=dict_new_data[str(file.parent)], row=row)
+                    append_row(metadata=self.dict_data[str(file.parent)], row=row)
 
             # Search also for .poni files
-            for file in self._root_dir.rglob('*.poni'):
+            for file in walker.get_ponifiles():
                 if str(file) not in self.dict_data['ponifiles']['files']:
                     dict_new_data['ponifiles']['files'].append(str(file))
                     self.dict_data['ponifiles']['files'].append(str(file))
 
+        walker.commit()
         return dict_new_data
 
     @logger_info
@@ -1273,15 +1326,16 @@ class H5GIIntegrator():
                 name_entry = f'entry_{ind_entry:04}'
                 f.create_group(name=name_entry)
                 for metadata_key, metadata_list in self.dict_data[entry].items():
-                    try:
+                    # Missing values are written as NaN (numbers) or empty strings
+                    if column_kind(values=metadata_list) == FLOAT:
                         f[name_entry].create_dataset(
                             name=metadata_key,
-                            data=np.array(metadata_list),
+                            data=to_array(values=metadata_list),
                         )
-                    except:
+                    else:
                         f[name_entry].create_dataset(
                             name=metadata_key,
-                            data=np.array(metadata_list),
+                            data=to_array(values=metadata_list),
                             dtype=FORMAT_STRING,
                         )
 
@@ -1818,17 +1872,25 @@ class H5GIIntegrator():
         if isinstance(index, int):
             index = (index,)
 
-        # Get the sample data
+        # Get the sample data, the frames are read through the process-wide frame cache
         try:
-            data_sample = sum(
-                [
-                    self.get_Edf_instance(
-                        full_filename=full_filename,
+            if full_filename:
+                list_filenames = [full_filename] * len(index)
+            else:
+                list_filenames = [
+                    self.get_filename_from_index(
                         sample_name=sample_name,
-                        index_file=index,
-                    ).get_data() for index in index
+                        index_list=ind,
+                    ) for ind in index
                 ]
-            ) / len(index)
+            if len(set(list_filenames)) == 1:
+                data_sample = np.array(get_frame_cache().get_frame(filename=list_filenames[0]), dtype=np.float64)
+            else:
+                # Streaming average, only the accumulator and one frame are kept in memory
+                data_sample = accumulate_frames(
+                    list_filenames=list_filenames,
+                    max_workers=AVERAGE_WORKERS,
+                ).get_mean()
             logger.info(f"New data sample with shape: {data_sample.shape}")
         except Exception as e:
             data_sample = None
@@ -1845,19 +1907,20 @@ class H5GIIntegrator():
         return data_sample
     
     @logger_info
-    def generate_integration(self, data=None, norm_factor=1.0, list_dict_integration=[]):
+    def generate_integration(self, data=None, norm_factor=1.0, list_dict_integration=[], fused=True):
         for res in self.gi.generate_integration(
             data=data,
             norm_factor=norm_factor,
             list_dict_integration=list_dict_integration,
+            fused=fused,
             ):
             yield res
 
     @logger_info
-    def map_reshaping(self, data=None):
+    def map_reshaping(self, data=None, **kwargs):
         if data is None:
             return
-        data_reshape, q, chi = self.gi.map_reshaping(data=data)
+        data_reshape, q, chi = self.gi.map_reshaping(data=data, **kwargs)
         return data_reshape, q, chi
 
     @logger_info
@@ -1,12 +1,18 @@
 
 from collections import defaultdict
-from threading import Thread
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Any
 import logging
 import fabio
 import json
 from pyxscat.edf import FullHeader
+from pyxscat.other.column_methods import MetadataTable, append_row, column_kind, parse_header, to_pandas
+from pyxscat.other.edf_methods import is_edf_file
+from pyxscat.other.frame_methods import get_frame_cache
+from pyxscat.other.header_methods import HeaderCache, HEADER_CACHE_SUFFIX
+from pyxscat.other.walk_methods import DirectoryWalker
+from pyxscat.other.source_methods import CONTAINER_PATTERNS, frame_address, is_frame_address, is_hdf5_file, is_single_edf, split_address, iter_frame_addresses, get_source_pool
 import os
 import pandas as pd
 import numpy as np
@@ -16,19 +22,114 @@ logger = logging.getLogger(__name__)
 FILENAMES = 'filenames'
 NAMES = 'names'
 
-PATTERNS = ['*.edf', '*.cbf', '*.tif', '*.tiff']
+PATTERNS = ['*.edf', '*.cbf', '*.tif', '*.tiff'] + CONTAINER_PATTERNS
 DEFAULT_PATTERN = '*.edf'
 DIR_PATTERN = '**/'
+# Number of headers submitted at once to the pool of threads
+HEADER_CHUNK = 1024
+
+ERROR_HEADER = "The header could not be read."
+# Pools of workers that index the files and read their headers
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+
+def read_header(filename: str):
+    # Frame inside a multi-frame container
+    if is_frame_address(filename):
+        try:
+            return get_source_pool().get_header(address=filename)
+        except Exception as e:
+            logger.warning(f"{e}: header of frame {filename} could not be accessed.")
+            return
+
+    try:
+        header = FullHeader(filename=str(filename)).get_header()
+        return header
+    except Exception as e:
+        print(f'Full header of {str(filename)} could not be accessed.\{e}')
+    
+    try:
+        header = fabio.open(filename=str(filename)).header
+        return header
+    except Exception as e:
+        print(f'Fabio header of {str(filename)} could not be accessed anyway.\{e}')
+        return
+
+
+def read_header_safe(filename: str) -> tuple:
+    # The errors are returned instead of raised, a bad file does not stop the others
+    try:
+        header = read_header(filename=filename)
+    except Exception as e:
+        return None, str(e)
+    if header is None:
+        return None, ERROR_HEADER
+    return header, None
+
+
+def index_frames(filename: str) -> list:
+    """
+    Returns the addresses of the frames of a file: 'path::index' for every frame of a multi-frame container, the path for a single frame.
+    The header blocks of an .edf file are read once: they are kept by the FrameCache, where FullHeader finds them
+    """
+    if is_edf_file(filename):
+        try:
+            edf_header = get_frame_cache().get_edf_header(filename=filename)
+        except Exception:
+            edf_header = None
+        if edf_header is not None and is_single_edf(filename=filename, edf_header=edf_header):
+            return [filename]
+    elif not is_hdf5_file(filename):
+        return [filename]
+    return list(iter_frame_addresses(filename=filename))
+
+
+def index_file(filename: str) -> tuple:
+    """
+    Task of one file in the pool of workers: indexes the frames of the file and reads all their headers
+
+    Returns:
+        tuple (nframes, list of (address, header, error)), nframes is 0 for a single frame and None if the frames could not be indexed
+    """
+    filename = str(filename)
+    try:
+        list_addresses = index_frames(filename=filename)
+    except Exception as e:
+        logger.warning(f"{e}: frames of {filename} could not be indexed.")
+        nframes, list_addresses = None, [filename]
+    else:
+        nframes = 0 if list_addresses == [filename] else len(list_addresses)
+    return nframes, [(address,) + read_header_safe(filename=address) for address in list_addresses]
+
+
+def index_ponifile(filename: str) -> tuple:
+    # .poni files have no header
+    return 0, [(str(filename), dict(), None)]
+
 
 class MetadataBase:
+    # Picklable task of one file, run by the pool of threads or processes
+    _index_file = staticmethod(index_file)
+
+
     def __init__(
             self, 
             directory="", 
             pattern=DEFAULT_PATTERN, 
             update_metadata=True,
             json_file="",
+            header_cache=True,
+            max_workers=None,
+            executor=EXECUTOR_THREAD,
+            columnar=False,
         ):
+        self._columnar = columnar
+        self._executor = executor
         self._init_containers()
+        self._header_cache = None
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._failed_files = dict()
 
         # Init database using a json_file or a directory path (+ pattern)
         if json_file:
@@ -46,6 +147,9 @@ class MetadataBase:
             )
         else:
             return
+
+        if header_cache:
+            self._open_header_cache()
         
         if update_metadata:
             self._update_metadata()
@@ -60,10 +164,53 @@ class MetadataBase:
         return repr
     
     def _init_containers(self):
-        self._container_metadata = defaultdict(lambda : defaultdict(list))
+        self._container_metadata = self._new_container()
         self._container_metadata_newfiles = defaultdict(lambda : defaultdict(list))
         self._container_ponifiles = list()
         self._container_ponifiles_new = list()
+        self._reset_index()
+
+    def _new_container(self, metadatabase: dict = None) -> defaultdict:
+        # Lists of Python objects, or typed columns: float64 arrays and dictionary-encoded strings
+        # (the filenames and names are unique in every row, they stay as lists)
+        if self._columnar:
+            table_factory = lambda metadata=None : MetadataTable(metadata=metadata, list_keys=(FILENAMES, NAMES))
+        else:
+            table_factory = lambda metadata=None : defaultdict(list, {metadata_key : list(values) for metadata_key, values in (metadata or dict()).items()})
+        container = defaultdict(table_factory)
+        for entry_name, metadata in (metadatabase or dict()).items():
+            container[entry_name] = table_factory(metadata)
+        return container
+
+    def _get_serializable_container(self) -> dict:
+        if not self._columnar:
+            return self._container_metadata
+        return {
+            entry_name : {metadata_key : list(column) for metadata_key, column in metadata.items()}
+            for entry_name, metadata in self._container_metadata.items()
+        }
+
+    @property
+    def columnar(self):
+        return self._columnar
+
+    def _reset_index(self):
+        # Hash index of the containers, built again on demand: filename -> (entry, row), entry -> set of filenames
+        self._index_files = None
+        self._index_entries = None
+
+    def _build_index(self):
+        self._index_files = dict()
+        self._index_entries = defaultdict(set)
+        for entry_name, metadata in self._container_metadata.items():
+            for row, filename in enumerate(metadata.get(FILENAMES, [])):
+                self._index_files[filename] = (entry_name, row)
+                self._index_entries[entry_name].add(filename)
+
+    def _get_index(self) -> tuple:
+        if self._index_files is None:
+            self._build_index()
+        return self._index_files, self._index_entries
 
     def _open_metadatabase(self, json_file=""):
         if not Path(json_file).is_file():
@@ -71,11 +218,13 @@ class MetadataBase:
         
         with open(json_file) as f:
             metadatabase = json.load(f)
-        self._container_metadata = defaultdict(lambda : defaultdict(list), metadatabase)     
+        self._container_metadata = self._new_container(metadatabase=metadatabase)
+        self._reset_index()
     
     def _init_attributes(self, directory="", pattern="", json_file=""):
         self._directory = Path(directory)
         self._pattern = pattern
+        self._walker = DirectoryWalker(directory=directory, pattern=pattern)
         if not json_file:
             self._json_file = self._get_json_file()
         else:
@@ -84,6 +233,25 @@ class MetadataBase:
     def _get_json_file(self):
         return Path(__file__).parent.joinpath("metadatabases", f'{self._directory.name}_pyxscat_mdb.json')
 
+    def _get_header_cache_file(self):
+        # Sidecar of the .json file, with the parsed headers of the files
+        return Path(self._json_file).with_suffix(HEADER_CACHE_SUFFIX)
+
+    def _open_header_cache(self):
+        try:
+            self._header_cache = HeaderCache(filename=self._get_header_cache_file())
+        except Exception as e:
+            logger.warning(f"{e}: the header cache {self._get_header_cache_file()} could not be opened.")
+            self._header_cache = None
+
+    @property
+    def header_cache(self):
+        return self._header_cache
+
+    def _flush_header_cache(self):
+        if self._header_cache is not None:
+            self._header_cache.flush()
+
     @property
     def nbentries(self):
         return len(list(self._container_metadata.keys()))
@@ -108,7 +276,8 @@ class MetadataBase:
         return str(self._directory)
     
     def _reset_container(self):
-        self._container_metadata = defaultdict(lambda : defaultdict(list))
+        self._container_metadata = self._new_container()
+        self._reset_index()
 
     def __iter__(self):
         for subdirectory in self._container_metadata.keys():
@@ -134,7 +303,7 @@ class MetadataBase:
             entry_name = str(entry_name)
         else:
             entry_name = str(Path(self.directory).joinpath(entry_name))
-        if entry_name not in self.get_entries():
+        if entry_name not in self._container_metadata:
             return
         return entry_name
 
@@ -150,24 +319,112 @@ class MetadataBase:
             return
         return self.container[entry].keys()
 
+    def _append_row(self, entry_name: str, row: dict):
+        # Every key of the entry keeps one value per file, see append_row
+        append_row(metadata=self._container_metadata[entry_name], row=row)
+        if self._index_files is not None:
+            self._index_files[row[FILENAMES]] = (entry_name, len(self._container_metadata[entry_name][FILENAMES]) - 1)
+            self._index_entries[entry_name].add(row[FILENAMES])
+
     def _append(self, entry_name: str, metadata_key: str, metadata_value: Any):
         self._container_metadata[entry_name][metadata_key].append(metadata_value)
+        if metadata_key == FILENAMES and self._index_files is not None:
+            self._index_files[metadata_value] = (entry_name, len(self._container_metadata[entry_name][FILENAMES]) - 1)
+            self._index_entries[entry_name].add(metadata_value)
 
     def _get_header(self, filename: str):
+        # Unchanged files (same size and mtime) are not opened again
+        if self._header_cache is not None:
+            header = self._header_cache.get(address=filename)
+            if header is not None:
+                return header
+
+        header = self._read_header(filename=filename)
+        if header is not None and self._header_cache is not None:
+            self._header_cache.set(address=filename, header=header)
+        return header
+
+    def _read_header(self, filename: str):
+        return read_header(filename=filename)
+
+    def _read_header_safe(self, filename: str) -> tuple:
+        # The errors are returned instead of raised, a bad file does not stop the others
         try:
-            header = FullHeader(filename=str(filename)).get_header()
-            return header
-        except Exception as e:
-            print(f'Full header of {str(filename)} could not be accessed.\{e}')
-        
-        try:
-            header = fabio.open(filename=str(filename)).header
-            return header
+            header = self._get_header(filename=filename)
         except Exception as e:
-            print(f'Fabio header of {str(filename)} could not be accessed anyway.\{e}')
+            return None, str(e)
+        if header is None:
+            return None, ERROR_HEADER
+        return header, None
+
+    def _get_cached_frames(self, filename: str):
+        # Frames and headers of an unchanged file, None if any of them has to be read again
+        if self._header_cache is None:
             return
+        nframes = self._header_cache.get_nframes(filename=filename)
+        if nframes is None:
+            return
+        list_addresses = [frame_address(filename=filename, index=index) for index in range(nframes)] if nframes else [filename]
+        list_frames = []
+        for address in list_addresses:
+            header = self._header_cache.get(address=address)
+            if header is None:
+                return
+            list_frames.append((address, header, None))
+        return list_frames
+
+    def _set_cached_frames(self, filename: str, nframes=None, list_frames=()) -> None:
+        if self._header_cache is None:
+            return
+        for address, header, error in list_frames:
+            if not error:
+                self._header_cache.set(address=address, header=header)
+        if nframes is not None:
+            self._header_cache.set_nframes(filename=filename, nframes=nframes)
+
+    def _get_executor(self, max_workers=1):
+        if self._executor == EXECUTOR_PROCESS:
+            return ProcessPoolExecutor(max_workers=max_workers)
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='header')
+
+    def _generate_headers(self, list_files: list, threading=True):
+        """
+        Yields (filename, header, error) for every frame of list_files, in order.
+        Every file is one task of a bounded pool of workers (threads or processes, up to max_workers at the same time)
+        that indexes its frames and reads their headers; the unchanged files are taken from the header cache by this thread
+
+        Keyword Arguments:
+            list_files -- files whose frames are indexed
+            threading -- if False, the files are read one by one (default: {True})
+        """
+        list_files = [str(filename) for filename in list_files]
+        max_workers = min(self._max_workers, len(list_files)) if threading else 1
+        executor = None
+        try:
+            for start in range(0, len(list_files), HEADER_CHUNK):
+                chunk = list_files[start:start + HEADER_CHUNK]
+                dict_frames = {filename : self._get_cached_frames(filename=filename) for filename in chunk}
+                list_pending = [filename for filename, list_frames in dict_frames.items() if list_frames is None]
+
+                # The pool is only started if some file has to be read
+                if max_workers > 1 and len(list_pending) > 1:
+                    if executor is None:
+                        executor = self._get_executor(max_workers=max_workers)
+                    results = executor.map(self._index_file, list_pending, chunksize=max(1, len(list_pending) // (4 * max_workers)))
+                else:
+                    results = map(self._index_file, list_pending)
+
+                for filename, (nframes, list_frames) in zip(list_pending, results):
+                    dict_frames[filename] = list_frames
+                    self._set_cached_frames(filename=filename, nframes=nframes, list_frames=list_frames)
+
+                for filename in chunk:
+                    yield from dict_frames[filename]
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
 
-    def _update_entry_single(self, entry_name: Path, filename: Path):
+    def _update_entry_single(self, entry_name: Path, filename: Path, header: dict = None):
         if self._is_file_in_entry(
             entry_name=str(entry_name),
             filename=str(filename),
@@ -175,47 +432,63 @@ class MetadataBase:
             logger.warning(f"The file {filename} is already in the MetadataBase.")
             return
 
-        # Filename/Name metadata
-        self._append(entry_name=str(entry_name), metadata_key=FILENAMES, metadata_value=str(filename))
-        self._append(entry_name=str(entry_name), metadata_key=NAMES, metadata_value=str(Path(filename).name))
-        logger.info(f"Updated filename: {str(filename)}")
-    
         # Get Fabio header
-        header = self._get_header(filename=filename)
-        for metadata_key,metadata_value in header.items():
-            try:
-                metadata_value = float(metadata_value)
-            except:
-                metadata_value = str(metadata_value)
-            self._append(entry_name=str(entry_name), metadata_key=metadata_key, metadata_value=metadata_value)
-
-    def _update_entry_single_thread(self, entry_name, filename):
-        Thread(target=self._update_entry_single, args=(entry_name, filename)).start()
-
-    def _update_entry(self, entry_name, file_iterator, threading=False):
-        iter_empty = True
-        for filename in sorted(file_iterator):
-            iter_empty = False
-            if threading:
-                self._update_entry_single_thread(entry_name=entry_name, filename=filename)
-            else:
-                self._update_entry_single(entry_name=entry_name, filename=filename)
-        return iter_empty
+        if header is None:
+            header, error = self._read_header_safe(filename=filename)
+            if error:
+                self._failed_files[str(filename)] = error
+                logger.warning(f"{error}: the file {filename} was not added to the MetadataBase.")
+                return
+        self._failed_files.pop(str(filename), None)
+
+        # Filename/Name metadata and the header, in one aligned row
+        row = {
+            FILENAMES : str(filename),
+            NAMES : str(Path(filename).name),
+        }
+        row.update(parse_header(header=header))
+        self._append_row(entry_name=str(entry_name), row=row)
+        logger.info(f"Updated filename: {str(filename)}")
+
+    def _update_entry(self, entry_name, file_iterator, threading=True):
+        empty = True
+
+        # The files are read in parallel, but only this thread appends to the containers, in sorted order
+        for filename, header, error in self._generate_headers(list_files=sorted(file_iterator), threading=threading):
+            empty = False
+            if error:
+                self._failed_files[str(filename)] = error
+                logger.warning(f"{error}: the file {filename} was not added to the MetadataBase.")
+                continue
+            self._update_entry_single(entry_name=entry_name, filename=filename, header=header)
+        self._flush_header_cache()
+        return empty
     
     def _search_files(self) -> dict:
-        return {str(subdir) : sorted(subdir.glob(self._pattern)) for subdir in sorted(self._directory.rglob(DIR_PATTERN))}
+        self._walker.scan()
+        return self._walker.get_files()
 
     def _search_new_files(self) -> dict:
+        # Only the directories whose mtime changed since the last update are listed again, but the files of every
+        # directory are compared with the index: a file that failed or is missing is read again, even if its directory has not changed
+        changed_directories = self._walker.scan()
+        _, index_entries = self._get_index()
+        failed_files = {split_address(filename)[0] for filename in self._failed_files}
         dict_new_files = defaultdict(list)
-        for subdir in self._directory.rglob(DIR_PATTERN):
-            if str(subdir) not in self._container_metadata.keys():
-                dict_new_files[str(subdir)] = subdir.glob(self._pattern)
-            else:
-                dict_new_files[str(subdir)].extend([str(file) for file in subdir.glob(self._pattern) if str(file) not in self._container_metadata[str(subdir)][FILENAMES]])
+        for subdir, list_files in self._walker.get_files().items():
+            known_files = index_entries.get(subdir, ())
+            # The frames of a container share the path of the file
+            list_new_files = [
+                file for file in list_files
+                if file in failed_files or (file not in known_files and frame_address(filename=file, index=0) not in known_files)
+            ]
+            if list_new_files or subdir in changed_directories:
+                dict_new_files[subdir].extend(list_new_files)
         return dict_new_files
 
     def _search_ponifiles(self) -> list:
-        return [str(ponifile) for ponifile in self._directory.rglob("*.poni")]
+        self._walker.scan()
+        return self._walker.get_ponifiles()
 
     def _update_metadata(self):
         if self._container_metadata == defaultdict(lambda : defaultdict(list)):
@@ -225,15 +498,17 @@ class MetadataBase:
         self.update_ponidatabase()
 
     def _is_file_in_entry(self, entry_name: Path, filename: Path):
-        if filename in self._generate_files_in_entry(entry_name=entry_name):
-            return True
-        return False
+        entry_name = self._validate_entry(entry_name=entry_name)
+        if not entry_name:
+            return False
+        _, index_entries = self._get_index()
+        return filename in index_entries.get(entry_name, ())
     
     def _remove_metadata(self):
         dict_removed_files = defaultdict(list)
         for entry in self._generate_entries():
             for index, filename in enumerate(self._generate_files_in_entry(entry_name=entry)):
-                if not Path(filename).is_file():
+                if not Path(split_address(filename)[0]).is_file():
                     dict_removed_files[entry].append(index)
 
         for entry, index_list in dict_removed_files.items():
@@ -245,9 +520,18 @@ class MetadataBase:
                 )
 
     def _remove_metadata_in_entry(self, entry_name:str, index:int):
+        filename = self._get_element(entry_name=entry_name, index=index, metadata_key=FILENAMES)
         for metadata_key in self._container_metadata[entry_name]:
             del self._container_metadata[entry_name][metadata_key][index]
 
+        # The next rows of the entry move one position up
+        if self._index_files is None or filename is None:
+            return
+        del self._index_files[filename]
+        self._index_entries[entry_name].discard(filename)
+        for row, next_filename in enumerate(self._container_metadata[entry_name][FILENAMES][index:], start=index):
+            self._index_files[next_filename] = (entry_name, row)
+
     def _get_element(self, entry_name:str, index:int, metadata_key:str):
         try:
             return self._container_metadata[entry_name][metadata_key][index]
@@ -320,6 +604,8 @@ class MetadataBase:
                 file_iterator=file_iterator,
             ):
                 del dict_new_files_clear[entry_name]
+        self._flush_header_cache()
+        self._walker.commit()
         self._container_metadata_newfiles = dict_new_files_clear
         return dict_new_files_clear
 
@@ -366,16 +652,28 @@ class MetadataBase:
         return [filename for filename in self._generate_files_in_entry(entry_name=entry_name, relative_path=relative_path)]        
 
     def get_filenames(self, entry_name:str, index:list, relative_path=False):
-        list_filenames = []
-        for ind, filename in enumerate(self._generate_files_in_entry(entry_name=entry_name, relative_path=relative_path)):
-            if ind in index:
-                list_filenames.append(filename)
+        entry_name = self._validate_entry(entry_name=entry_name)
+        if not entry_name:
+            return []
+        filenames = self._container_metadata[entry_name][FILENAMES]
+        # Same order as the entry, without repetitions
+        list_filenames = [filenames[ind] for ind in sorted(set(index)) if 0 <= ind < len(filenames)]
+        if relative_path:
+            return [self._get_relative_path(absolute_path=filename, entry_name=entry_name) for filename in list_filenames]
         return list_filenames        
     
     def get_metadata(self, entry_name:str, index:int, metadata_key: str):
-        for ind, metadata in enumerate(self._generate_metadata_in_entry(entry_name=entry_name, metadata_key=metadata_key)):
-            if ind == index:
-                return metadata
+        entry_name = self._validate_entry(entry_name=entry_name)
+        if not entry_name or index < 0:
+            return
+        return self._get_element(entry_name=entry_name, index=index, metadata_key=metadata_key)
+
+    def get_file_location(self, filename: str) -> tuple:
+        """
+        Returns the entry and the row of a file (or frame address) in the MetadataBase, None if it is not stored
+        """
+        index_files, _ = self._get_index()
+        return index_files.get(str(filename))
 
 
     def get_metadata_in_entry(self, entry_name:str, metadata_key: str):
@@ -384,6 +682,16 @@ class MetadataBase:
     def get_all_metadata_in_entry(self, entry_name:str):
         return self._get_all_metadata_in_entry(entry=entry_name)
 
+    def get_schema(self, entry_name:str) -> dict:
+        """
+        Returns the keys of an entry with the type of their values ('float' or 'string'),
+        every key has one value per file (None if the key is missing in the header of the file)
+        """
+        entry_name = self._validate_entry(entry_name=entry_name)
+        if not entry_name:
+            return
+        return {metadata_key : column_kind(values=values) for metadata_key, values in self._container_metadata[entry_name].items()}
+
     def get_dataframe_metadata(self, entry_name:str, list_keys:list, relative_path=False):
         list_files = self.get_files_in_entry(
             entry_name=entry_name,
@@ -391,6 +699,9 @@ class MetadataBase:
         )
         if not list_files:
             return
+
+        if self._columnar:
+            return self._get_dataframe_columnar(entry_name=entry_name, list_keys=list_keys, list_files=list_files)
         
         short_metadata = defaultdict(list)
 
@@ -409,6 +720,23 @@ class MetadataBase:
         dataframe = pd.DataFrame(short_metadata)
         return dataframe
 
+    def get_failed_files(self) -> dict:
+        """
+        Returns the files whose header could not be read in the last updates, with the error
+        """
+        return dict(self._failed_files)
+
+    def _get_dataframe_columnar(self, entry_name:str, list_keys:list, list_files:list):
+        # The numeric columns are read-only views of the float64 arrays, the strings are categoricals built on the codes
+        metadata = self._container_metadata[self._validate_entry(entry_name=entry_name)]
+        columns = {FILENAMES : list_files}
+        for metadata_key in list_keys:
+            if metadata_key in metadata:
+                columns[metadata_key] = to_pandas(values=metadata[metadata_key])
+            else:
+                logger.warning(f"Error during acceeding to Metadata dataset with key: {metadata_key}")
+        return pd.DataFrame(columns, copy=False)
+
     def get_ponifiles(self, relative_path=False):
         if relative_path:
             return [str(Path(ponifile).relative_to(self._directory)) for ponifile in self._container_ponifiles]
@@ -434,7 +762,22 @@ class MetadataBase:
             output_filename = output_directory.joinpath(f'{self._directory.name}_pyxscat_mdb.json')
 
         with open(output_filename, 'w') as fp:
-            json.dump(self._container_metadata, fp)
+            json.dump(self._get_serializable_container(), fp)
+        self._flush_header_cache()
+
+    def close(self):
+        """
+        Writes the pending headers and closes the header cache, the MetadataBase keeps working without it
+        """
+        if self._header_cache is not None:
+            self._header_cache.close()
+            self._header_cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 class EdfMetadata(MetadataBase):
@@ -445,10 +788,16 @@ class EdfMetadata(MetadataBase):
 
 
 class PoniMetadata(MetadataBase):
+    _index_file = staticmethod(index_ponifile)
+
     def __init__(self, directory):
-        super().__init__(directory=directory, pattern="*.poni")
+        super().__init__(directory=directory, pattern="*.poni", header_cache=False)
+
+    def _read_header_safe(self, filename: str) -> tuple:
+        # .poni files have no header
+        return dict(), None
 
-    def _update_entry_single(self, entry_name: Path, filename: Path):
+    def _update_entry_single(self, entry_name: Path, filename: Path, header: dict = None):
         filename = Path(filename)
 
         # ADDITIONAL METADATA
@@ -462,4 +811,4 @@ class PoniMetadata(MetadataBase):
             output_filename = Path(output_filename).with_suffix('.json')
 
         with open(output_filename, 'w') as fp:
-            json.dump(self._container_metadata, fp)
+            json.dump(self._get_serializable_container(), fp)
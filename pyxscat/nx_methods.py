@@ -1,8 +1,36 @@
+from collections import namedtuple
+from functools import partial
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
+from time import perf_counter
+import zlib
 from silx.io import fabioh5, convert
+from pyxscat.edf import FullHeader
+from pyxscat.other.edf_methods import load_frame
 from pyxscat.other.search_functions import search_files
 
+import h5py
+import numpy as np
+
+from pyxscat.logger_config import setup_logger
+logger = setup_logger()
+
 EXTENSION_H5 = '.h5'
+DEFAULT_COMPRESSION = 'gzip'
+DEFAULT_COMPRESSION_LEVEL = 4
+DEFAULT_BATCH_SIZE = 64
+ENTRY_KEY = 'entry'
+DATA_GROUP_KEY = 'data'
+DATA_KEY = 'data'
+METADATA_GROUP_KEY = 'metadata'
+FILENAMES_KEY = 'filenames'
+FORMAT_STRING = h5py.string_dtype('UTF-8')
+FORMAT_FLOAT = 'float64'
+
+# chunk: bytes of one (1 x H x W) chunk of the stack, already filtered (shuffle, gzip) as HDF5 would do
+# shape, dtype: shape and dtype of the frame
+# nbytes: size of the frame before compression
+EncodedFrame = namedtuple('EncodedFrame', ['chunk', 'shape', 'dtype', 'nbytes'])
 
 def create_h5_from_folder(folder='', wildcards='*.edf', h5_file=''):
 
@@ -12,7 +40,7 @@ def create_h5_from_folder(folder='', wildcards='*.edf', h5_file=''):
         raise FileNotFoundError
     
     fabio_series = get_fabio_serie_from_folder(
-        path_of_files=folder,
+        folder=folder,
         wildcards=wildcards,
     )
 
@@ -51,3 +79,393 @@ def get_fabio_serie_from_folder(folder=str(), wildcards='*.edf'):
     return input_group
 
 
+def encode_chunk(frame=None, compression=DEFAULT_COMPRESSION, compression_opts=DEFAULT_COMPRESSION_LEVEL, shuffle=True) -> EncodedFrame:
+    """
+    Encodes a frame as one chunk of the stack, with the same filter pipeline as HDF5 (byte shuffle, then deflate),
+    so it is written with write_direct_chunk, without being compressed again
+
+    Keyword Arguments:
+        frame -- 2D array (default: {None})
+        compression -- 'gzip' or None, other filters are not encoded (default: {DEFAULT_COMPRESSION})
+        compression_opts -- level of gzip (default: {DEFAULT_COMPRESSION_LEVEL})
+        shuffle -- byte shuffle before the compression (default: {True})
+
+    Returns:
+        EncodedFrame, None if the filter is not supported
+    """
+    if compression not in (None, 'gzip'):
+        return
+    frame = np.ascontiguousarray(frame)
+    buffer = frame.reshape(-1).view(np.uint8)
+    if compression and shuffle and frame.dtype.itemsize > 1:
+        # Byte shuffle: first bytes of every element, then the second bytes...
+        buffer = buffer.reshape(-1, frame.dtype.itemsize).T
+    chunk = buffer.tobytes()
+    if compression:
+        chunk = zlib.compress(chunk, DEFAULT_COMPRESSION_LEVEL if compression_opts is None else compression_opts)
+    return EncodedFrame(chunk=chunk, shape=frame.shape, dtype=frame.dtype, nbytes=frame.nbytes)
+
+
+def _read_file(filename='', chunk_filters=None):
+    """
+    Decodes one file in a worker process. If the filters of the stack are given, the frame is returned
+    as an encoded chunk: the compression runs in the worker and much less data is sent back to the writer
+
+    Keyword Arguments:
+        filename -- path of the file (default: {''})
+        chunk_filters -- (compression, compression_opts, shuffle) of the stack, see FrameStackWriter.chunk_filters (default: {None})
+
+    Returns:
+        tuple with the filename, the data (array or EncodedFrame) and the header (None and the error message if it could not be read)
+    """
+    try:
+        data = load_frame(filename=filename, copy_on_write=False)
+        encoded = encode_chunk(data, *chunk_filters) if chunk_filters is not None else None
+        data = encoded if encoded is not None else np.array(data)
+        header = FullHeader(filename=filename).get_header() or dict()
+        return filename, data, header
+    except Exception as e:
+        return filename, None, str(e)
+
+
+def _as_float(value=None):
+    try:
+        return float(value)
+    except Exception:
+        return
+
+
+class FrameStackWriter:
+    """
+    Appends frames to a single chunked (1 x H x W) and compressed stack, entry/data/data,
+    and their headers as columnar datasets in entry/metadata, one value per frame:
+    float64 for the numerical keys (NaN if missing), strings for the rest (empty if missing).
+    A numerical column that receives a string is converted into a string column.
+    Every frame must have the shape and dtype of the first one, see check_frame.
+    The filenames dataset is written last, so an interrupted conversion can be resumed:
+    every dataset is truncated to the number of recorded filenames when the file is opened again.
+    """
+
+    def __init__(
+        self,
+        h5_file='',
+        entry_name=ENTRY_KEY,
+        compression=DEFAULT_COMPRESSION,
+        compression_opts=DEFAULT_COMPRESSION_LEVEL,
+        shuffle=True,
+        ) -> None:
+        """
+        Keyword Arguments:
+            h5_file -- output HDF5 file, opened in append mode (default: {''})
+            entry_name -- name of the entry group (default: {ENTRY_KEY})
+            compression -- lossless HDF5 filter ('gzip', 'lzf' or a registered filter id) or None (default: {DEFAULT_COMPRESSION})
+            compression_opts -- options of the filter, the level for gzip (default: {DEFAULT_COMPRESSION_LEVEL})
+            shuffle -- byte shuffle before the compression (default: {True})
+        """
+        self._file = h5py.File(h5_file, 'a')
+        self._compression = dict(
+            compression=compression,
+            compression_opts=compression_opts if compression == 'gzip' else None,
+            shuffle=bool(shuffle and compression),
+        )
+
+        self._entry = self._file.require_group(entry_name)
+        self._entry.attrs['NX_class'] = 'NXentry'
+        self._data_group = self._entry.require_group(DATA_GROUP_KEY)
+        self._data_group.attrs['NX_class'] = 'NXdata'
+        self._data_group.attrs['signal'] = DATA_KEY
+        self._metadata_group = self._entry.require_group(METADATA_GROUP_KEY)
+        self._metadata_group.attrs['NX_class'] = 'NXcollection'
+
+        if FILENAMES_KEY not in self._entry:
+            self._entry.create_dataset(FILENAMES_KEY, shape=(0,), maxshape=(None,), dtype=FORMAT_STRING)
+        self._filenames = self._entry[FILENAMES_KEY]
+        self._truncate(nframes=len(self._filenames))
+        # Shape and dtype of the first frame, until the stack is created
+        self._frame_format = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._filenames)
+
+    @property
+    def converted_files(self) -> set:
+        return {filename.decode() if isinstance(filename, bytes) else filename for filename in self._filenames[()]}
+
+    def _truncate(self, nframes=0) -> None:
+        # Drops the rows of an interrupted batch
+        for dataset in [self._data_group.get(DATA_KEY)] + list(self._metadata_group.values()):
+            if dataset is not None and dataset.shape[0] > nframes:
+                dataset.resize(nframes, axis=0)
+
+    @property
+    def chunk_filters(self) -> tuple:
+        """
+        Returns the filters of the stack (those of an existing stack when a conversion is resumed):
+        compression, compression options and shuffle, as needed by encode_chunk
+        """
+        stack = self._data_group.get(DATA_KEY)
+        if stack is not None:
+            return stack.compression, stack.compression_opts, stack.shuffle
+        return self._compression['compression'], self._compression['compression_opts'], self._compression['shuffle']
+
+    def check_frame(self, frame=None) -> str:
+        """
+        Checks that a frame (array or EncodedFrame) has the shape and dtype of the stack (of the first frame if there is no stack yet)
+
+        Returns:
+            str with the error, empty if the frame can be appended
+        """
+        stack = self._data_group.get(DATA_KEY)
+        if stack is not None:
+            shape, dtype = stack.shape[1:], stack.dtype
+        elif self._frame_format is not None:
+            shape, dtype = self._frame_format
+        else:
+            self._frame_format = (tuple(frame.shape), np.dtype(frame.dtype))
+            return ''
+        if tuple(frame.shape) != tuple(shape):
+            return f'shape {tuple(frame.shape)} instead of {tuple(shape)}'
+        if np.dtype(frame.dtype) != np.dtype(dtype):
+            return f'dtype {np.dtype(frame.dtype)} instead of {np.dtype(dtype)}'
+        return ''
+
+    def _get_stack(self, frame=None):
+        if DATA_KEY not in self._data_group:
+            self._data_group.create_dataset(
+                DATA_KEY,
+                shape=(0,) + frame.shape,
+                maxshape=(None,) + frame.shape,
+                chunks=(1,) + frame.shape,
+                dtype=frame.dtype,
+                **self._compression,
+            )
+        return self._data_group[DATA_KEY]
+
+    def _get_column(self, key='', value=None, nframes=0):
+        if key not in self._metadata_group:
+            numerical = _as_float(value) is not None
+            # Columns that appear later are backfilled for the previous frames
+            self._metadata_group.create_dataset(
+                key,
+                data=np.full(nframes, np.nan) if numerical else np.full(nframes, '', dtype=object),
+                maxshape=(None,),
+                chunks=True,
+                dtype=FORMAT_FLOAT if numerical else FORMAT_STRING,
+            )
+        return self._metadata_group[key]
+
+    def _promote_column(self, key=''):
+        # The stored numbers become strings, NaN (missing) becomes an empty string
+        values = self._metadata_group[key][()]
+        del self._metadata_group[key]
+        self._metadata_group.create_dataset(
+            key,
+            data=np.array(['' if np.isnan(value) else str(value) for value in values], dtype=object),
+            maxshape=(None,),
+            chunks=True,
+            dtype=FORMAT_STRING,
+        )
+        logger.info(f'The metadata column {key} is converted into strings.')
+        return self._metadata_group[key]
+
+    def append(self, list_filenames=list(), list_frames=list(), list_headers=list()) -> int:
+        """
+        Appends a batch of frames with their headers and filenames.
+        The frames are arrays or EncodedFrames (written as they are, see encode_chunk and chunk_filters)
+
+        Returns:
+            number of frames in the stack
+        """
+        if not list_filenames:
+            return len(self)
+
+        for filename, frame in zip(list_filenames, list_frames):
+            error = self.check_frame(frame=frame)
+            if error:
+                raise ValueError(f'{filename}: {error}.')
+
+        nframes = len(self)
+        nnew = len(list_filenames)
+        stack = self._get_stack(frame=list_frames[0])
+        stack.resize(nframes + nnew, axis=0)
+        for position, frame in enumerate(list_frames):
+            if isinstance(frame, EncodedFrame):
+                stack.id.write_direct_chunk((nframes + position, 0, 0), frame.chunk)
+            else:
+                stack[nframes + position] = frame
+
+        # A slash would create a subgroup
+        list_headers = [{str(key).replace('/', '_') : value for key, value in header.items()} for header in list_headers]
+        keys = {key for header in list_headers for key in header}
+        for key in sorted(keys):
+            first_value = next(header[key] for header in list_headers if key in header)
+            column = self._get_column(key=key, value=first_value, nframes=nframes)
+            if column.dtype == np.float64 and any(
+                header.get(key) is not None and _as_float(header[key]) is None for header in list_headers
+                ):
+                column = self._promote_column(key=key)
+            if column.dtype == np.float64:
+                values = [_as_float(header.get(key)) for header in list_headers]
+                values = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            else:
+                values = np.array([str(header.get(key, '')) for header in list_headers], dtype=object)
+            column.resize(nframes + nnew, axis=0)
+            column[nframes:] = values
+
+        # Keys missing in this batch
+        for key, column in self._metadata_group.items():
+            if key not in keys:
+                column.resize(nframes + nnew, axis=0)
+                column[nframes:] = np.nan if column.dtype == np.float64 else ''
+
+        self._filenames.resize(nframes + nnew, axis=0)
+        self._filenames[nframes:] = list_filenames
+        self._file.flush()
+        return len(self)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+
+
+def convert_folder_to_h5(
+    folder='',
+    wildcards='*.edf',
+    h5_file='',
+    entry_name=ENTRY_KEY,
+    max_workers=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    compression=DEFAULT_COMPRESSION,
+    compression_opts=DEFAULT_COMPRESSION_LEVEL,
+    shuffle=True,
+    ) -> dict:
+    """
+    Converts the files of a folder into one compressed frame stack with columnar headers.
+    The files are decoded and compressed by a pool of processes, a batch at a time, and written in sorted order:
+    with gzip (or no compression), the workers send the compressed chunks instead of the frames.
+    The files already in the output (from an interrupted or previous conversion) are skipped,
+    the files that cannot be read or whose shape or dtype differ from the first frame are reported as failed.
+
+    Keyword Arguments:
+        folder -- folder with the data files (default: {''})
+        wildcards -- pattern of the files (default: {'*.edf'})
+        h5_file -- output file, <folder>/<folder name>.h5 if empty (default: {''})
+        entry_name -- name of the entry group (default: {ENTRY_KEY})
+        max_workers -- number of decoding processes, the number of CPUs if None (default: {None})
+        batch_size -- number of files decoded before every write (default: {DEFAULT_BATCH_SIZE})
+        compression -- lossless HDF5 filter or None (default: {DEFAULT_COMPRESSION})
+        compression_opts -- options of the filter (default: {DEFAULT_COMPRESSION_LEVEL})
+        shuffle -- byte shuffle before the compression (default: {True})
+
+    Returns:
+        dictionary with the converted, skipped and failed files (and their errors), the bytes, the time and the throughput
+    """
+    folder = Path(folder)
+    if not folder.exists():
+        raise FileNotFoundError
+
+    if not h5_file:
+        h5_file = folder.joinpath(f'{folder.name}{EXTENSION_H5}')
+
+    list_files = search_files(
+        root_directory=folder,
+        wildcards=wildcards,
+        generator=False,
+        as_str=True,
+        recursively=False,
+    )
+    max_workers = max_workers or cpu_count()
+    batch_size = max(int(batch_size), 1)
+
+    report = dict(converted=0, skipped=0, failed=[], errors=dict(), nbytes=0)
+    start = perf_counter()
+    with FrameStackWriter(
+        h5_file=h5_file,
+        entry_name=entry_name,
+        compression=compression,
+        compression_opts=compression_opts,
+        shuffle=shuffle,
+        ) as writer:
+        converted_files = writer.converted_files
+        pending_files = [filename for filename in list_files if filename not in converted_files]
+        report['skipped'] = len(list_files) - len(pending_files)
+        read_file = partial(_read_file, chunk_filters=writer.chunk_filters)
+
+        pool = Pool(processes=max_workers) if max_workers > 1 and len(pending_files) > 1 else None
+        try:
+            for first in range(0, len(pending_files), batch_size):
+                batch = pending_files[first:first + batch_size]
+                results = pool.map(read_file, batch) if pool else [read_file(filename) for filename in batch]
+
+                list_filenames, list_frames, list_headers = [], [], []
+                for filename, data, header in results:
+                    error = header if data is None else writer.check_frame(frame=data)
+                    if error:
+                        logger.error(f'{error}: {filename} could not be converted.')
+                        report['failed'].append(filename)
+                        report['errors'][filename] = error
+                        continue
+                    list_filenames.append(filename)
+                    list_frames.append(data)
+                    list_headers.append(header)
+                    report['nbytes'] += data.nbytes
+
+                writer.append(
+                    list_filenames=list_filenames,
+                    list_frames=list_frames,
+                    list_headers=list_headers,
+                )
+                report['converted'] += len(list_filenames)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    seconds = perf_counter() - start
+    report['seconds'] = seconds
+    report['files_per_second'] = report['converted'] / seconds if seconds else 0.0
+    report['mbytes_per_second'] = report['nbytes'] / 1024**2 / seconds if seconds else 0.0
+    logger.info(
+        f"{folder}: {report['converted']} files converted ({report['skipped']} skipped, {len(report['failed'])} failed) "
+        f"in {seconds:.2f} s, {report['files_per_second']:.1f} files/s, {report['mbytes_per_second']:.1f} MB/s."
+    )
+    return report
+
+
+def convert_tree_to_h5(root_directory='', wildcards='*.edf', output_directory='', **kwargs) -> dict:
+    """
+    Converts every folder with data files under the root directory, one HDF5 file per folder,
+    see convert_folder_to_h5 for the keyword arguments
+
+    Keyword Arguments:
+        root_directory -- root of the folders (default: {''})
+        wildcards -- pattern of the files (default: {'*.edf'})
+        output_directory -- directory of the HDF5 files, inside every folder if empty (default: {''})
+
+    Returns:
+        dictionary with the report of every folder
+    """
+    root_directory = Path(root_directory)
+    if not root_directory.exists():
+        raise FileNotFoundError
+
+    folders = sorted({Path(filename).parent for filename in root_directory.rglob(wildcards)})
+    dict_reports = dict()
+    for folder in folders:
+        h5_file = ''
+        if output_directory:
+            relative_name = '_'.join(folder.relative_to(root_directory).parts) or folder.name
+            h5_file = Path(output_directory).joinpath(f'{relative_name}{EXTENSION_H5}')
+        dict_reports[str(folder)] = convert_folder_to_h5(
+            folder=folder,
+            wildcards=wildcards,
+            h5_file=h5_file,
+            **kwargs,
+        )
+    return dict_reports
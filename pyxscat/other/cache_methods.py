@@ -0,0 +1,513 @@
+from collections import OrderedDict
+from pathlib import Path
+from threading import RLock
+import hashlib
+import os
+
+import numpy as np
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import platformdirs
+except ImportError:
+    platformdirs = None
+
+from pyxscat.logger_config import setup_logger
+logger = setup_logger()
+
+DEFAULT_MAXSIZE = 16
+DEFAULT_MAXBYTES = 64 * 1024**2
+DEFAULT_MESH_CACHE_SIZE = 4
+DEFAULT_MESH_CACHE_BYTES = 1024**3
+DIGEST_SIZE = 16
+DEFAULT_ANGLE_TOLERANCE = 0.0005
+DEFAULT_GEOMETRY_POOL_BYTES = 512 * 1024**2
+ANGLE_DECIMALS = 10
+APP_NAME = 'pyxscat'
+
+
+def get_user_cache_path() -> Path:
+    """
+    Returns the cache directory of the user (platformdirs if available, $XDG_CACHE_HOME or ~/.cache if not),
+    the package directory could be read-only or shared by several users
+    """
+    if platformdirs is not None:
+        return Path(platformdirs.user_cache_dir(APP_NAME))
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home().joinpath('.cache')).joinpath(APP_NAME)
+
+
+MESH_CACHE_PATH = get_user_cache_path().joinpath('mesh_cache')
+
+# Arrays of pygix GrazingGeometry that depend on the angles, removed by every reset()
+# The transformed masks are left out, they depend on the mask and not only on the geometry
+GEOMETRY_ARRAYS = (
+    '_gia_cen', '_gia_crn', '_gia_del',
+    '_giq_cen', '_giq_crn', '_giq_del',
+    '_absa_cen', '_absa_crn', '_absa_del',
+    '_absq_cen', '_absq_crn', '_absq_del',
+)
+
+
+def array_digest(arr=None) -> str:
+    """
+    Returns a fast digest of the content of an array (xxhash if available, blake2b if not),
+    hashing the buffer directly without a tobytes() copy
+
+    Keyword Arguments:
+        arr -- numpy array (default: {None})
+
+    Returns:
+        str with the hexadecimal digest, including shape and dtype
+    """
+    arr = np.asarray(arr)
+    shape = arr.shape
+    if not arr.flags.c_contiguous:
+        arr = np.ascontiguousarray(arr)
+    if xxhash is not None:
+        hasher = xxhash.xxh3_128()
+    else:
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    hasher.update(memoryview(arr.reshape(-1).view(np.uint8)))
+    return f'{shape}{arr.dtype.str}{hasher.hexdigest()}'
+
+
+def sizeof(value=None) -> int:
+    """
+    Returns the size in bytes of an array or a container of arrays
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, (list, tuple)):
+        return sum(sizeof(item) for item in value)
+    elif isinstance(value, dict):
+        return sum(sizeof(item) for item in value.values())
+    return 0
+
+
+def freeze(obj=None):
+    """
+    Returns a hashable version of an object made of dictionaries, lists, tuples, sets and arrays
+
+    Keyword Arguments:
+        obj -- object to be frozen (default: {None})
+
+    Returns:
+        hashable object
+    """
+    if isinstance(obj, dict):
+        return tuple(sorted((str(key), freeze(value)) for key, value in obj.items()))
+    elif isinstance(obj, (list, tuple)):
+        return tuple(freeze(value) for value in obj)
+    elif isinstance(obj, (set, frozenset)):
+        return tuple(sorted(freeze(value) for value in obj))
+    elif isinstance(obj, np.ndarray):
+        return array_digest(obj)
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def poni_key(geometry=None) -> tuple:
+    """
+    Returns a hashable key with the .poni parameters of a pyFAI/pygix geometry
+
+    Keyword Arguments:
+        geometry -- pyFAI Geometry or pygix Transform instance (default: {None})
+
+    Returns:
+        tuple with the .poni parameters and the detector
+    """
+    try:
+        detector_key = (geometry.detector.name, geometry.detector.pixel1, geometry.detector.pixel2)
+    except Exception:
+        detector_key = None
+
+    return (
+        geometry._dist,
+        geometry._poni1,
+        geometry._poni2,
+        geometry._rot1,
+        geometry._rot2,
+        geometry._rot3,
+        geometry._wavelength,
+        detector_key,
+    )
+
+
+def geometry_key(geometry=None) -> tuple:
+    """
+    Returns a hashable key with the parameters that define a pygix geometry: .poni, angles and sample orientation
+
+    Keyword Arguments:
+        geometry -- pygix Transform/GrazingGeometry instance (default: {None})
+
+    Returns:
+        tuple with the geometry parameters
+    """
+    return poni_key(geometry=geometry) + (
+        geometry._incident_angle,
+        geometry._tilt_angle,
+        geometry._sample_orientation,
+        geometry._useqx,
+    )
+
+
+def quantize_angle(angle=0.0, tolerance=DEFAULT_ANGLE_TOLERANCE) -> float:
+    """
+    Rounds an angle to the closest multiple of the tolerance, no rounding if the tolerance is 0.0
+
+    Keyword Arguments:
+        angle -- angle in degrees (default: {0.0})
+        tolerance -- step of the quantization, in degrees (default: {DEFAULT_ANGLE_TOLERANCE})
+
+    Returns:
+        float with the quantized angle
+    """
+    angle = float(angle)
+    if not tolerance:
+        return angle
+    # The second rounding removes the float noise, 0.15 stays 0.15 and not 0.15000000000000002
+    return round(round(angle / tolerance) * tolerance, ANGLE_DECIMALS)
+
+
+class LRUCache:
+    """
+    Thread-safe dictionary that keeps the last used items, up to maxsize items
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, on_evict=None) -> None:
+        """
+        Keyword Arguments:
+            maxsize -- maximum number of items (default: {DEFAULT_MAXSIZE})
+            on_evict -- function (key, value) called for every item removed to make room (default: {None})
+        """
+        self._maxsize = int(maxsize)
+        self._on_evict = on_evict
+        self._container = OrderedDict()
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._container)
+
+    def __contains__(self, key):
+        return key in self._container
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    def get(self, key=None, default=None):
+        with self._lock:
+            try:
+                value = self._container[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._container.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key=None, default=None):
+        """
+        Returns the value without counting a hit or a miss and without changing the order
+        """
+        with self._lock:
+            return self._container.get(key, default)
+
+    def set(self, key=None, value=None) -> None:
+        with self._lock:
+            self._container[key] = value
+            self._container.move_to_end(key)
+            while len(self._container) > self._maxsize:
+                old_key, old_value = self._container.popitem(last=False)
+                if self._on_evict is not None:
+                    self._on_evict(old_key, old_value)
+
+    def pop(self, key=None, default=None):
+        with self._lock:
+            return self._container.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._container.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'items' : len(self._container),
+            'maxsize' : self._maxsize,
+        }
+
+
+class ByteLRUCache(LRUCache):
+    """
+    LRUCache bounded by the total size in bytes of the stored values instead of the number of items
+    """
+
+    def __init__(self, maxbytes=DEFAULT_MAXBYTES) -> None:
+        super().__init__(maxsize=0)
+        self._maxbytes = int(maxbytes)
+        self._sizes = dict()
+        self._nbytes = 0
+
+    @property
+    def maxbytes(self):
+        return self._maxbytes
+
+    @maxbytes.setter
+    def maxbytes(self, maxbytes):
+        with self._lock:
+            self._maxbytes = int(maxbytes)
+            self._evict()
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def _evict(self) -> None:
+        # Removes the least recently used items until the size fits in the budget
+        while self._nbytes > self._maxbytes:
+            old_key, _ = self._container.popitem(last=False)
+            self._nbytes -= self._sizes.pop(old_key)
+
+    def set(self, key=None, value=None) -> None:
+        nbytes = sizeof(value)
+        if nbytes > self._maxbytes:
+            return
+        with self._lock:
+            self.pop(key)
+            self._container[key] = value
+            self._sizes[key] = nbytes
+            self._nbytes += nbytes
+            self._evict()
+
+    def pop(self, key=None, default=None):
+        with self._lock:
+            if key not in self._container:
+                return default
+            self._nbytes -= self._sizes.pop(key)
+            return self._container.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._sizes.clear()
+            self._nbytes = 0
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        del stats['maxsize']
+        stats['nbytes'] = self._nbytes
+        stats['maxbytes'] = self._maxbytes
+        return stats
+
+
+class MeshCache:
+    """
+    Cache of mesh matrices (tuples of 2D arrays): the last used ones are kept in memory and
+    all of them are spilled to .npy files, opened again as memory-maps in later sessions.
+    The files on disk are bounded by bytes: the least recently used meshes are removed first.
+    The returned arrays are read-only.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MESH_CACHE_SIZE, directory=MESH_CACHE_PATH, maxbytes=DEFAULT_MESH_CACHE_BYTES) -> None:
+        """
+        Keyword Arguments:
+            maxsize -- number of meshes kept in memory (default: {DEFAULT_MESH_CACHE_SIZE})
+            directory -- folder for the .npy files, no disk persistence if empty (default: {MESH_CACHE_PATH})
+            maxbytes -- maximum size of the .npy files on disk, in bytes (default: {DEFAULT_MESH_CACHE_BYTES})
+        """
+        self._memory = LRUCache(maxsize=maxsize)
+        self._directory = Path(directory) if directory else None
+        self._maxbytes = int(maxbytes)
+
+    def __len__(self):
+        return len(self._memory)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _get_filenames(self, key=None, nb_arrays=2) -> list:
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=DIGEST_SIZE).hexdigest()
+        return [self._directory.joinpath(f'{digest}_{index}.npy') for index in range(nb_arrays)]
+
+    def get(self, key=None, nb_arrays=2):
+        """
+        Returns the cached arrays of a key, from memory or from the disk, None if not found
+        """
+        mesh = self._memory.get(key)
+        if mesh is not None or self._directory is None:
+            return mesh
+
+        filenames = self._get_filenames(key=key, nb_arrays=nb_arrays)
+        if not all(filename.is_file() for filename in filenames):
+            return
+        try:
+            mesh = tuple(np.load(filename, mmap_mode='r') for filename in filenames)
+            # The mtime of the files is their last use, read by prune()
+            for filename in filenames:
+                os.utime(filename)
+        except Exception as e:
+            logger.error(f'{e}: the mesh {filenames[0].stem} could not be loaded from the cache.')
+            return
+        self._memory.set(key, mesh)
+        return mesh
+
+    def set(self, key=None, mesh=()) -> tuple:
+        """
+        Stores the arrays of a key in memory and on disk
+
+        Returns:
+            tuple with the read-only arrays
+        """
+        mesh = tuple(np.asarray(arr) for arr in mesh)
+        for arr in mesh:
+            arr.flags.writeable = False
+        self._memory.set(key, mesh)
+
+        if self._directory is None:
+            return mesh
+
+        filename_tmp = None
+        try:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            for filename, arr in zip(self._get_filenames(key=key, nb_arrays=len(mesh)), mesh):
+                # Write and rename, another process could be reading the same file
+                filename_tmp = filename.with_suffix(f'.{os.getpid()}.tmp')
+                with open(filename_tmp, 'wb') as f:
+                    np.save(f, arr)
+                os.replace(filename_tmp, filename)
+                filename_tmp = None
+        except Exception as e:
+            logger.error(f'{e}: the mesh could not be saved in {self._directory}.')
+            if filename_tmp is not None:
+                filename_tmp.unlink(missing_ok=True)
+            return mesh
+
+        self.prune()
+        return mesh
+
+    def prune(self) -> int:
+        """
+        Removes the least recently used meshes until the files on disk fit in maxbytes
+
+        Returns:
+            int with the number of bytes on disk after pruning
+        """
+        if self._directory is None or not self._directory.is_dir():
+            return 0
+
+        # All the arrays of a mesh share the digest of the key and are removed together
+        meshes = dict()
+        for filename in self._directory.glob('*.npy'):
+            try:
+                stat = filename.stat()
+            except OSError:
+                continue
+            digest = filename.stem.rsplit('_', 1)[0]
+            mtime, nbytes, filenames = meshes.get(digest, (0, 0, []))
+            meshes[digest] = (max(mtime, stat.st_mtime_ns), nbytes + stat.st_size, filenames + [filename])
+
+        total_bytes = sum(nbytes for _, nbytes, _ in meshes.values())
+        for mtime, nbytes, filenames in sorted(meshes.values(), key=lambda item: item[0]):
+            if total_bytes <= self._maxbytes:
+                break
+            for filename in filenames:
+                filename.unlink(missing_ok=True)
+            total_bytes -= nbytes
+            logger.info(f'Mesh {filenames[0].stem} removed from the disk cache.')
+        return total_bytes
+
+    def clear(self, disk=False) -> None:
+        self._memory.clear()
+        if disk and self._directory is not None and self._directory.is_dir():
+            for filename in self._directory.glob('*.npy'):
+                filename.unlink()
+
+
+class GeometryPool:
+    """
+    Pool of the coordinate and correction arrays of pygix geometries, one item per set of angles.
+    Changing the angles of a geometry resets all its arrays: the pool keeps them, so going back to
+    an angle already used (scans, consecutive frames) does not recalculate anything.
+    """
+
+    def __init__(self, maxbytes=DEFAULT_GEOMETRY_POOL_BYTES) -> None:
+        """
+        Keyword Arguments:
+            maxbytes -- maximum size of the stored arrays, in bytes (default: {DEFAULT_GEOMETRY_POOL_BYTES})
+        """
+        self._cache = ByteLRUCache(maxbytes=maxbytes)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def save(self, geometry=None) -> None:
+        """
+        Stores the arrays already calculated by a geometry, under its current parameters
+        """
+        arrays = {
+            name : getattr(geometry, name, None) for name in GEOMETRY_ARRAYS
+        }
+        arrays = {name : value for name, value in arrays.items() if value is not None}
+        cached_array = dict(getattr(geometry, '_cached_array', None) or {})
+        if not arrays and not cached_array:
+            return
+        self._cache.set(geometry_key(geometry=geometry), (arrays, cached_array))
+
+    def restore(self, geometry=None) -> bool:
+        """
+        Recovers the arrays stored for the current parameters of a geometry
+
+        Returns:
+            bool, True if the arrays were found in the pool
+        """
+        item = self._cache.get(geometry_key(geometry=geometry))
+        if item is None:
+            return False
+        arrays, cached_array = item
+        for name, value in arrays.items():
+            setattr(geometry, name, value)
+        if getattr(geometry, '_cached_array', None) is not None:
+            geometry._cached_array.update(cached_array)
+        return True
+
+
+_mesh_cache = None
+
+def get_mesh_cache() -> MeshCache:
+    """
+    Returns the MeshCache shared by all the integrators of the process
+    """
+    global _mesh_cache
+    if _mesh_cache is None:
+        _mesh_cache = MeshCache()
+    return _mesh_cache
+
+
+_geometry_pool = None
+
+def get_geometry_pool() -> GeometryPool:
+    """
+    Returns the GeometryPool shared by all the integrators of the process
+    """
+    global _geometry_pool
+    if _geometry_pool is None:
+        _geometry_pool = GeometryPool()
+    return _geometry_pool
@@ -0,0 +1,245 @@
+from collections import namedtuple
+from pathlib import Path
+
+from fabio.cbfimage import CIF, DATA_TYPES
+
+import numpy as np
+
+BLOCKSIZE = 512
+MAX_HEADER_SIZE = 512 * 1024
+CBF_SUFFIXES = ('.cbf',)
+BINARY_SECTION = b"--CIF-BINARY-FORMAT-SECTION--"
+STARTER = b"\x0c\x1a\x04\xd5"
+CIF_BINARY_BLOCK_KEY = "_array_data.data"
+BYTE_OFFSET = "x-CBF_BYTE_OFFSET"
+BYTE_ORDERS = {
+    'LITTLE_ENDIAN' : '<',
+    'BIG_ENDIAN' : '>',
+}
+# Escape codes of the byte offset compression: the next 2, 4 or 8 bytes hold the difference
+ESCAPE_8 = -0x80
+ESCAPE_16 = -0x8000
+ESCAPE_32 = -0x80000000
+
+ERROR_CBF_HEADER = "The binary section of the .cbf file could not be found."
+ERROR_CBF_COMPRESSION = "Only the byte offset compression is supported."
+
+# header: dictionary with the CIF items and the MIME keys of the binary section, the same as fabio
+# offset: position in the file of the first byte of the compressed data
+# size: number of bytes of the compressed data
+# dtype: numpy dtype of the decompressed data, with the byte order
+# shape: shape of the frame (Second-Dimension, Fastest-Dimension)
+CbfHeader = namedtuple('CbfHeader', ['header', 'offset', 'size', 'dtype', 'shape'])
+
+
+def is_cbf_file(filename='') -> bool:
+    return Path(filename).suffix.lower() in CBF_SUFFIXES
+
+
+def _parse_binary_section(binary_header=b'') -> dict:
+    """
+    Parses the 'key: value' MIME lines of the binary section, with the same rules as fabio
+    """
+    header = {}
+    for line in binary_header.split(b"\n")[1:]:
+        if len(line) < 10:
+            break
+        try:
+            key, value = line.split(b":", 1)
+        except ValueError:
+            key, value = line.split(b"=", 1)
+        header[key.strip().decode("ASCII")] = value.strip(b' "\n\r\t').decode("ASCII")
+    return header
+
+
+def read_cbf_header(filename='') -> CbfHeader:
+    """
+    Reads the CIF header (with the detector mini-header) and the binary section header of a .cbf file,
+    in blocks of 512 bytes, stopping before the first byte of compressed data
+
+    Keyword Arguments:
+        filename -- path of the .cbf file (default: {''})
+
+    Returns:
+        CbfHeader with the header, the offset and size of the compressed data, its dtype and shape
+    """
+    with open(filename, 'rb') as f:
+        blocks = bytearray()
+        while True:
+            block = f.read(BLOCKSIZE)
+            if not block:
+                raise ValueError(ERROR_CBF_HEADER)
+            blocks += block
+            start_binary = blocks.find(STARTER, max(len(blocks) - len(block) - len(STARTER), 0))
+            if start_binary >= 0:
+                break
+            if len(blocks) > MAX_HEADER_SIZE:
+                raise ValueError(ERROR_CBF_HEADER)
+
+    start_section = blocks.find(BINARY_SECTION)
+    if start_section < 0 or start_section > start_binary:
+        raise ValueError(ERROR_CBF_HEADER)
+
+    # The CIF parser of fabio only sees the text, the binary block is replaced by a placeholder
+    cif = CIF()
+    cif._parseCIF(bytes(blocks[:start_section]) + b"CIF Binary Section\n;\n")
+    header = {}
+    for key, value in cif.items():
+        if key == CIF_BINARY_BLOCK_KEY:
+            continue
+        if isinstance(value, str):
+            value = value.strip(' "\n\r\t')
+        header[key] = value
+    header.update(_parse_binary_section(binary_header=bytes(blocks[start_section:start_binary])))
+
+    try:
+        byte_order = BYTE_ORDERS.get(header.get('X-Binary-Element-Byte-Order'), '<')
+        dtype = np.dtype(DATA_TYPES.get(header.get('X-Binary-Element-Type'), 'int32')).newbyteorder(byte_order)
+    except Exception:
+        dtype = None
+
+    try:
+        shape = (int(header['X-Binary-Size-Second-Dimension']), int(header['X-Binary-Size-Fastest-Dimension']))
+    except Exception:
+        shape = None
+
+    try:
+        size = int(header['X-Binary-Size'])
+    except Exception:
+        size = None
+
+    return CbfHeader(
+        header=header,
+        offset=start_binary + len(STARTER),
+        size=size,
+        dtype=dtype,
+        shape=shape,
+    )
+
+
+MAX_ESCAPE_ITERATIONS = 32
+PADDING = 16
+
+
+def _read_int(u8=None, positions=None, nbytes=2) -> np.array:
+    # Little-endian signed integers of nbytes starting at every position
+    value = np.zeros(positions.size, dtype=np.uint64)
+    for byte in range(nbytes):
+        value |= u8[positions + byte].astype(np.uint64) << np.uint64(8 * byte)
+    if nbytes == 8:
+        return value.view(np.int64)
+    value = value.astype(np.int64)
+    return value - (value >= 2**(8 * nbytes - 1)) * 2**(8 * nbytes)
+
+
+def _decode_escapes(u8=None, escapes=None) -> tuple:
+    """
+    Returns the difference and the number of extra bytes (2, 6 or 14) of every escape code
+    """
+    delta = _read_int(u8=u8, positions=escapes + 1, nbytes=2)
+    length = np.full(escapes.size, 2, dtype=np.int64)
+
+    wide = np.flatnonzero(delta == ESCAPE_16)
+    if wide.size:
+        delta[wide] = _read_int(u8=u8, positions=escapes[wide] + 3, nbytes=4)
+        length[wide] = 6
+        wider = wide[delta[wide] == ESCAPE_32]
+        if wider.size:
+            delta[wider] = _read_int(u8=u8, positions=escapes[wider] + 7, nbytes=8)
+            length[wider] = 14
+    return delta, length
+
+
+def _valid_escapes(u8=None, candidates=None) -> tuple:
+    """
+    Discards the escape codes that are part of the extra bytes of a previous escape.
+    A candidate is valid if it is not covered by the previous valid one; the rule is applied to all the candidates at once
+    until nothing changes, which gives the same result as a sequential scan
+    """
+    delta_all, length_all = _decode_escapes(u8=u8, escapes=candidates)
+    end_all = candidates + length_all
+    indices = np.arange(candidates.size)
+    valid = np.ones(candidates.size, dtype=bool)
+    for _ in range(MAX_ESCAPE_ITERATIONS):
+        # Index of the previous valid candidate of every candidate (-1 if none)
+        previous = np.maximum.accumulate(np.where(valid, indices, -1))
+        previous = np.concatenate(([-1], previous[:-1]))
+        new_valid = (previous < 0) | (candidates > end_all[previous])
+        if np.array_equal(new_valid, valid):
+            break
+        valid = new_valid
+    else:
+        # Long chains of escape codes inside extra bytes, sequential scan
+        valid[:] = False
+        end = -1
+        for index, candidate in enumerate(candidates):
+            if candidate > end:
+                valid[index] = True
+                end = candidate + length_all[index]
+    return candidates[valid], delta_all[valid], length_all[valid]
+
+
+def decompress_byte_offset(stream=b'', nelements=0, out=None, dtype=np.int32) -> np.array:
+    """
+    Decompresses a byte offset stream into a buffer, vectorized: the escape codes are located and decoded at once,
+    the one-byte differences are copied, and the values are accumulated in place
+
+    Keyword Arguments:
+        stream -- compressed bytes (default: {b''})
+        nelements -- number of elements of the output (default: {0})
+        out -- 1D integer buffer with nelements, allocated if None (default: {None})
+        dtype -- dtype of the allocated buffer (default: {np.int32})
+
+    Returns:
+        1D array with the decompressed values (out, if given)
+    """
+    if out is None:
+        out = np.empty(nelements, dtype=dtype)
+    raw = np.frombuffer(stream, dtype=np.int8)
+    # Padding, the extra bytes of the last escape codes are read without bound checks
+    u8 = np.concatenate([raw.view(np.uint8), np.zeros(PADDING, dtype=np.uint8)])
+
+    candidates = np.flatnonzero(raw == ESCAPE_8)
+    if not candidates.size:
+        out[:] = raw[:out.size]
+    else:
+        escapes, delta, length = _valid_escapes(u8=u8, candidates=candidates)
+
+        # Remove the extra bytes, every escape code stays as one element
+        keep = np.ones(raw.size, dtype=bool)
+        offsets = np.cumsum(length) - length
+        extra = np.repeat(escapes + 1 - offsets, length) + np.arange(length.sum())
+        keep[extra[extra < raw.size]] = False
+        out[:] = raw[keep][:out.size]
+        # Position of every escape code in the output, wrapped into the dtype of the buffer
+        out[escapes - offsets] = delta.astype(out.dtype)
+
+    np.cumsum(out, out=out)
+    return out
+
+
+def load_cbf_frame(filename='', cbf_header=None) -> np.array:
+    """
+    Reads only the compressed bytes of a .cbf file and decompresses them into a preallocated array
+
+    Keyword Arguments:
+        filename -- path of the .cbf file (default: {''})
+        cbf_header -- CbfHeader of the file, read if None (default: {None})
+
+    Returns:
+        2D array with the dtype of the file
+    """
+    if cbf_header is None:
+        cbf_header = read_cbf_header(filename=filename)
+    if cbf_header.header.get('conversions') != BYTE_OFFSET:
+        raise ValueError(ERROR_CBF_COMPRESSION)
+
+    with open(filename, 'rb') as f:
+        f.seek(cbf_header.offset)
+        stream = f.read(cbf_header.size) if cbf_header.size is not None else f.read()
+
+    dtype = cbf_header.dtype.newbyteorder('=')
+    frame = np.empty(cbf_header.shape, dtype=dtype)
+    # Unsigned data are accumulated in a signed view of the same buffer, the bits are the same
+    decompress_byte_offset(stream=stream, nelements=frame.size, out=frame.reshape(-1).view(f'i{dtype.itemsize}'))
+    return frame
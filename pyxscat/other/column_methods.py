@@ -0,0 +1,323 @@
+import numpy as np
+import pandas as pd
+
+FLOAT = 'float'
+STRING = 'string'
+INITIAL_CAPACITY = 16
+MISSING_CODE = -1
+# Value of a key missing in a header: null in .json files, NaN in numeric arrays
+MISSING_VALUE = None
+
+
+def parse_value(value=None):
+    """
+    Returns the value of a header as a float if possible, as a string if not
+    """
+    try:
+        return float(value)
+    except Exception:
+        return str(value)
+
+
+def parse_header(header=dict()) -> dict:
+    return {metadata_key : parse_value(value=metadata_value) for metadata_key, metadata_value in header.items()}
+
+
+def append_row(metadata=None, row=dict(), missing=MISSING_VALUE) -> None:
+    """
+    Appends one value to every column of a table (dictionary of lists or MetadataColumns), keeping the columns aligned:
+    the keys missing in the row are backfilled, new keys are filled for the previous rows (column union)
+
+    Keyword Arguments:
+        metadata -- defaultdict of columns, the new columns are created by its factory (default: {None})
+        row -- dictionary with the values of the row (default: {dict()})
+        missing -- value of the missing keys (default: {MISSING_VALUE})
+    """
+    nrows = max((len(values) for values in metadata.values()), default=0)
+    for metadata_key in row:
+        if metadata_key not in metadata:
+            metadata[metadata_key].extend([missing] * nrows)
+
+    for metadata_key, values in metadata.items():
+        # Columns shorter than the table (ragged tables written by older versions) are padded at the end
+        if len(values) < nrows:
+            values.extend([missing] * (nrows - len(values)))
+        values.append(row.get(metadata_key, missing))
+
+
+def column_kind(values=()) -> str:
+    """
+    Returns FLOAT if all the stored values of a column are numbers, STRING if not
+    """
+    if isinstance(values, MetadataColumn):
+        return values.kind or FLOAT
+    if all(value is MISSING_VALUE or isinstance(value, (int, float, np.number)) for value in values):
+        return FLOAT
+    return STRING
+
+
+def to_array(values=()) -> np.array:
+    """
+    Returns a column as a numpy array for the writers: float64 with NaN for missing values,
+    or an object array of strings with '' for missing values
+    """
+    if column_kind(values=values) == FLOAT:
+        if isinstance(values, MetadataColumn):
+            return np.array(values.to_numpy(), dtype=np.float64)
+        return np.array([np.nan if value is MISSING_VALUE else value for value in values], dtype=np.float64)
+    return np.array(['' if value is MISSING_VALUE else str(value) for value in values], dtype=object)
+
+
+def to_pandas(values=()):
+    """
+    Returns a column for a pandas DataFrame: without a copy for a MetadataColumn, the list itself if not
+    """
+    if isinstance(values, MetadataColumn):
+        return values.to_pandas()
+    return values
+
+
+def codes_dtype(ncategories=0) -> np.dtype:
+    """
+    Returns the smallest integer dtype for the codes of a number of categories, the same one chosen by pandas,
+    so the codes can be given to pd.Categorical without a copy
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if ncategories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _read_only(arr=None) -> np.array:
+    arr = arr.view()
+    arr.flags.writeable = False
+    return arr
+
+
+class MetadataColumn:
+    """
+    Growable, typed column of metadata values, used as a list.
+    Numeric values are stored in a float64 array with a validity mask; strings are dictionary-encoded:
+    integer codes (-1 for missing values) and a list of unique categories.
+    A numeric column that receives a string is converted into a string column.
+    Missing values (None) are returned as None.
+    """
+
+    def __init__(self, values=()) -> None:
+        self._kind = None
+        self._size = 0
+        self._values = None
+        self._valid = None
+        self._codes = None
+        self._categories = list()
+        self._category_codes = dict()
+        self.extend(values)
+
+    @property
+    def kind(self):
+        return self._kind
+
+    @property
+    def categories(self) -> list:
+        return list(self._categories)
+
+    @property
+    def nbytes(self) -> int:
+        if self._kind == FLOAT:
+            return self._values.nbytes + self._valid.nbytes
+        if self._kind == STRING:
+            return self._codes.nbytes
+        return 0
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return f"MetadataColumn({self.to_list()!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, (MetadataColumn, list, tuple)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def _init_kind(self, kind=FLOAT) -> None:
+        self._kind = kind
+        if kind == FLOAT:
+            self._values = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+            self._valid = np.empty(INITIAL_CAPACITY, dtype=bool)
+        else:
+            self._codes = np.empty(INITIAL_CAPACITY, dtype=codes_dtype(0))
+
+    def _grow(self, arr=None, capacity=0, dtype=None) -> np.array:
+        new_arr = np.empty(capacity, dtype=dtype or arr.dtype)
+        new_arr[:self._size] = arr[:self._size]
+        return new_arr
+
+    def _reserve(self, size=0) -> None:
+        # The capacity is doubled when the buffers are full
+        if self._kind == FLOAT:
+            if size > self._values.size:
+                capacity = max(size, 2 * self._values.size)
+                self._values = self._grow(arr=self._values, capacity=capacity)
+                self._valid = self._grow(arr=self._valid, capacity=capacity)
+        elif size > self._codes.size:
+            self._codes = self._grow(arr=self._codes, capacity=max(size, 2 * self._codes.size))
+
+    def _get_code(self, value='') -> int:
+        code = self._category_codes.get(value)
+        if code is None:
+            code = len(self._categories)
+            self._categories.append(value)
+            self._category_codes[value] = code
+            dtype = codes_dtype(len(self._categories))
+            if dtype != self._codes.dtype:
+                self._codes = self._grow(arr=self._codes, capacity=self._codes.size, dtype=dtype)
+        return code
+
+    def _to_string(self) -> None:
+        # The stored numbers become strings, as they would be written by str()
+        values, valid = self._values[:self._size], self._valid[:self._size]
+        self._values, self._valid = None, None
+        self._init_kind(kind=STRING)
+        self._reserve(size=self._size)
+        self._size = 0
+        for value, is_valid in zip(values.tolist(), valid.tolist()):
+            self._append_string(value=str(value) if is_valid else None)
+
+    def _append_string(self, value=None) -> None:
+        code = MISSING_CODE if value is None else self._get_code(value=value)
+        self._reserve(size=self._size + 1)
+        self._codes[self._size] = code
+        self._size += 1
+
+    def append(self, value=None) -> None:
+        # Fast path, the most common value of a header
+        if self._kind == FLOAT and type(value) is float:
+            size = self._size
+            if size == self._values.size:
+                self._reserve(size=size + 1)
+            self._values[size] = value
+            self._valid[size] = True
+            self._size = size + 1
+            return
+
+        is_number = isinstance(value, (int, float, np.number)) or value is None
+        if self._kind is None:
+            self._init_kind(kind=FLOAT if is_number else STRING)
+        elif self._kind == FLOAT and not is_number:
+            self._to_string()
+
+        if self._kind == STRING:
+            self._append_string(value=None if value is None else str(value))
+            return
+
+        self._reserve(size=self._size + 1)
+        self._valid[self._size] = value is not None
+        self._values[self._size] = np.nan if value is None else value
+        self._size += 1
+
+    def extend(self, values=()) -> None:
+        for value in values:
+            self.append(value)
+
+    def _get_item(self, index=0):
+        if self._kind == FLOAT:
+            return self._values[index].item() if self._valid[index] else None
+        code = int(self._codes[index])
+        return None if code == MISSING_CODE else self._categories[code]
+
+    def __getitem__(self, index=0):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        index = int(index)
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('MetadataColumn index out of range')
+        return self._get_item(index=index)
+
+    def __delitem__(self, index=0) -> None:
+        index = int(index)
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('MetadataColumn index out of range')
+        # The next rows move one position up, the categories are kept
+        buffers = (self._values, self._valid) if self._kind == FLOAT else (self._codes,)
+        for buffer in buffers:
+            buffer[index:self._size - 1] = buffer[index + 1:self._size]
+        self._size -= 1
+
+    def __iter__(self):
+        yield from self.to_list()
+
+    def to_list(self) -> list:
+        if self._kind is None:
+            return []
+        if self._kind == FLOAT:
+            values = self._values[:self._size].tolist()
+            for index in np.flatnonzero(~self._valid[:self._size]).tolist():
+                values[index] = None
+            return values
+        categories = self._categories + [None]
+        return [categories[code] for code in self._codes[:self._size].tolist()]
+
+    @property
+    def mask(self) -> np.array:
+        """
+        Read-only boolean array, True for the stored values and False for the missing ones
+        """
+        if self._kind == FLOAT:
+            return _read_only(self._valid[:self._size])
+        if self._kind == STRING:
+            return _read_only(self._codes[:self._size] != MISSING_CODE)
+        return np.zeros(0, dtype=bool)
+
+    def to_numpy(self) -> np.array:
+        """
+        Returns a read-only view of the values (float64 with NaN for missing values) or of the codes of a string column
+        """
+        if self._kind == FLOAT:
+            return _read_only(self._values[:self._size])
+        if self._kind == STRING:
+            return _read_only(self._codes[:self._size])
+        return np.zeros(0, dtype=np.float64)
+
+    def to_pandas(self):
+        """
+        Returns the column for a pandas DataFrame without copying the values:
+        a read-only float64 view, or a pd.Categorical built on the codes
+        """
+        if self._kind == STRING:
+            return pd.Categorical.from_codes(self.to_numpy(), categories=self._categories)
+        return self.to_numpy()
+
+
+class MetadataTable(dict):
+    """
+    Columns of an entry, created on first use: MetadataColumns, except the keys with a different value in every row
+    (filenames), kept as lists since a dictionary encoding would store every value anyway and add the codes
+    """
+
+    def __init__(self, metadata=None, list_keys=()) -> None:
+        """
+        Keyword Arguments:
+            metadata -- dictionary with the values of every key (default: {None})
+            list_keys -- keys stored as lists (default: {()})
+        """
+        super().__init__()
+        self.list_keys = frozenset(list_keys)
+        for metadata_key, values in (metadata or dict()).items():
+            self[metadata_key] = self.new_column(metadata_key=metadata_key, values=values)
+
+    def new_column(self, metadata_key='', values=()):
+        if metadata_key in self.list_keys:
+            return list(values)
+        return MetadataColumn(values=values)
+
+    def __missing__(self, metadata_key=''):
+        column = self.new_column(metadata_key=metadata_key)
+        self[metadata_key] = column
+        return column
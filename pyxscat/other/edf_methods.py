@@ -0,0 +1,213 @@
+from collections import namedtuple
+from pathlib import Path
+import bz2
+import gzip
+import re
+import string
+
+import fabio
+from fabio.edfimage import DATA_TYPES
+
+from pyxscat.other.cbf_methods import is_cbf_file, read_cbf_header, load_cbf_frame
+from pyxscat.other.tiff_methods import is_tiff_file, read_tiff_header, open_tiff_memmap
+
+import numpy as np
+
+BLOCKSIZE = 512
+MAX_HEADER_SIZE = 512 * 1024
+EDF_SUFFIXES = ('.edf',)
+COMPRESSED_SUFFIXES = {
+    '.gz' : gzip.open,
+    '.bz2' : bz2.open,
+}
+BYTE_ORDERS = {
+    'LowByteFirst' : '<',
+    'HighByteFirst' : '>',
+}
+NO_COMPRESSION = ('', 'none', 'nocompression')
+HEADER_END_PATTERN = re.compile(b"}(\r{0,1})\n")
+HEADER_WHITESPACE = (string.whitespace + "\x00").encode("ASCII")
+
+ERROR_EDF_HEADER = "The header block of the .edf file could not be found."
+
+# header: dictionary with the raw (string) values, the same as fabio
+# offset: position in the file of the first byte of the binary data
+# dtype: numpy dtype of the binary data, with the byte order
+# shape: shape of the frame (Dim_2, Dim_1)
+# compressed: True if the binary data (or the whole file) is compressed
+EdfHeader = namedtuple('EdfHeader', ['header', 'offset', 'dtype', 'shape', 'compressed'])
+
+
+def is_edf_file(filename='') -> bool:
+    """
+    Returns True if the file has .edf suffix (compressed or not)
+    """
+    suffixes = [suffix.lower() for suffix in Path(filename).suffixes[-2:]]
+    return any(suffix in EDF_SUFFIXES for suffix in suffixes)
+
+
+def _open_edf(filename=''):
+    """
+    Returns a binary file object, decompressing on the fly .gz and .bz2 files
+    """
+    open_function = COMPRESSED_SUFFIXES.get(Path(filename).suffix.lower(), open)
+    return open_function(filename, 'rb')
+
+
+def _parse_header_block(header_block=b'') -> dict:
+    """
+    Parses the 'key = value ;' lines of a header block, with the same rules as fabio
+    """
+    header = {}
+    for line in header_block.split(b";"):
+        if b"=" not in line:
+            continue
+        key, value = line.split(b"=", 1)
+        try:
+            key = key.strip(HEADER_WHITESPACE).decode("ASCII")
+            value = value.strip(HEADER_WHITESPACE).decode("ASCII")
+        except UnicodeDecodeError:
+            continue
+        # The first value of a duplicated key is kept
+        header.setdefault(key, value)
+    return header
+
+
+def read_edf_header(filename='') -> EdfHeader:
+    """
+    Reads only the ASCII header of the first frame of an .edf file, in blocks of 512 bytes, without any pixel
+
+    Keyword Arguments:
+        filename -- path of the .edf file (default: {''})
+
+    Returns:
+        EdfHeader with the raw header, the offset, dtype and shape of the binary data
+    """
+    with _open_edf(filename=filename) as f:
+        blocks = bytearray()
+        while True:
+            block = f.read(BLOCKSIZE)
+            if not block:
+                raise ValueError(ERROR_EDF_HEADER)
+            blocks += block
+            # Search from the last block, the end pattern could be split between two blocks
+            end = HEADER_END_PATTERN.search(blocks, max(len(blocks) - len(block) - 2, 0))
+            if end is not None:
+                break
+            if len(blocks) > MAX_HEADER_SIZE:
+                raise ValueError(ERROR_EDF_HEADER)
+
+    begin = blocks.find(b"{")
+    if begin < 0 or blocks[:begin].strip() or begin > end.start():
+        raise ValueError(ERROR_EDF_HEADER)
+
+    header = _parse_header_block(header_block=bytes(blocks[begin + 1:end.start()]))
+
+    try:
+        byte_order = BYTE_ORDERS.get(header.get('ByteOrder'), '<')
+        dtype = np.dtype(DATA_TYPES[header['DataType']]).newbyteorder(byte_order)
+    except Exception:
+        dtype = None
+
+    try:
+        shape = (int(header['Dim_2']), int(header['Dim_1']))
+    except Exception:
+        try:
+            shape = (int(header['Dim_1']),)
+        except Exception:
+            shape = None
+
+    compressed = (
+        Path(filename).suffix.lower() in COMPRESSED_SUFFIXES
+        or header.get('Compression', '').lower() not in NO_COMPRESSION
+    )
+
+    return EdfHeader(
+        header=header,
+        offset=end.end(),
+        dtype=dtype,
+        shape=shape,
+        compressed=compressed,
+    )
+
+
+def open_edf_memmap(filename='', edf_header=None, copy_on_write=False):
+    """
+    Maps the binary data of an uncompressed .edf file, nothing is read until the pixels are accessed
+
+    Keyword Arguments:
+        filename -- path of the .edf file (default: {''})
+        edf_header -- EdfHeader of the file, read if None (default: {None})
+        copy_on_write -- if True, the array can be modified in memory without changing the file,
+            if False, it is read-only (default: {False})
+
+    Returns:
+        np.memmap with the dtype and byte order of the file, None if the data is compressed or not valid
+    """
+    if edf_header is None:
+        edf_header = read_edf_header(filename=filename)
+
+    if edf_header.compressed or edf_header.dtype is None or edf_header.shape is None:
+        return
+
+    return np.memmap(
+        filename,
+        dtype=edf_header.dtype,
+        mode='c' if copy_on_write else 'r',
+        offset=edf_header.offset,
+        shape=edf_header.shape,
+    )
+
+
+def as_dtype(data=None, dtype=None) -> np.array:
+    """
+    Returns the same array if it already has the dtype (or dtype is None), a converted copy if not
+    """
+    if data is None or dtype is None or data.dtype == np.dtype(dtype):
+        return data
+    return data.astype(dtype)
+
+
+def read_raw_header(filename='') -> dict:
+    """
+    Returns the raw header of a file reading only the header: .edf, .cbf and TIFF files, fabio for the rest
+    """
+    try:
+        if is_edf_file(filename):
+            return dict(read_edf_header(filename=filename).header)
+        elif is_cbf_file(filename):
+            return read_cbf_header(filename=filename).header
+        elif is_tiff_file(filename):
+            return read_tiff_header(filename=filename).header
+    except Exception:
+        pass
+    return dict(fabio.open(filename).header)
+
+
+def load_frame(filename='', dtype=None, copy_on_write=True) -> np.array:
+    """
+    Returns the data of a frame: memory-mapped for uncompressed .edf and TIFF files,
+    decompressed into a new array for byte offset .cbf files, read by fabio for the rest
+
+    Keyword Arguments:
+        filename -- path of the file (default: {''})
+        dtype -- if any, the data is converted to this dtype (default: {None})
+        copy_on_write -- the memory-mapped array can be modified without changing the file (default: {True})
+
+    Returns:
+        np.array with the data
+    """
+    data = None
+    try:
+        if is_edf_file(filename):
+            data = open_edf_memmap(filename=filename, copy_on_write=copy_on_write)
+        elif is_cbf_file(filename):
+            data = load_cbf_frame(filename=filename)
+        elif is_tiff_file(filename):
+            data = open_tiff_memmap(filename=filename, copy_on_write=copy_on_write)
+    except Exception:
+        data = None
+
+    if data is None:
+        data = fabio.open(filename).data
+    return as_dtype(data=data, dtype=dtype)
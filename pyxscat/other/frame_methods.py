@@ -0,0 +1,443 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock
+import os
+
+from pyxscat.other.cache_methods import ByteLRUCache, LRUCache
+from pyxscat.other.edf_methods import is_edf_file, load_frame, read_edf_header
+from pyxscat.other.source_methods import frame_address, split_address, get_source_pool
+
+import numpy as np
+
+DEFAULT_FRAME_CACHE_BYTES = 512 * 1024**2
+DEFAULT_HEADER_CACHE_SIZE = 4096
+DEFAULT_PREFETCH_FRAMES = 4
+DEFAULT_PREFETCH_WORKERS = 2
+AVERAGE_WORKERS = 4
+
+
+def file_key(filename='') -> tuple:
+    """
+    Returns a key that identifies the content of a file (or a frame of a container 'path::index'):
+    absolute path, modification time and size
+
+    Keyword Arguments:
+        filename -- path of the file or address of the frame (default: {''})
+
+    Returns:
+        tuple with the absolute path (or address), the mtime in ns and the size in bytes of the file
+    """
+    filename, index = split_address(filename)
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    if index is not None:
+        filename = frame_address(filename=filename, index=index)
+    return (filename, stat.st_mtime_ns, stat.st_size)
+
+
+def load_address(address='') -> np.array:
+    """
+    Returns the data of a file (read-only memory-map for uncompressed .edf files) or of a frame of a container
+    """
+    if split_address(address)[1] is not None:
+        return get_source_pool().get_frame(address=address)
+    return load_frame(filename=address, copy_on_write=False)
+
+
+class FrameCache:
+    """
+    Cache of frames (read-only arrays in memory) and .edf headers, keyed by (path, mtime, size),
+    so a modified file is never served from the cache. The frames are bounded by their total size in bytes (maxbytes,
+    which can be changed at any time), and the hits and misses are counted.
+    Several threads can ask for the same file at the same time, it is read only once.
+    """
+
+    def __init__(self, maxbytes=DEFAULT_FRAME_CACHE_BYTES, maxheaders=DEFAULT_HEADER_CACHE_SIZE) -> None:
+        """
+        Keyword Arguments:
+            maxbytes -- memory budget of the frames, in bytes (default: {DEFAULT_FRAME_CACHE_BYTES})
+            maxheaders -- number of headers kept (default: {DEFAULT_HEADER_CACHE_SIZE})
+        """
+        self._frames = ByteLRUCache(maxbytes=maxbytes)
+        self._headers = LRUCache(maxsize=maxheaders)
+        self._lock = Lock()
+        self._key_locks = dict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, filename):
+        try:
+            return file_key(filename) in self._frames
+        except OSError:
+            return False
+
+    @property
+    def maxbytes(self):
+        return self._frames.maxbytes
+
+    @maxbytes.setter
+    def maxbytes(self, maxbytes):
+        # The least recently used frames are released if the new budget is smaller
+        self._frames.maxbytes = maxbytes
+
+    @property
+    def nbytes(self):
+        return self._frames.nbytes
+
+    def stats(self) -> dict:
+        """
+        Returns the hits, misses, number of frames and bytes in use of the frames, and the hits and misses of the headers
+        """
+        stats = self._frames.stats()
+        headers_stats = self._headers.stats()
+        stats['header_hits'] = headers_stats['hits']
+        stats['header_misses'] = headers_stats['misses']
+        return stats
+
+    @contextmanager
+    def _key_lock(self, key=None):
+        """
+        Holds the lock of one key. The locks are counted: a lock is removed only when no thread holds it
+        nor waits for it, so all the threads asking for the same key share the same lock
+        """
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = [Lock(), 0]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                yield
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self._key_locks[key]
+
+    def peek(self, filename=''):
+        """
+        Returns the frame only if it is already in memory, None if not (nothing is read)
+        """
+        try:
+            return self._frames.peek(file_key(filename))
+        except OSError:
+            return
+
+    def get_frame(self, filename='') -> np.array:
+        """
+        Returns the read-only data of a file, from memory if it was already read
+
+        Keyword Arguments:
+            filename -- path of the file or address of a frame 'path::index' (default: {''})
+
+        Returns:
+            read-only np.array with the dtype of the file
+        """
+        key = file_key(filename)
+        frame = self._frames.get(key)
+        if frame is not None:
+            return frame
+
+        with self._key_lock(key):
+            # Another thread could have read it meanwhile
+            frame = self._frames.peek(key)
+            if frame is None:
+                frame = np.array(load_address(address=key[0]))
+                frame.flags.writeable = False
+                self._frames.set(key, frame)
+        return frame
+
+    def get_edf_header(self, filename=''):
+        """
+        Returns the EdfHeader of an .edf file (only the header blocks are read), from memory if it was already read
+        """
+        key = file_key(filename)
+        edf_header = self._headers.get(key)
+        if edf_header is None:
+            edf_header = read_edf_header(filename=key[0])
+            self._headers.set(key, edf_header)
+        return edf_header
+
+    def clear(self) -> None:
+        self._frames.clear()
+        self._headers.clear()
+
+
+class FramePrefetcher:
+    """
+    Reads in background threads the frames (and .edf headers) around the active one, into a FrameCache.
+    Every new request cancels the reads of the previous one that did not start yet.
+    """
+
+    def __init__(self, frame_cache=None, nframes=DEFAULT_PREFETCH_FRAMES, max_workers=DEFAULT_PREFETCH_WORKERS) -> None:
+        """
+        Keyword Arguments:
+            frame_cache -- FrameCache instance, the process-wide one if None (default: {None})
+            nframes -- number of frames read before and after the active one (default: {DEFAULT_PREFETCH_FRAMES})
+            max_workers -- number of reading threads (default: {DEFAULT_PREFETCH_WORKERS})
+        """
+        self._frame_cache = frame_cache if frame_cache is not None else get_frame_cache()
+        self.nframes = int(nframes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._futures = []
+
+    def get_neighbours(self, list_filenames=list(), index=0) -> list:
+        """
+        Returns the filenames after and before the index, the closest first: i+1, i-1, i+2, i-2...
+
+        Keyword Arguments:
+            list_filenames -- ordered list of files of the entry (default: {list()})
+            index -- index or list of indices of the active frames (default: {0})
+
+        Returns:
+            list of filenames
+        """
+        if isinstance(index, (list, tuple)):
+            if not index:
+                return []
+            first, last = min(index), max(index)
+        else:
+            first = last = int(index)
+
+        neighbours = []
+        for step in range(1, self.nframes + 1):
+            for position in (last + step, first - step):
+                if 0 <= position < len(list_filenames):
+                    neighbours.append(list_filenames[position])
+        return neighbours
+
+    def _read(self, filename=''):
+        try:
+            if is_edf_file(filename):
+                self._frame_cache.get_edf_header(filename=filename)
+            self._frame_cache.get_frame(filename=filename)
+        except Exception:
+            pass
+
+    def cancel(self) -> None:
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+
+    def prefetch(self, list_filenames=list(), index=0) -> list:
+        """
+        Schedules the reading of the neighbours of the active frames
+
+        Keyword Arguments:
+            list_filenames -- ordered list of files of the entry (default: {list()})
+            index -- index or list of indices of the active frames (default: {0})
+
+        Returns:
+            list with the scheduled filenames
+        """
+        self.cancel()
+        neighbours = [
+            filename for filename in self.get_neighbours(list_filenames=list_filenames, index=index)
+            if filename not in self._frame_cache
+        ]
+        self._futures = [self._executor.submit(self._read, filename) for filename in neighbours]
+        return neighbours
+
+    def wait(self) -> None:
+        for future in list(self._futures):
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def read_frame(filename='', frame_cache=None) -> np.array:
+    """
+    Returns the frame from the cache if it is there, if not, the read-only memory-map (or fabio data)
+    without storing it, so reading many frames does not fill the cache
+
+    Keyword Arguments:
+        filename -- path of the file or address of a frame 'path::index' (default: {''})
+        frame_cache -- FrameCache instance, the process-wide one if None (default: {None})
+
+    Returns:
+        read-only np.array with the dtype of the file
+    """
+    frame_cache = frame_cache if frame_cache is not None else get_frame_cache()
+    frame = frame_cache.peek(filename=filename)
+    if frame is None:
+        frame = load_address(address=filename)
+    return frame
+
+
+class FrameAccumulator:
+    """
+    Folds frames one at a time into running arrays, in place, without keeping the frames.
+    The sum is accumulated in float64, or in float32 with Kahan compensation.
+    If variance is True, the mean and the sum of squared deviations are updated (Welford) instead of the sum.
+    The memory used is the accumulator plus one frame (two float32 buffers more with Kahan, three float64 with variance).
+    """
+
+    def __init__(self, kahan=False, variance=False, maximum=False) -> None:
+        """
+        Keyword Arguments:
+            kahan -- accumulate in float32 with Kahan compensated summation (default: {False})
+            variance -- keep the variance too (default: {False})
+            maximum -- keep the maximum value of every pixel (default: {False})
+        """
+        self.kahan = kahan
+        self.variance = variance
+        self.maximum = maximum
+        self.count = 0
+        self._sum = None
+        self._compensation = None
+        self._mean = None
+        self._m2 = None
+        self._max = None
+        self._buffers = ()
+
+    @property
+    def shape(self):
+        accumulator = self._mean if self.variance else self._sum
+        return None if accumulator is None else accumulator.shape
+
+    def _allocate(self, frame=None) -> None:
+        shape = frame.shape
+        if self.variance:
+            self._mean = np.zeros(shape, dtype=np.float64)
+            self._m2 = np.zeros(shape, dtype=np.float64)
+            self._buffers = (np.empty(shape, dtype=np.float64), np.empty(shape, dtype=np.float64))
+        elif self.kahan:
+            self._sum = np.zeros(shape, dtype=np.float32)
+            self._compensation = np.zeros(shape, dtype=np.float32)
+            self._buffers = (np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32))
+        else:
+            self._sum = np.zeros(shape, dtype=np.float64)
+        if self.maximum:
+            self._max = np.array(frame)
+
+    def add(self, frame=None) -> None:
+        """
+        Adds a frame to the accumulator
+
+        Keyword Arguments:
+            frame -- 2D array, with the same shape as the previous ones (default: {None})
+        """
+        if frame is None:
+            return
+        if self.count == 0:
+            self._allocate(frame=frame)
+        elif frame.shape != self.shape:
+            raise ValueError(f"The frame shape {frame.shape} does not match the accumulated shape {self.shape}.")
+        self.count += 1
+
+        if self.variance:
+            delta, delta_new = self._buffers
+            np.subtract(frame, self._mean, out=delta)
+            np.divide(delta, self.count, out=delta_new)
+            self._mean += delta_new
+            np.subtract(frame, self._mean, out=delta_new)
+            delta_new *= delta
+            self._m2 += delta_new
+        elif self.kahan:
+            corrected, total = self._buffers
+            np.subtract(frame, self._compensation, out=corrected, casting='unsafe')
+            np.add(self._sum, corrected, out=total)
+            np.subtract(total, self._sum, out=self._compensation)
+            self._compensation -= corrected
+            self._sum, self._buffers = total, (corrected, self._sum)
+        else:
+            np.add(self._sum, frame, out=self._sum, casting='unsafe')
+
+        if self.maximum and self.count > 1:
+            np.maximum(self._max, frame, out=self._max, casting='unsafe')
+
+    def get_sum(self) -> np.array:
+        if not self.count:
+            return
+        if self.variance:
+            return self._mean * self.count
+        return self._sum.copy()
+
+    def get_mean(self) -> np.array:
+        if not self.count:
+            return
+        if self.variance:
+            return self._mean.copy()
+        return self._sum / self.count
+
+    def get_variance(self, ddof=0) -> np.array:
+        """
+        Returns the variance of every pixel (None if the accumulator was created without variance)
+
+        Keyword Arguments:
+            ddof -- delta degrees of freedom, the divisor is count - ddof (default: {0})
+        """
+        if not self.variance or self.count <= ddof:
+            return
+        return self._m2 / (self.count - ddof)
+
+    def get_max(self) -> np.array:
+        if not self.maximum or not self.count:
+            return
+        return self._max.copy()
+
+
+def _read_in_memory(reader=None, filename=''):
+    # A memory-map is only read when its pixels are accessed: it is copied here, so the reading thread does the I/O
+    frame = reader(filename)
+    if isinstance(frame, np.memmap):
+        frame = np.array(frame)
+    return frame
+
+
+def accumulate_frames(list_filenames=list(), reader=None, max_workers=1, **kwargs) -> FrameAccumulator:
+    """
+    Reads the frames one by one (or a few in parallel) and folds them into a FrameAccumulator.
+    With max_workers > 1, no more than max_workers frames are read ahead, and the memory-mapped frames
+    are read into memory by the reading threads, not by the thread that accumulates
+
+    Keyword Arguments:
+        list_filenames -- list of paths (default: {list()})
+        reader -- function filename -> array, read_frame if None (default: {None})
+        max_workers -- number of reading threads (default: {1})
+        kwargs -- kahan, variance, maximum, passed to FrameAccumulator
+
+    Returns:
+        FrameAccumulator with all the frames added
+    """
+    reader = reader if reader is not None else read_frame
+    accumulator = FrameAccumulator(**kwargs)
+
+    if max_workers <= 1 or len(list_filenames) <= 1:
+        for filename in list_filenames:
+            accumulator.add(frame=reader(filename))
+        return accumulator
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='accumulate') as executor:
+        futures = deque()
+        for filename in list_filenames:
+            futures.append(executor.submit(_read_in_memory, reader, filename))
+            if len(futures) > max_workers:
+                accumulator.add(frame=futures.popleft().result())
+        while futures:
+            accumulator.add(frame=futures.popleft().result())
+    return accumulator
+
+
+_frame_cache = None
+
+def get_frame_cache(maxbytes=None) -> FrameCache:
+    """
+    Returns the FrameCache shared by the whole process
+
+    Keyword Arguments:
+        maxbytes -- if given, new memory budget of the frames in bytes (default: {None})
+    """
+    global _frame_cache
+    if _frame_cache is None:
+        _frame_cache = FrameCache(maxbytes=DEFAULT_FRAME_CACHE_BYTES if maxbytes is None else maxbytes)
+    elif maxbytes is not None:
+        _frame_cache.maxbytes = maxbytes
+    return _frame_cache
@@ -0,0 +1,178 @@
+from pathlib import Path
+from threading import RLock
+import json
+import os
+import sqlite3
+import weakref
+
+from pyxscat.other.source_methods import frame_address, split_address
+
+HEADER_CACHE_SUFFIX = '.sqlite'
+HEADER_CACHE_BATCH = 1000
+
+CREATE_TABLES = (
+    "CREATE TABLE IF NOT EXISTS headers (address TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, header TEXT)",
+    "CREATE TABLE IF NOT EXISTS frames (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, nframes INTEGER)",
+)
+INSERT_HEADER = "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?)"
+INSERT_FRAMES = "INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?)"
+SELECT_HEADER = "SELECT size, mtime_ns, header FROM headers WHERE address = ?"
+SELECT_FRAMES = "SELECT size, mtime_ns, nframes FROM frames WHERE path = ?"
+
+
+def header_key(address='') -> tuple:
+    """
+    Returns the key of a file or a frame address in the HeaderCache: absolute address, size and mtime of the file
+
+    Keyword Arguments:
+        address -- path of a file or 'path::index' of a frame (default: {''})
+
+    Returns:
+        tuple (address, size, mtime_ns), None if the file does not exist
+    """
+    filename, index = split_address(address)
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return
+    address = os.path.abspath(filename)
+    if index is not None:
+        address = frame_address(filename=address, index=index)
+    return address, stat.st_size, stat.st_mtime_ns
+
+
+class HeaderCache:
+    """
+    Persistent cache of parsed headers, stored in a SQLite file next to the metadatabase.
+    Every header is saved with the size and the modification time of its file: an unchanged file is only
+    stat-ed, never opened again. The frames of a container share the stat of the file, whose number of frames is also stored.
+    New items are written in batches, flush() writes the remaining ones.
+    The pending items are also written when the cache is closed, garbage collected or at the exit of the interpreter.
+    """
+
+    def __init__(self, filename='', batch_size=HEADER_CACHE_BATCH) -> None:
+        """
+        Keyword Arguments:
+            filename -- path of the SQLite file, created if it does not exist (default: {''})
+            batch_size -- number of new items written at once (default: {HEADER_CACHE_BATCH})
+        """
+        self._filename = Path(filename)
+        self._filename.parent.mkdir(parents=True, exist_ok=True)
+        self._batch_size = int(batch_size)
+        self._lock = RLock()
+        self._connection = sqlite3.connect(str(self._filename), check_same_thread=False)
+        for statement in CREATE_TABLES:
+            self._connection.execute(statement)
+        self._connection.commit()
+        self._pending_headers = dict()
+        self._pending_frames = dict()
+        self.hits = 0
+        self.misses = 0
+        # Without references to self, so the cache can be garbage collected
+        self._finalizer = weakref.finalize(
+            self, _close_connection, self._connection, self._lock, self._pending_headers, self._pending_frames,
+        )
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def __len__(self):
+        with self._lock:
+            self.flush()
+            return self._connection.execute("SELECT COUNT(*) FROM headers").fetchone()[0]
+
+    def _query(self, key=None, pending=None, statement=''):
+        # Returns the stored value if the size and the mtime match the current ones
+        if key is None:
+            with self._lock:
+                self.misses += 1
+            return
+        address, size, mtime_ns = key
+        with self._lock:
+            row = pending.get(address)
+            if row is None:
+                row = self._connection.execute(statement, (address,)).fetchone()
+            else:
+                row = row[1:]
+            if row is None or row[0] != size or row[1] != mtime_ns:
+                self.misses += 1
+                return
+            self.hits += 1
+        return row[2]
+
+    def get(self, address=''):
+        """
+        Returns the cached header of a file (or frame), None if it is not cached or the file has changed
+        """
+        value = self._query(key=header_key(address=address), pending=self._pending_headers, statement=SELECT_HEADER)
+        if value is None:
+            return
+        return json.loads(value)
+
+    def set(self, address='', header=None) -> None:
+        key = header_key(address=address)
+        if key is None or header is None:
+            return
+        # Values that json does not know (numpy scalars, bytes) are stored as strings, as MetadataBase does
+        row = key + (json.dumps(dict(header), default=str),)
+        with self._lock:
+            self._pending_headers[key[0]] = row
+            self._flush_if_full()
+
+    def get_nframes(self, filename=''):
+        """
+        Returns the number of frames of a container (0 for a single-frame file), None if unknown or changed
+        """
+        return self._query(key=header_key(address=filename), pending=self._pending_frames, statement=SELECT_FRAMES)
+
+    def set_nframes(self, filename='', nframes=0) -> None:
+        key = header_key(address=filename)
+        if key is None:
+            return
+        with self._lock:
+            self._pending_frames[key[0]] = key + (int(nframes),)
+            self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self._pending_headers) + len(self._pending_frames) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        _write_pending(self._connection, self._lock, self._pending_headers, self._pending_frames)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits' : self.hits,
+                'misses' : self.misses,
+            }
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def close(self) -> None:
+        """
+        Writes the pending items and closes the connection, the cache cannot be used afterwards
+        """
+        self._finalizer()
+
+
+def _write_pending(connection=None, lock=None, pending_headers=None, pending_frames=None) -> None:
+    with lock:
+        if not pending_headers and not pending_frames:
+            return
+        with connection:
+            connection.executemany(INSERT_HEADER, pending_headers.values())
+            connection.executemany(INSERT_FRAMES, pending_frames.values())
+        pending_headers.clear()
+        pending_frames.clear()
+
+
+def _close_connection(connection=None, lock=None, pending_headers=None, pending_frames=None) -> None:
+    with lock:
+        try:
+            _write_pending(connection, lock, pending_headers, pending_frames)
+        finally:
+            connection.close()
@@ -0,0 +1,156 @@
+from collections import namedtuple
+
+import numpy as np
+import scipy.sparse as sp
+
+# Same upper bound as pyFAI/pygix for the integration ranges
+EPS32 = 1.0 + np.finfo(np.float32).eps
+
+# matrix: CSR (bins x pixels) with the pixel-splitting weights (polarization already folded in)
+# count: sum of the weights per bin without corrections
+# x: center of the bins, in the internal units of pygix
+IntegrationLUT = namedtuple('IntegrationLUT', ['matrix', 'count', 'x'])
+
+# Several IntegrationLUT stacked in one matrix, offsets delimit the bins of every integration
+FusedLUT = namedtuple('FusedLUT', ['matrix', 'count', 'offsets'])
+
+
+def build_lut(
+    pos0=None,
+    delta_pos0=None,
+    pos1=None,
+    delta_pos1=None,
+    bins=100,
+    pos0_range=(),
+    pos1_range=(),
+    mask=None,
+    polarization=None,
+    ) -> IntegrationLUT:
+    """
+    Builds the sparse pixel-to-bin matrix of a 1D bounding-box integration,
+    the same pixel splitting as pyFAI.ext.splitBBox.histoBBox1d (pygix method 'bbox')
+
+    Keyword Arguments:
+        pos0 -- array with the radial position of the center of every pixel (default: {None})
+        delta_pos0 -- array with the radial half-size of every pixel (default: {None})
+        pos1 -- array with the azimuthal position of the center of every pixel (default: {None})
+        delta_pos1 -- array with the azimuthal half-size of every pixel (default: {None})
+        bins -- number of bins of the output (default: {100})
+        pos0_range -- minimum and maximum radial positions (default: {()})
+        pos1_range -- minimum and maximum azimuthal positions (default: {()})
+        mask -- array with non-zero values for the pixels to be discarded (default: {None})
+        polarization -- array with the polarization correction of every pixel (default: {None})
+
+    Returns:
+        IntegrationLUT with the CSR matrix, the normalization count and the bin centers
+    """
+    bins = int(bins)
+    pos0 = np.ravel(pos0).astype(np.float64)
+    delta_pos0 = np.ravel(delta_pos0).astype(np.float64)
+    pos1 = np.ravel(pos1).astype(np.float64)
+    delta_pos1 = np.ravel(delta_pos1).astype(np.float64)
+    size = pos0.size
+
+    pos0_min = min(pos0_range)
+    pos0_max = max(pos0_range) * EPS32
+    pos1_min = min(pos1_range)
+    pos1_max = max(pos1_range) * EPS32
+    delta = (pos0_max - pos0_min) / bins
+
+    # Pixels inside the azimuthal range and not masked
+    valid = ~(((pos1 + delta_pos1) < pos1_min) | ((pos1 - delta_pos1) > pos1_max))
+    if mask is not None:
+        valid &= ~np.ravel(mask).astype(bool)
+
+    # Fractional position of the pixel edges in bin units
+    fmin = (pos0 - delta_pos0 - pos0_min) / delta
+    fmax = (pos0 + delta_pos0 - pos0_min) / delta
+    valid &= (fmax >= 0) & (fmin < bins)
+
+    # The edge bins keep the unclipped fractions, as pyFAI does
+    index_pixel = np.nonzero(valid)[0]
+    fmin = fmin[index_pixel]
+    fmax = fmax[index_pixel]
+    bin_min = np.clip(fmin, 0, None).astype(np.int64)
+    bin_max = np.minimum(fmax, bins - 1).astype(np.int64)
+
+    # Every pixel contributes to (bin_max - bin_min + 1) consecutive bins
+    nbins_pixel = bin_max - bin_min + 1
+    first = np.cumsum(nbins_pixel) - nbins_pixel
+    last = first + nbins_pixel - 1
+    rows = np.repeat(bin_min, nbins_pixel) + (np.arange(nbins_pixel.sum()) - np.repeat(first, nbins_pixel))
+    cols = np.repeat(index_pixel, nbins_pixel)
+
+    span = fmax - fmin
+    delta_area = np.divide(1.0, span, out=np.ones_like(span), where=span > 0)
+    weights = np.repeat(delta_area, nbins_pixel)
+    single = nbins_pixel == 1
+    multi = ~single
+    weights[first[single]] = 1.0
+    weights[first[multi]] = (delta_area * (bin_min + 1 - fmin))[multi]
+    weights[last[multi]] = (delta_area * (fmax - bin_max))[multi]
+
+    matrix = sp.csr_matrix((weights, (rows, cols)), shape=(bins, size))
+    count = np.asarray(matrix.sum(axis=1)).ravel()
+
+    if polarization is not None:
+        matrix = matrix @ sp.diags(1.0 / np.ravel(polarization).astype(np.float64))
+        matrix = matrix.tocsr()
+
+    x = pos0_min + (0.5 + np.arange(bins)) * delta
+    return IntegrationLUT(matrix=matrix, count=count, x=x)
+
+
+def integrate_lut(lut=None, data=None, normalization_factor=1.0) -> np.array:
+    """
+    Performs the integration of a 2D array with a precomputed IntegrationLUT (one sparse mat-vec)
+
+    Keyword Arguments:
+        lut -- IntegrationLUT instance (default: {None})
+        data -- 2D array to be integrated (default: {None})
+        normalization_factor -- value that divides the result (default: {1.0})
+
+    Returns:
+        1D array with the integrated intensity, 0.0 for empty bins
+    """
+    signal = lut.matrix @ np.ravel(data).astype(np.float64)
+    intensity = np.divide(signal, lut.count, out=np.zeros_like(signal), where=lut.count > 0)
+    if normalization_factor:
+        intensity /= normalization_factor
+    return intensity
+
+
+def stack_luts(list_lut=list()) -> FusedLUT:
+    """
+    Stacks several IntegrationLUT in one sparse matrix, to perform all of them in a single pass over the frame
+
+    Keyword Arguments:
+        list_lut -- list of IntegrationLUT instances with the same number of pixels (default: {list()})
+
+    Returns:
+        FusedLUT instance
+    """
+    matrix = sp.vstack([lut.matrix for lut in list_lut], format='csr')
+    count = np.concatenate([lut.count for lut in list_lut])
+    offsets = np.cumsum([0] + [lut.matrix.shape[0] for lut in list_lut])
+    return FusedLUT(matrix=matrix, count=count, offsets=offsets)
+
+
+def integrate_fused(fused=None, data=None, normalization_factor=1.0) -> list:
+    """
+    Performs all the integrations of a FusedLUT with one sparse mat-vec
+
+    Keyword Arguments:
+        fused -- FusedLUT instance (default: {None})
+        data -- 2D array to be integrated (default: {None})
+        normalization_factor -- value that divides the result (default: {1.0})
+
+    Returns:
+        list of 1D arrays with the integrated intensities, one per stacked IntegrationLUT
+    """
+    intensity = integrate_lut(
+        lut=fused,
+        data=data,
+        normalization_factor=normalization_factor,
+    )
+    return np.split(intensity, fused.offsets[1:-1])
@@ -0,0 +1,204 @@
+from pygix import grazing_units
+
+from pyxscat.gi_integrator import UNIT_GI
+from pyxscat.other.cache_methods import LRUCache, geometry_key
+from pyxscat.other.integrator_methods import *
+
+import numpy as np
+
+MASK_CACHE_SIZE = 16
+
+
+def _inside_range(array=None, array_range=(), inside=None) -> np.array:
+    """
+    Sets to False (in place) the elements of inside whose position is out of the open interval
+    """
+    low, high = min(array_range), max(array_range)
+    if inside is None:
+        inside = np.greater(array, low)
+    else:
+        inside &= np.greater(array, low)
+    inside &= np.less(array, high)
+    return inside
+
+
+def get_unit_gi(unit='q_nm^-1'):
+    """
+    Returns the pygix unit of a unit of the integration dictionaries ('2th_deg' is '2theta_deg' for pygix)
+    """
+    return grazing_units.to_unit(UNIT_GI.get(unit, unit))
+
+
+def build_cake_mask(geometry=None, shape=(), unit='q_nm^-1', radial_range=(), azimuth_range=()) -> np.array:
+    """
+    Builds the boolean mask of the pixels outside a cake (radial and azimuthal ranges)
+
+    Keyword Arguments:
+        geometry -- pygix Transform instance (default: {None})
+        shape -- shape of the detector array (default: {()})
+        unit -- unit of the radial range (default: {'q_nm^-1'})
+        radial_range -- minimum and maximum radial positions (default: {()})
+        azimuth_range -- minimum and maximum azimuthal angles in degrees (default: {()})
+
+    Returns:
+        boolean array, True for the pixels to be masked
+    """
+    unit_gi = get_unit_gi(unit=unit)
+    chi, pos0 = geometry.giarray_from_unit(shape, "sector", "center", unit_gi)
+
+    inside = _inside_range(array=pos0, array_range=[position / unit_gi.scale for position in radial_range])
+    inside = _inside_range(array=chi, array_range=[np.deg2rad(angle) + np.pi for angle in azimuth_range], inside=inside)
+    return np.logical_not(inside, out=inside)
+
+
+def build_box_mask(geometry=None, shape=(), unit='q_nm^-1', ip_range=(), oop_range=()) -> np.array:
+    """
+    Builds the boolean mask of the pixels outside a box (in-plane and out-of-plane ranges)
+
+    Keyword Arguments:
+        geometry -- pygix Transform instance (default: {None})
+        shape -- shape of the detector array (default: {()})
+        unit -- unit of the ranges (default: {'q_nm^-1'})
+        ip_range -- minimum and maximum in-plane positions (default: {()})
+        oop_range -- minimum and maximum out-of-plane positions (default: {()})
+
+    Returns:
+        boolean array, True for the pixels to be masked
+    """
+    unit_gi = get_unit_gi(unit=unit)
+    horz_q, vert_q = geometry.giarray_from_unit(shape, "opbox", "center", unit_gi)
+
+    inside = _inside_range(array=horz_q, array_range=[position / unit_gi.scale for position in ip_range])
+    inside = _inside_range(array=vert_q, array_range=[position / unit_gi.scale for position in oop_range], inside=inside)
+    return np.logical_not(inside, out=inside)
+
+
+def apply_mask(data=None, mask=None, fill_value=np.nan, out=None) -> np.array:
+    """
+    Fills the masked pixels of an array in a single pass, without float temporaries
+
+    Keyword Arguments:
+        data -- 2D array (default: {None})
+        mask -- boolean array with the same shape, True for the pixels to be masked (default: {None})
+        fill_value -- value of the masked pixels (default: {np.nan})
+        out -- if given (float array with the shape of data), the result is written there; it can be data itself (default: {None})
+
+    Returns:
+        masked array (float64 if the data were integers), None if the shapes do not match
+    """
+    if data is None or mask is None:
+        return data
+    if data.shape != mask.shape:
+        return
+
+    if out is None:
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+        out = np.array(data, dtype=dtype)
+    elif out is not data:
+        np.copyto(out, data)
+    np.copyto(out, fill_value, where=mask)
+    return out
+
+
+class MaskEngine:
+    """
+    Builds the boolean masks of the integration regions and keeps the last used ones,
+    one per geometry, region and shape
+    """
+
+    def __init__(self, maxsize=MASK_CACHE_SIZE) -> None:
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def _get_mask(self, key=None, build_function=None, **kwargs) -> np.array:
+        mask = self._cache.get(key)
+        if mask is None:
+            mask = build_function(**kwargs)
+            mask.flags.writeable = False
+            self._cache.set(key, mask)
+        return mask
+
+    def cake_mask(self, geometry=None, shape=(), unit='q_nm^-1', radial_range=(), azimuth_range=()) -> np.array:
+        """
+        Returns the (cached) mask of a cake, see build_cake_mask
+        """
+        key = (
+            'cake',
+            geometry_key(geometry=geometry),
+            tuple(shape),
+            unit,
+            tuple(radial_range),
+            tuple(azimuth_range),
+        )
+        return self._get_mask(
+            key=key,
+            build_function=build_cake_mask,
+            geometry=geometry,
+            shape=shape,
+            unit=unit,
+            radial_range=radial_range,
+            azimuth_range=azimuth_range,
+        )
+
+    def box_mask(self, geometry=None, shape=(), unit='q_nm^-1', ip_range=(), oop_range=()) -> np.array:
+        """
+        Returns the (cached) mask of a box, see build_box_mask
+        """
+        key = (
+            'box',
+            geometry_key(geometry=geometry),
+            tuple(shape),
+            unit,
+            tuple(ip_range),
+            tuple(oop_range),
+        )
+        return self._get_mask(
+            key=key,
+            build_function=build_box_mask,
+            geometry=geometry,
+            shape=shape,
+            unit=unit,
+            ip_range=ip_range,
+            oop_range=oop_range,
+        )
+
+    def integration_mask(self, geometry=None, dict_integration=dict(), shape=()) -> np.array:
+        """
+        Returns the mask of the region of an integration dictionary (cake or box), None if not valid
+        """
+        if dict_integration.get(KEY_INTEGRATION) == CAKE_LABEL:
+            return self.cake_mask(
+                geometry=geometry,
+                shape=shape,
+                unit=dict_integration[CAKE_KEY_UNIT],
+                radial_range=dict_integration[CAKE_KEY_RRANGE],
+                azimuth_range=dict_integration[CAKE_KEY_ARANGE],
+            )
+        elif dict_integration.get(KEY_INTEGRATION) == BOX_LABEL:
+            return self.box_mask(
+                geometry=geometry,
+                shape=shape,
+                unit=dict_integration[BOX_KEY_INPUT_UNIT],
+                ip_range=dict_integration[BOX_KEY_IPRANGE],
+                oop_range=dict_integration[BOX_KEY_OOPRANGE],
+            )
+
+
+_mask_engine = None
+
+def get_mask_engine() -> MaskEngine:
+    """
+    Returns the MaskEngine shared by the whole process
+    """
+    global _mask_engine
+    if _mask_engine is None:
+        _mask_engine = MaskEngine()
+    return _mask_engine
@@ -0,0 +1,404 @@
+from bisect import bisect_right
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+import os
+
+from pyxscat.other.cache_methods import LRUCache
+from pyxscat.other.cbf_methods import is_cbf_file
+from pyxscat.other.edf_methods import is_edf_file, load_frame, read_edf_header, read_raw_header
+
+import fabio
+import h5py
+import numpy as np
+
+# A frame inside a multi-frame container is addressed as 'path::index'
+FRAME_SEPARATOR = '::'
+HDF5_SUFFIXES = ('.h5', '.hdf5', '.hdf', '.nxs')
+CONTAINER_PATTERNS = ['*.h5', '*.hdf5', '*.nxs']
+# Default location of the frames: NeXus/Eiger master files (data, data_000001...)
+HDF5_DATA_GROUP = 'entry/data'
+FRAME_INDEX_KEY = 'frame_index'
+SOURCE_CACHE_SIZE = 32
+
+ERROR_NO_FRAMES = "No frame stack (3D dataset) was found in the file."
+
+
+def frame_address(filename='', index=0) -> str:
+    """
+    Returns the address of a frame inside a multi-frame container: 'path::index'
+    """
+    return f"{filename}{FRAME_SEPARATOR}{int(index)}"
+
+
+def split_address(address='') -> tuple:
+    """
+    Splits a frame address into the path of the file and the frame index (None for a plain file)
+    """
+    address = str(address)
+    filename, separator, index = address.rpartition(FRAME_SEPARATOR)
+    if separator and index.isdigit():
+        return filename, int(index)
+    return address, None
+
+
+def is_frame_address(address='') -> bool:
+    return split_address(address)[1] is not None
+
+
+def is_hdf5_file(filename='') -> bool:
+    return Path(filename).suffix.lower() in HDF5_SUFFIXES
+
+
+class FrameSource:
+    """
+    One file seen as an ordered sequence of frames. Nothing is read until a frame (or its header) is requested
+    """
+
+    def __init__(self, filename='') -> None:
+        self.filename = str(filename)
+
+    def __len__(self):
+        return 1
+
+    @property
+    def multiframe(self) -> bool:
+        return False
+
+    def _check_index(self, index=0) -> int:
+        index = int(index)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {index} out of range, {self.filename} has {len(self)} frames.")
+        return index
+
+    def addresses(self):
+        """
+        Yields the address of every frame: the plain path for single-frame files, 'path::index' for containers
+        """
+        if not self.multiframe:
+            yield self.filename
+            return
+        for index in range(len(self)):
+            yield frame_address(filename=self.filename, index=index)
+
+    def get_frame(self, index=0) -> np.array:
+        self._check_index(index)
+        return load_frame(filename=self.filename, copy_on_write=False)
+
+    def get_header(self, index=0) -> dict:
+        self._check_index(index)
+        return read_raw_header(filename=self.filename)
+
+    def close(self) -> None:
+        pass
+
+
+class FabioFrameSource(FrameSource):
+    """
+    Multi-frame files read by fabio (multi-frame .edf, .cbf, .tif)
+    """
+
+    def __init__(self, filename='') -> None:
+        super().__init__(filename=filename)
+        self._image = fabio.open(self.filename)
+        self._lock = Lock()
+
+    def __len__(self):
+        return self._image.nframes
+
+    @property
+    def multiframe(self) -> bool:
+        return len(self) > 1
+
+    def _get_image(self, index=0):
+        index = self._check_index(index)
+        with self._lock:
+            return self._image.getframe(index) if self.multiframe else self._image
+
+    def get_frame(self, index=0) -> np.array:
+        return self._get_image(index=index).data
+
+    def get_header(self, index=0) -> dict:
+        header = dict(self._get_image(index=index).header)
+        if self.multiframe:
+            header[FRAME_INDEX_KEY] = int(index)
+        return header
+
+    def close(self) -> None:
+        self._image.close()
+
+
+class HDF5FrameSource(FrameSource):
+    """
+    Frame stacks of HDF5 files (Eiger master files with external links, NeXus files, stacks written by pyxscat).
+    The frames are the first axis of the 3D datasets, concatenated in order; every frame is read with a
+    single slice, so only the chunks of that frame are decompressed.
+    Scalar datasets are common to all the frames; 1D datasets with one value per frame are per-frame metadata.
+    """
+
+    def __init__(self, filename='', dataset_path=None) -> None:
+        """
+        Keyword Arguments:
+            filename -- path of the HDF5 file (default: {''})
+            dataset_path -- path of the frame stack, if None, the 3D datasets in 'entry/data' or the whole file (default: {None})
+        """
+        super().__init__(filename=filename)
+        self._file = h5py.File(self.filename, 'r')
+        self._lock = Lock()
+        self._datasets = self._find_datasets(dataset_path=dataset_path)
+        if not self._datasets:
+            self._file.close()
+            raise ValueError(ERROR_NO_FRAMES)
+
+        # First global index of every dataset
+        self._offsets = list(np.cumsum([0] + [dataset.shape[0] for dataset in self._datasets]))
+        self._metadata = None
+
+    def _find_datasets(self, dataset_path=None) -> list:
+        if dataset_path:
+            return [self._file[dataset_path]]
+
+        if HDF5_DATA_GROUP in self._file:
+            group = self._file[HDF5_DATA_GROUP]
+            datasets = []
+            for name in sorted(group.keys()):
+                try:
+                    dataset = group[name]
+                except KeyError:
+                    # Broken external link (missing data file of a master file)
+                    continue
+                if isinstance(dataset, h5py.Dataset) and dataset.ndim == 3:
+                    datasets.append(dataset)
+            if datasets:
+                return datasets
+
+        datasets = []
+        self._file.visititems(
+            lambda name, item: datasets.append(item) if isinstance(item, h5py.Dataset) and item.ndim == 3 else None
+        )
+        return datasets
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    @property
+    def multiframe(self) -> bool:
+        return True
+
+    def _locate(self, index=0) -> tuple:
+        index = self._check_index(index)
+        position = bisect_right(self._offsets, index) - 1
+        return self._datasets[position], index - self._offsets[position]
+
+    def get_frame(self, index=0) -> np.array:
+        dataset, local_index = self._locate(index=index)
+        with self._lock:
+            return dataset[local_index]
+
+    def _read_metadata(self) -> tuple:
+        # Only the small datasets are read: scalars and vectors with one value per frame
+        common, per_frame = dict(), dict()
+        nframes = len(self)
+
+        def visit(name, item):
+            if not isinstance(item, h5py.Dataset) or item in self._datasets:
+                return
+            key = name.split('/')[-1]
+            if item.ndim == 0 or (item.ndim == 1 and item.shape[0] == 1):
+                common.setdefault(key, _decode(item[()]))
+            elif item.ndim == 1 and item.shape[0] == nframes:
+                per_frame.setdefault(key, item)
+
+        with self._lock:
+            self._file.visititems(visit)
+        return common, per_frame
+
+    def get_header(self, index=0) -> dict:
+        dataset, local_index = self._locate(index=index)
+        if self._metadata is None:
+            self._metadata = self._read_metadata()
+        common, per_frame = self._metadata
+
+        header = dict(common)
+        with self._lock:
+            for key, metadata_dataset in per_frame.items():
+                header[key] = _decode(metadata_dataset[index])
+        header['Dim_1'] = dataset.shape[2]
+        header['Dim_2'] = dataset.shape[1]
+        header[FRAME_INDEX_KEY] = int(index)
+        return header
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _decode(value=None):
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, np.ndarray) and value.size == 1:
+        value = value.reshape(-1)[0]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def is_single_edf(filename='', edf_header=None) -> bool:
+    """
+    Returns True if the binary data of the first frame reaches the end of the file: no other frame follows.
+    The EdfHeader already read can be given, the header blocks are not read again
+    """
+    try:
+        if edf_header is None:
+            edf_header = read_edf_header(filename=filename)
+        if edf_header.compressed:
+            return False
+        nbytes = int(np.prod(edf_header.shape)) * edf_header.dtype.itemsize
+        return edf_header.offset + nbytes >= os.path.getsize(filename)
+    except Exception:
+        return False
+
+
+def open_frame_source(filename='') -> FrameSource:
+    """
+    Returns the FrameSource of a file: HDF5 stacks, multi-frame fabio files or single frames.
+    Uncompressed single-frame .edf files are recognized from the header only, .cbf files are single frames
+    """
+    filename = str(filename)
+    if is_hdf5_file(filename):
+        return HDF5FrameSource(filename=filename)
+    if (is_edf_file(filename) and is_single_edf(filename=filename)) or is_cbf_file(filename):
+        return FrameSource(filename=filename)
+    try:
+        source = FabioFrameSource(filename=filename)
+    except Exception:
+        return FrameSource(filename=filename)
+    if not source.multiframe:
+        source.close()
+        return FrameSource(filename=filename)
+    return source
+
+
+class FrameSourcePool:
+    """
+    Keeps open the last used frame sources, so the frames of a container are read without reopening the file.
+    A file modified since it was opened is opened again. The sources removed from the pool
+    (least recently used, replaced by a newer version of the file or cleared) are closed,
+    those still read by other threads are closed when their last reader releases them (see use_source)
+    """
+
+    def __init__(self, maxsize=SOURCE_CACHE_SIZE) -> None:
+        self._sources = LRUCache(maxsize=maxsize, on_evict=self._close_source)
+        # Key of the open source of every file, to find the outdated one when the file changes
+        self._keys = dict()
+        # Number of readers of every source in use, and the sources removed from the pool while in use
+        self._users = dict()
+        self._removed = set()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._sources)
+
+    def _close_source(self, key=None, source=None) -> None:
+        # Called with the lock held
+        if self._keys.get(key[0]) == key:
+            del self._keys[key[0]]
+        if self._users.get(source):
+            self._removed.add(source)
+            return
+        _close(source=source)
+
+    def _get_source(self, filename='') -> FrameSource:
+        # Called with the lock held
+        stat = os.stat(filename)
+        key = (filename, stat.st_mtime_ns, stat.st_size)
+        source = self._sources.get(key)
+        if source is None:
+            old_key = self._keys.get(filename)
+            if old_key is not None:
+                old_source = self._sources.pop(old_key)
+                if old_source is not None:
+                    self._close_source(key=old_key, source=old_source)
+            source = open_frame_source(filename=filename)
+            self._keys[filename] = key
+            self._sources.set(key, source)
+        return source
+
+    def get_source(self, filename='') -> FrameSource:
+        """
+        Returns the source of a file. It can be closed by other threads once it leaves the pool, use_source keeps it open
+        """
+        filename = os.path.abspath(str(filename))
+        with self._lock:
+            return self._get_source(filename=filename)
+
+    @contextmanager
+    def use_source(self, filename=''):
+        """
+        Context manager with the source of a file, which is not closed while it is used, even if it leaves the pool
+        """
+        filename = os.path.abspath(str(filename))
+        with self._lock:
+            source = self._get_source(filename=filename)
+            self._users[source] = self._users.get(source, 0) + 1
+        try:
+            yield source
+        finally:
+            with self._lock:
+                users = self._users.pop(source) - 1
+                if users:
+                    self._users[source] = users
+                elif source in self._removed:
+                    self._removed.discard(source)
+                    _close(source=source)
+
+    def get_frame(self, address='') -> np.array:
+        filename, index = split_address(address)
+        with self.use_source(filename=filename) as source:
+            return source.get_frame(index=index or 0)
+
+    def get_header(self, address='') -> dict:
+        filename, index = split_address(address)
+        with self.use_source(filename=filename) as source:
+            return source.get_header(index=index or 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._keys.values()):
+                source = self._sources.pop(key)
+                if source is not None:
+                    self._close_source(key=key, source=source)
+            self._sources.clear()
+            self._keys.clear()
+
+
+def _close(source=None) -> None:
+    try:
+        source.close()
+    except Exception:
+        pass
+
+
+def iter_frame_addresses(filename=''):
+    """
+    Yields the addresses of the frames of a file (with the path as given), without reading any pixel
+    """
+    with get_source_pool().use_source(filename=filename) as source:
+        multiframe, nframes = source.multiframe, len(source)
+    if not multiframe:
+        yield str(filename)
+        return
+    for index in range(nframes):
+        yield frame_address(filename=filename, index=index)
+
+
+_source_pool = None
+
+def get_source_pool() -> FrameSourcePool:
+    """
+    Returns the FrameSourcePool shared by the whole process
+    """
+    global _source_pool
+    if _source_pool is None:
+        _source_pool = FrameSourcePool()
+    return _source_pool
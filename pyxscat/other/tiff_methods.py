@@ -0,0 +1,178 @@
+from collections import namedtuple
+from pathlib import Path
+import struct
+
+import numpy as np
+
+TIFF_SUFFIXES = ('.tif', '.tiff')
+BYTE_ORDERS = {
+    b'II' : '<',
+    b'MM' : '>',
+}
+TIFF_MAGIC = 42
+NO_COMPRESSION = 1
+
+# Size in bytes and struct format of every TIFF field type
+FIELD_TYPES = {
+    1 : (1, 'B'),
+    2 : (1, 's'),
+    3 : (2, 'H'),
+    4 : (4, 'I'),
+    5 : (8, 'II'),
+    6 : (1, 'b'),
+    7 : (1, 'B'),
+    8 : (2, 'h'),
+    9 : (4, 'i'),
+    10 : (8, 'ii'),
+    11 : (4, 'f'),
+    12 : (8, 'd'),
+}
+
+# Tags read from the first IFD, with the same keys as the fabio header
+TAGS = {
+    256 : 'nColumns',
+    257 : 'nRows',
+    258 : 'nBits',
+    259 : 'compression_type',
+    262 : 'photometricInterpretation',
+    270 : 'imageDescription',
+    273 : 'stripOffsets',
+    277 : 'samplesPerPixel',
+    278 : 'rowsPerStrip',
+    279 : 'stripByteCounts',
+    305 : 'software',
+    306 : 'date',
+    339 : 'sampleFormat',
+}
+LIST_TAGS = ('stripOffsets', 'stripByteCounts')
+SAMPLE_FORMATS = {
+    1 : 'u',
+    2 : 'i',
+    3 : 'f',
+}
+
+ERROR_TIFF_HEADER = "The file is not a classic TIFF file."
+
+# header: dictionary with the tags of the first image
+# dtype: numpy dtype of the pixels, with the byte order
+# shape: shape of the frame (nRows, nColumns)
+# offset: position of the first strip if the pixels are uncompressed and contiguous, None if not
+TiffHeader = namedtuple('TiffHeader', ['header', 'dtype', 'shape', 'offset'])
+
+
+def is_tiff_file(filename='') -> bool:
+    return Path(filename).suffix.lower() in TIFF_SUFFIXES
+
+
+def _read_field(f=None, byte_order='<', field_type=1, count=1, value_bytes=b''):
+    size, fmt = FIELD_TYPES[field_type]
+    nbytes = size * count
+    if nbytes > 4:
+        offset = struct.unpack(f'{byte_order}I', value_bytes)[0]
+        f.seek(offset)
+        value_bytes = f.read(nbytes)
+    else:
+        value_bytes = value_bytes[:nbytes]
+
+    if fmt == 's':
+        return value_bytes.split(b'\x00', 1)[0].decode('latin-1')
+    values = struct.unpack(f'{byte_order}{fmt * count}', value_bytes)
+    if field_type in (5, 10):
+        values = [numerator / denominator if denominator else 0.0 for numerator, denominator in zip(values[::2], values[1::2])]
+    return list(values)
+
+
+def read_tiff_header(filename='') -> TiffHeader:
+    """
+    Reads the tags of the first image of a TIFF file (only the IFD and the tag values, no strip is read)
+
+    Keyword Arguments:
+        filename -- path of the TIFF file (default: {''})
+
+    Returns:
+        TiffHeader with the tags, the dtype, the shape and the offset of contiguous uncompressed pixels
+    """
+    header = {}
+    with open(filename, 'rb') as f:
+        start = f.read(8)
+        byte_order = BYTE_ORDERS.get(start[:2])
+        if byte_order is None or struct.unpack(f'{byte_order}H', start[2:4])[0] != TIFF_MAGIC:
+            raise ValueError(ERROR_TIFF_HEADER)
+
+        ifd_offset = struct.unpack(f'{byte_order}I', start[4:8])[0]
+        f.seek(ifd_offset)
+        nentries = struct.unpack(f'{byte_order}H', f.read(2))[0]
+        entries = f.read(12 * nentries)
+
+        for position in range(nentries):
+            tag, field_type, count, value_bytes = struct.unpack(
+                f'{byte_order}HHI4s',
+                entries[12 * position:12 * (position + 1)],
+            )
+            key = TAGS.get(tag)
+            if key is None or field_type not in FIELD_TYPES:
+                continue
+            value = _read_field(f=f, byte_order=byte_order, field_type=field_type, count=count, value_bytes=value_bytes)
+            if isinstance(value, list) and key not in LIST_TAGS:
+                value = value[0]
+            header[key] = value
+
+    header.setdefault('compression_type', NO_COMPRESSION)
+    header['compression'] = header['compression_type'] != NO_COMPRESSION
+    header.setdefault('sampleFormat', 1)
+    header.setdefault('rowsPerStrip', header.get('nRows'))
+
+    try:
+        dtype = np.dtype(f"{SAMPLE_FORMATS[header['sampleFormat']]}{header['nBits'] // 8}").newbyteorder(byte_order)
+    except Exception:
+        dtype = None
+
+    try:
+        shape = (int(header['nRows']), int(header['nColumns']))
+    except Exception:
+        shape = None
+
+    offset = None
+    offsets, counts = header.get('stripOffsets'), header.get('stripByteCounts')
+    if (
+        not header['compression']
+        and header.get('samplesPerPixel', 1) == 1
+        and offsets and counts and len(offsets) == len(counts)
+        and all(offsets[index + 1] == offsets[index] + counts[index] for index in range(len(offsets) - 1))
+    ):
+        offset = offsets[0]
+
+    return TiffHeader(
+        header=header,
+        dtype=dtype,
+        shape=shape,
+        offset=offset,
+    )
+
+
+def open_tiff_memmap(filename='', tiff_header=None, copy_on_write=False):
+    """
+    Maps the pixels of an uncompressed TIFF file whose strips are contiguous
+
+    Keyword Arguments:
+        filename -- path of the TIFF file (default: {''})
+        tiff_header -- TiffHeader of the file, read if None (default: {None})
+        copy_on_write -- if True, the array can be modified in memory without changing the file,
+            if False, it is read-only (default: {False})
+
+    Returns:
+        np.memmap with the dtype and byte order of the file, None if the pixels cannot be mapped
+    """
+    if tiff_header is None:
+        tiff_header = read_tiff_header(filename=filename)
+
+    if tiff_header.offset is None or tiff_header.dtype is None or tiff_header.shape is None:
+        return
+
+    return np.memmap(
+        filename,
+        dtype=tiff_header.dtype,
+        mode='c' if copy_on_write else 'r',
+        offset=tiff_header.offset,
+        shape=tiff_header.shape,
+    )
@@ -0,0 +1,225 @@
+from functools import lru_cache
+
+import numpy as np
+
+from pyxscat.other.units import QNM_ALIAS, QA_ALIAS, RAD_ALIAS, DEG_ALIAS
+
+UNIT_CONVERTER_CACHE_SIZE = 64
+
+QNM_UNIT = 'q_nm^-1'
+QA_UNIT = 'q_A^-1'
+DEG_UNIT = '2th_deg'
+RAD_UNIT = '2th_rad'
+VERTICAL_DIRECTION = 'vertical'
+HORIZONTAL_DIRECTION = 'horizontal'
+
+# Factor from q_nm^-1 to every q unit, and from radians to every angular unit
+Q_SCALE = {
+    QNM_UNIT : 1.0,
+    QA_UNIT : 0.1,
+}
+ANGLE_SCALE = {
+    RAD_UNIT : 1.0,
+    DEG_UNIT : 180.0 / np.pi,
+}
+
+
+@lru_cache(maxsize=None)
+def get_unit_name(unit='') -> str:
+    """
+    Returns the standard name of a unit from any of its alias, None if the unit is not recognized
+
+    Keyword Arguments:
+        unit -- 'q_nm^-1', 'q_A^-1', '2th_deg', '2th_rad' or any alias (default: {''})
+
+    Returns:
+        str with the standard name of the unit
+    """
+    for alias, unit_name in (
+        (QNM_ALIAS, QNM_UNIT),
+        (QA_ALIAS, QA_UNIT),
+        (DEG_ALIAS, DEG_UNIT),
+        (RAD_ALIAS, RAD_UNIT),
+    ):
+        if unit in alias:
+            return unit_name
+
+
+def is_q_unit(unit='') -> bool:
+    return get_unit_name(unit) in Q_SCALE
+
+
+def is_angle_unit(unit='') -> bool:
+    return get_unit_name(unit) in ANGLE_SCALE
+
+
+class UnitConverter:
+    """
+    Conversions between q (nm^-1, A^-1) and 2theta (deg, rad) for a fixed wavelength and incident angle.
+    The coefficients are calculated once, every conversion is applied to the whole array at once.
+    """
+
+    def __init__(self, wavelength=1e-10, incident_angle=0.0) -> None:
+        """
+        Keyword Arguments:
+            wavelength -- wavelength in meters (default: {1e-10})
+            incident_angle -- incident angle in degrees (default: {0.0})
+        """
+        self.wavelength = float(wavelength)
+        self.incident_angle = float(incident_angle)
+
+        wavelength_nm = self.wavelength * 1e9
+        alpha_inc = np.radians(self.incident_angle)
+
+        # 2theta = 2 * arcsin(q_nm * wavelength_nm / 4pi)
+        self._q_to_sin = wavelength_nm / (4 * np.pi)
+
+        # q_nm = slope * sin(2theta) + offset, depending on the direction of the box
+        wavevector = 2 * np.pi / wavelength_nm
+        self._twotheta_to_q = {
+            VERTICAL_DIRECTION : (wavevector * np.cos(alpha_inc), 0.0),
+            HORIZONTAL_DIRECTION : (wavevector, wavevector * np.sin(alpha_inc)),
+        }
+
+    def q_to_twotheta(self, q=0.0, unit=QNM_UNIT, degree=False):
+        """
+        Transforms q into 2theta
+
+        Keyword Arguments:
+            q -- value or array with the modulus of q (default: {0.0})
+            unit -- 'q_nm^-1' or 'q_A^-1' (default: {QNM_UNIT})
+            degree -- the result will be in degrees (True) or radians (False) (default: {False})
+
+        Returns:
+            twotheta value or array, None if the unit is not valid
+        """
+        q_scale = Q_SCALE.get(get_unit_name(unit))
+        if q_scale is None:
+            return
+
+        twotheta = np.arcsin(np.multiply(q, self._q_to_sin / q_scale))
+        twotheta *= 2 * ANGLE_SCALE[DEG_UNIT] if degree else 2
+        return twotheta
+
+    def twotheta_to_q(self, twotheta=0.0, degree_input=True, direction=VERTICAL_DIRECTION, output_unit=QNM_UNIT):
+        """
+        Transforms 2theta into q
+
+        Keyword Arguments:
+            twotheta -- value or array with the exit angle (default: {0.0})
+            degree_input -- if True, the input twotheta is degrees, if not, radians (default: {True})
+            direction -- 'vertical' or 'horizontal', direction of the box (default: {VERTICAL_DIRECTION})
+            output_unit -- 'q_nm^-1' or 'q_A^-1' (default: {QNM_UNIT})
+
+        Returns:
+            q value or array, None if the direction is not valid
+        """
+        coefficients = self._twotheta_to_q.get(direction)
+        if coefficients is None:
+            return
+
+        slope, offset = coefficients
+        q_scale = Q_SCALE.get(get_unit_name(output_unit), 1.0)
+        if degree_input:
+            twotheta = np.radians(twotheta)
+        return np.sin(twotheta) * (slope * q_scale) + offset * q_scale
+
+    def get_q_nm(self, value=0.0, direction=VERTICAL_DIRECTION, input_unit=QNM_UNIT):
+        """
+        Returns the value (or array) of q (pygix q units are kept, angles are transformed into q_nm^-1)
+        """
+        unit = get_unit_name(input_unit)
+        if unit in Q_SCALE:
+            return value
+        elif unit in ANGLE_SCALE:
+            return self.twotheta_to_q(
+                twotheta=value,
+                degree_input=(unit == DEG_UNIT),
+                direction=direction,
+            )
+
+    def convert(self, x_vector=None, input_unit=QNM_UNIT, output_unit=QNM_UNIT, direction=VERTICAL_DIRECTION):
+        """
+        Transforms a value or an array between any pair of units
+
+        Keyword Arguments:
+            x_vector -- value, list or array to be transformed (default: {None})
+            input_unit -- unit of the input (default: {QNM_UNIT})
+            output_unit -- unit of the output (default: {QNM_UNIT})
+            direction -- 'vertical' or 'horizontal', used from 2theta to q (default: {VERTICAL_DIRECTION})
+
+        Returns:
+            transformed value or array, None if the units are not valid
+        """
+        if x_vector is None:
+            return
+        if input_unit == output_unit:
+            return x_vector
+
+        input_unit = get_unit_name(input_unit)
+        output_unit = get_unit_name(output_unit)
+        if input_unit == output_unit:
+            return np.asarray(x_vector, dtype=np.float64)
+
+        if input_unit in Q_SCALE:
+            if output_unit in Q_SCALE:
+                return np.multiply(x_vector, Q_SCALE[output_unit] / Q_SCALE[input_unit])
+            elif output_unit in ANGLE_SCALE:
+                return self.q_to_twotheta(
+                    q=x_vector,
+                    unit=input_unit,
+                    degree=(output_unit == DEG_UNIT),
+                )
+        elif input_unit in ANGLE_SCALE:
+            if output_unit in ANGLE_SCALE:
+                return np.multiply(x_vector, ANGLE_SCALE[output_unit] / ANGLE_SCALE[input_unit])
+            elif output_unit in Q_SCALE:
+                return self.twotheta_to_q(
+                    twotheta=x_vector,
+                    degree_input=(input_unit == DEG_UNIT),
+                    direction=direction,
+                    output_unit=output_unit,
+                )
+
+    def convert_batch(self, list_vectors=list(), input_unit=QNM_UNIT, output_unit=QNM_UNIT, direction=VERTICAL_DIRECTION) -> list:
+        """
+        Transforms a list of arrays (for example, the x-axis of many 1D results) with a single conversion call
+
+        Keyword Arguments:
+            list_vectors -- list of values or arrays (default: {list()})
+            input_unit -- unit of the input (default: {QNM_UNIT})
+            output_unit -- unit of the output (default: {QNM_UNIT})
+            direction -- 'vertical' or 'horizontal', used from 2theta to q (default: {VERTICAL_DIRECTION})
+
+        Returns:
+            list of arrays with the same shapes as the input, None if the units are not valid
+        """
+        if not len(list_vectors):
+            return []
+
+        list_vectors = [np.asarray(vector, dtype=np.float64) for vector in list_vectors]
+        stacked = np.concatenate([vector.ravel() for vector in list_vectors])
+        converted = self.convert(
+            x_vector=stacked,
+            input_unit=input_unit,
+            output_unit=output_unit,
+            direction=direction,
+        )
+        if converted is None:
+            return
+
+        offsets = np.cumsum([vector.size for vector in list_vectors])[:-1]
+        return [
+            array.reshape(vector.shape) for array, vector in zip(np.split(converted, offsets), list_vectors)
+        ]
+
+
+@lru_cache(maxsize=UNIT_CONVERTER_CACHE_SIZE)
+def get_unit_converter(wavelength=1e-10, incident_angle=0.0) -> UnitConverter:
+    """
+    Returns the UnitConverter of a wavelength and an incident angle, built only once
+    """
+    return UnitConverter(
+        wavelength=wavelength,
+        incident_angle=incident_angle,
+    )
@@ -0,0 +1,153 @@
+from collections import namedtuple
+from fnmatch import fnmatchcase
+from pathlib import Path
+import os
+import time
+
+PONI_PATTERN = '*.poni'
+# A directory modified less than this before it was listed could change again within the same mtime tick,
+# its listing is not trusted and it is listed again in the next scan
+RACY_NS = 1_000_000_000
+
+# mtime_ns: modification time of the directory when it was listed
+# scan_ns: time of the listing
+# files, ponifiles: sorted paths of the data files and .poni files
+# subdirectories: sorted paths of the subdirectories
+Listing = namedtuple('Listing', ['mtime_ns', 'scan_ns', 'files', 'ponifiles', 'subdirectories'])
+
+
+def list_directory(directory='', pattern='*.edf', poni_pattern=PONI_PATTERN) -> tuple:
+    """
+    Lists a directory once with os.scandir, sorting its entries into data files, .poni files and subdirectories
+
+    Keyword Arguments:
+        directory -- path of the directory (default: {''})
+        pattern -- wildcards of the data files (default: {'*.edf'})
+        poni_pattern -- wildcards of the .poni files (default: {PONI_PATTERN})
+
+    Returns:
+        tuple with the sorted lists of data files, .poni files and subdirectories (symlinks to directories are not followed)
+    """
+    files, ponifiles, subdirectories = [], [], []
+    # Same paths as pathlib: the children of '.' have no prefix
+    prefix = '' if directory == '.' else os.path.join(directory, '')
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(prefix + entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if pattern and fnmatchcase(entry.name, pattern):
+                files.append(prefix + entry.name)
+            if poni_pattern and fnmatchcase(entry.name, poni_pattern):
+                ponifiles.append(prefix + entry.name)
+    return sorted(files), sorted(ponifiles), sorted(subdirectories)
+
+
+class DirectoryWalker:
+    """
+    Recursive walker of a directory tree that finds the data files and the .poni files in one pass.
+    The listing of every directory is kept with its mtime: in later scans, a directory whose mtime has not changed
+    is only stat-ed, not listed again, so a rescan of an unchanged tree costs one stat per directory.
+    The directories listed again since the last commit() are reported as changed.
+    """
+
+    def __init__(self, directory='', pattern='*.edf', poni_pattern=PONI_PATTERN) -> None:
+        """
+        Keyword Arguments:
+            directory -- root directory of the tree (default: {''})
+            pattern -- wildcards of the data files (default: {'*.edf'})
+            poni_pattern -- wildcards of the .poni files (default: {PONI_PATTERN})
+        """
+        self._directory = str(Path(directory))
+        self._pattern = pattern
+        self._poni_pattern = poni_pattern
+        self._listings = dict()
+        self._changed = set()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def pattern(self):
+        return self._pattern
+
+    def __len__(self):
+        return len(self._listings)
+
+    def _get_listing(self, directory='', scan_ns=0) -> Listing:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+
+        listing = self._listings.get(directory)
+        if listing is not None and listing.mtime_ns == mtime_ns and listing.scan_ns - mtime_ns > RACY_NS:
+            return listing
+
+        try:
+            files, ponifiles, subdirectories = list_directory(
+                directory=directory,
+                pattern=self._pattern,
+                poni_pattern=self._poni_pattern,
+            )
+        except OSError:
+            return
+        self._changed.add(directory)
+        return Listing(mtime_ns, scan_ns, files, ponifiles, subdirectories)
+
+    def scan(self) -> set:
+        """
+        Walks the tree, listing only the new directories and those whose mtime has changed
+
+        Returns:
+            set with the directories listed again since the last commit()
+        """
+        scan_ns = time.time_ns()
+        listings = dict()
+        stack = [self._directory]
+        while stack:
+            directory = stack.pop()
+            listing = self._get_listing(directory=directory, scan_ns=scan_ns)
+            if listing is None:
+                continue
+            listings[directory] = listing
+            stack.extend(reversed(listing.subdirectories))
+
+        # Removed directories are forgotten
+        self._changed.intersection_update(listings)
+        self._listings = listings
+        return set(self._changed)
+
+    def commit(self) -> None:
+        """
+        Marks the current listings as processed, the next scans report only the directories changed after this
+        """
+        self._changed.clear()
+
+    def get_directories(self) -> list:
+        return sorted(self._listings)
+
+    def get_files(self, changed_only=False) -> dict:
+        """
+        Returns the data files of every directory of the last scan (sorted directories, sorted files)
+
+        Keyword Arguments:
+            changed_only -- if True, only the directories listed again since the last commit() (default: {False})
+        """
+        return {
+            directory : list(self._listings[directory].files)
+            for directory in sorted(self._listings)
+            if not changed_only or directory in self._changed
+        }
+
+    def get_ponifiles(self) -> list:
+        """
+        Returns all the .poni files of the last scan, sorted
+        """
+        return sorted(ponifile for listing in self._listings.values() for ponifile in listing.ponifiles)
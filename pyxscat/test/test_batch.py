@@ -0,0 +1,146 @@
+from pyxscat.batch import BatchIntegrator, BatchTask, H5StreamWriter, get_batch_tasks
+from pyxscat.metadata import MetadataBase
+from pathlib import Path
+import fabio
+import h5py
+import numpy as np
+
+TEST_PATH = Path(__file__).parent
+
+EDF_EXAMPLES_PATH = 'test_edf'
+DUBBLE_PATH = 'test_DUBBLE'
+
+DUBBLE_EXAMPLE_PATH = TEST_PATH.joinpath(EDF_EXAMPLES_PATH, DUBBLE_PATH)
+DUBBLE_PONIFILE = DUBBLE_EXAMPLE_PATH.joinpath('AgBh_2.poni').as_posix()
+DUBBLE_SAXS_FILES = sorted(DUBBLE_EXAMPLE_PATH.joinpath('Air', 'SAXS').glob('*.edf'))
+
+DICT_AZIMUTHAL = {
+    'integration' : 'cake',
+    'name' : 'test_azimuthal',
+    'suffix' : 'azim',
+    'unit' : 'q_nm^-1',
+    'type' : 'azimuthal',
+    'radial_range' : [0.1, 3.0],
+    'azimuth_range' : [-180, 180],
+    'azim_bins' : 300,
+}
+
+DICT_BOX = {
+    'integration' : 'box',
+    'name' : 'test_box',
+    'suffix' : 'box',
+    'direction' : 'vertical',
+    'input_unit' : 'q_nm^-1',
+    'output_unit' : 'q_A^-1',
+    'ip_range' : [-0.5, 0.5],
+    'oop_range' : [0.1, 3.0],
+}
+
+LIST_DICT_INTEGRATION = [DICT_AZIMUTHAL, DICT_BOX]
+
+
+def test_stream_h5(tmp_path):
+    batch = BatchIntegrator(
+        poni=DUBBLE_PONIFILE,
+        list_dict_integration=LIST_DICT_INTEGRATION,
+        qz_parallel=True,
+        qr_parallel=False,
+        processes=1,
+    )
+    list_tasks = [
+        BatchTask(str(filename), 0.1 * index, 0.0, 1.0 + index) for index, filename in enumerate(DUBBLE_SAXS_FILES[:5])
+    ]
+    list_tasks.append(BatchTask('not_a_file.edf', 0.0, 0.0, 1.0))
+
+    filename_h5 = tmp_path.joinpath('stream.h5')
+    list_batch = list(batch.generate_batch(list_tasks=list_tasks))
+    with H5StreamWriter(filename=filename_h5, entry_name='Air_SAXS', list_dict_integration=LIST_DICT_INTEGRATION, chunk_rows=2) as writer:
+        for task, list_results in list_batch:
+            writer.append(task=task, list_results=list_results)
+
+    nframes = len(list_tasks)
+    with h5py.File(filename_h5, 'r') as f:
+        entry = f['Air_SAXS']
+        assert entry['metadata']['filename'].shape == (nframes,)
+        assert np.allclose(entry['metadata']['norm_factor'][()], [task.norm_factor for task in list_tasks])
+        for index_integration, dict_integration in enumerate(LIST_DICT_INTEGRATION):
+            intensity = entry[dict_integration['suffix']]['intensity']
+            assert intensity.shape[0] == nframes
+            assert intensity.compression == 'gzip'
+            for row, (task, list_results) in enumerate(list_batch[:-1]):
+                assert np.allclose(intensity[row], list_results[index_integration][1])
+            # The frame that could not be opened keeps its row
+            assert np.all(np.isnan(intensity[-1]))
+
+
+def test_batch_files(tmp_path):
+    batch = BatchIntegrator(
+        poni=DUBBLE_PONIFILE,
+        list_dict_integration=LIST_DICT_INTEGRATION,
+        processes=1,
+    )
+    list_tasks = [BatchTask(str(filename), 0.0, 0.0, 1.0) for filename in DUBBLE_SAXS_FILES[:3]]
+    list_tasks.append(BatchTask('not_a_file.edf', 0.0, 0.0, 1.0))
+
+    # Every task is yielded once its .csv file is saved, including the failed ones
+    list_batch = list(batch.generate_batch_files(list_tasks=list_tasks, folder_output=tmp_path))
+    assert [task for task, _ in list_batch] == list_tasks
+    assert list_batch[-1][1] is None
+    assert len(list(tmp_path.glob('*.csv'))) == 3
+
+
+def test_stream_h5_axis_metadata(tmp_path):
+    x_vector = np.linspace(0.0, 1.0, 10)
+    list_tasks = [BatchTask(f'frame_{index}.edf', 0.0, 0.0, 1.0) for index in range(5)]
+    list_x = [x_vector, x_vector, x_vector, 2 * x_vector, x_vector]
+    dict_metadata = {
+        'Monitor' : [1.0, 2.0, 3.0, 4.0, 5.0],
+        'Comment' : ['a', 'b', None, 'd', 'e'],
+        'filename' : ['not', 'a', 'new', 'column', '!'],
+    }
+
+    filename_h5 = tmp_path.joinpath('stream.h5')
+    with H5StreamWriter(filename=filename_h5, entry_name='series', list_dict_integration=[DICT_AZIMUTHAL], chunk_rows=2, dict_metadata=dict_metadata) as writer:
+        for index, (task, x) in enumerate(zip(list_tasks, list_x)):
+            writer.append(task=task, list_results=[np.array([x, np.full(10, float(index))])])
+
+    with h5py.File(filename_h5, 'r') as f:
+        entry = f['series']
+        assert np.allclose(entry['metadata']['Monitor'][()], dict_metadata['Monitor'])
+        assert entry['metadata']['Comment'].asstr()[()].tolist() == ['a', 'b', '', 'd', 'e']
+        assert entry['metadata']['filename'].asstr()[()].tolist() == [task.filename for task in list_tasks]
+
+        # The axis of the fourth frame is different: the axis of every row is stored
+        group = entry['azim']
+        assert np.allclose(group['x'][()], x_vector)
+        assert group['x_rows'].shape == (5, 10)
+        for row, x in enumerate(list_x):
+            assert np.allclose(group['x_rows'][row], x)
+
+
+def test_batch_container(tmp_path, monkeypatch):
+    # Two frames in a HDF5 master file, addressed as 'master.h5::index'
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    stack = np.array([fabio.open(filename).data for filename in DUBBLE_SAXS_FILES[:2]])
+    with h5py.File(entry.joinpath('master.h5'), 'w') as f:
+        f.create_dataset('entry/data/data_000001', data=stack, chunks=(1,) + stack.shape[1:], compression='gzip')
+
+    # The metadatabase (and its header cache) is written out of the scanned folder
+    json_file = tmp_path.joinpath('metadatabases', 'test_pyxscat_mdb.json')
+    monkeypatch.setattr(MetadataBase, '_get_json_file', lambda self: json_file)
+    metadata = MetadataBase(directory=str(entry), pattern='*.h5')
+    list_tasks = get_batch_tasks(source=metadata, entry_name=str(entry))
+    assert [task.filename for task in list_tasks] == [f"{entry.joinpath('master.h5')}::{index}" for index in range(2)]
+
+    batch = BatchIntegrator(
+        poni=DUBBLE_PONIFILE,
+        list_dict_integration=LIST_DICT_INTEGRATION,
+        processes=1,
+    )
+    list_batch = list(batch.generate_batch(list_tasks=list_tasks))
+    list_edf = list(batch.generate_batch(list_tasks=[BatchTask(str(filename), 0.0, 0.0, 1.0) for filename in DUBBLE_SAXS_FILES[:2]]))
+    for (_, list_results), (_, list_results_edf) in zip(list_batch, list_edf):
+        assert list_results is not None
+        for res, res_edf in zip(list_results, list_results_edf):
+            assert np.allclose(res, res_edf, equal_nan=True)
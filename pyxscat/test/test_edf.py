@@ -0,0 +1,256 @@
+from pyxscat.edf import EdfClass, FullHeader
+from pyxscat.other.edf_methods import load_frame, read_edf_header
+from pyxscat.other.cbf_methods import read_cbf_header
+from pyxscat.other.tiff_methods import read_tiff_header
+from pyxscat.other.frame_methods import FrameCache, FramePrefetcher, accumulate_frames
+from pyxscat.other import frame_methods
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import fabio
+import gzip
+import numpy as np
+import os
+import pytest
+import time
+
+TEST_PATH = Path(__file__).parent
+EDF_EXAMPLES_PATH = TEST_PATH.joinpath('test_edf')
+EDF_FILES = sorted(EDF_EXAMPLES_PATH.rglob('*.edf'))[::4]
+
+
+@pytest.mark.parametrize('filename', EDF_FILES)
+def test_edf_header(filename):
+    edf_header = read_edf_header(filename=filename)
+    fabio_image = fabio.open(filename)
+
+    assert edf_header.header == dict(fabio_image.header)
+    assert edf_header.shape == fabio_image.data.shape
+    assert edf_header.dtype == fabio_image.data.dtype
+    assert not edf_header.compressed
+    assert edf_header.offset + np.prod(edf_header.shape) * edf_header.dtype.itemsize == os.path.getsize(filename)
+
+    binary = np.fromfile(filename, dtype=edf_header.dtype, offset=edf_header.offset).reshape(edf_header.shape)
+    assert np.array_equal(binary, fabio_image.data)
+
+
+def test_full_header(tmp_path):
+    filename = EDF_FILES[0]
+    header = FullHeader(filename=str(filename)).get_header()
+    assert header
+
+    # Truncated file: the header is still there, the pixels are not
+    filename_cut = tmp_path.joinpath(filename.name)
+    filename_cut.write_bytes(filename.read_bytes()[:read_edf_header(filename).offset])
+    assert FullHeader(filename=str(filename_cut)).get_header() == header
+
+
+def test_edf_header_cache(tmp_path, monkeypatch):
+    filename = tmp_path.joinpath(EDF_FILES[0].name)
+    filename.write_bytes(EDF_FILES[0].read_bytes())
+    edf = EdfClass(filename=str(filename))
+
+    list_reads = []
+    get_raw_header = edf.get_raw_header
+    monkeypatch.setattr(edf, 'get_raw_header', lambda: list_reads.append(1) or get_raw_header())
+
+    edf.get_dict()
+    edf.get_header_keys()
+    assert len(list_reads) <= 1
+
+    # Modifying the file invalidates the cache
+    header = edf.get_header()
+    edf.get_header()['new_key'] = 0.0
+    assert 'new_key' not in edf.get_header()
+    nreads = len(list_reads)
+    with open(filename, 'ab') as f:
+        f.write(b'\0')
+    assert edf.get_header() == header
+    assert len(list_reads) == nreads + 1
+
+
+def test_edf_memmap():
+    filename = EDF_FILES[0]
+    data_fabio = fabio.open(filename).data
+
+    frame = load_frame(filename=filename)
+    assert isinstance(frame, np.memmap)
+    assert np.array_equal(frame, data_fabio)
+    # Copy on write, the file is not modified
+    frame[0, 0] = -1
+    assert np.array_equal(load_frame(filename=filename), data_fabio)
+
+    edf = EdfClass(filename=str(filename))
+    frame = edf.get_frame()
+    assert isinstance(frame, np.memmap)
+    assert not frame.flags.writeable
+    assert edf.get_frame() is frame
+    assert edf.get_frame(dtype=np.float32).dtype == np.float32
+    assert edf.get_data().dtype == np.int32
+
+    roi = [10, 50, 20, 80]
+    assert np.array_equal(edf.roi(roi), data_fabio[10:50, 20:80])
+    # The region is a writable int32 copy, not a view of the file
+    assert edf.roi(roi).dtype == np.int32
+    assert edf.roi(roi).flags.writeable
+    assert not np.shares_memory(edf.roi(), edf.get_frame())
+    assert edf.sum_data(roi) == data_fabio[10:50, 20:80].sum()
+    assert edf.max_data(roi) == data_fabio[10:50, 20:80].max()
+
+
+def test_edf_data_cache(tmp_path):
+    filename = EDF_FILES[0]
+    data_fabio = fabio.open(filename).data
+    frame_cache = frame_methods.get_frame_cache()
+    frame_cache.clear()
+
+    # Uncompressed: read from the memory-map, the frame cache is not filled
+    edf = EdfClass(filename=str(filename))
+    assert np.array_equal(edf.get_data(), data_fabio)
+    assert str(filename) not in frame_cache
+
+    # Compressed: decoded once and kept in the frame cache
+    filename_gz = tmp_path.joinpath(f'{filename.name}.gz')
+    with open(filename, 'rb') as f_in, gzip.open(filename_gz, 'wb') as f_out:
+        f_out.write(f_in.read())
+    edf_gz = EdfClass(filename=str(filename_gz))
+    assert np.array_equal(edf_gz.get_data(), data_fabio)
+    assert str(filename_gz) in frame_cache
+    frame_cache.clear()
+
+
+def test_frame_prefetch():
+    frame_cache = FrameCache(maxbytes=64 * 1024**2)
+    prefetcher = FramePrefetcher(frame_cache=frame_cache, nframes=2)
+    list_filenames = [str(filename) for filename in EDF_FILES[:5]]
+
+    scheduled = prefetcher.prefetch(list_filenames=list_filenames, index=2)
+    assert scheduled == [list_filenames[i] for i in (3, 1, 4, 0)]
+    prefetcher.wait()
+
+    assert list_filenames[2] not in frame_cache
+    for filename in scheduled:
+        frame = frame_cache.peek(filename=filename)
+        assert not frame.flags.writeable
+        assert np.array_equal(frame, fabio.open(filename).data)
+        assert frame_cache.get_edf_header(filename=filename).header == dict(fabio.open(filename).header)
+
+    # Already cached frames are not read again
+    assert prefetcher.prefetch(list_filenames=list_filenames, index=3) == [list_filenames[2]]
+    prefetcher.shutdown()
+
+
+def test_frame_cache_budget():
+    filename = str(EDF_FILES[0])
+    frame_cache = FrameCache(maxbytes=64 * 1024**2)
+
+    frame = frame_cache.get_frame(filename=filename)
+    assert frame_cache.get_frame(filename=filename) is frame
+    stats = frame_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['items']) == (1, 1, 1)
+    assert stats['nbytes'] == frame.nbytes
+
+    # A smaller budget releases the frames that do not fit
+    frame_cache.maxbytes = frame.nbytes - 1
+    assert len(frame_cache) == 0
+    assert frame_cache.nbytes == 0
+    assert frame_cache.peek(filename=filename) is None
+
+    # A modified file is read again
+    frame_cache.maxbytes = 64 * 1024**2
+    frame_cache.get_frame(filename=filename)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    try:
+        assert filename not in frame_cache
+    finally:
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_frame_cache_threads(monkeypatch):
+    filename = str(EDF_FILES[0])
+    frame_cache = FrameCache(maxbytes=64 * 1024**2)
+    list_reads = []
+
+    def slow_load(address=''):
+        list_reads.append(address)
+        time.sleep(0.05)
+        return load_frame(filename=address, copy_on_write=False)
+    monkeypatch.setattr(frame_methods, 'load_address', slow_load)
+
+    # Many threads asking for the same file: read once, all of them get the same array
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list_frames = list(executor.map(lambda _: frame_cache.get_frame(filename=filename), range(32)))
+    assert len(list_reads) == 1
+    assert all(frame is list_frames[0] for frame in list_frames)
+    assert not frame_cache._key_locks
+
+
+def test_frame_accumulator(monkeypatch):
+    list_filenames = [str(filename) for filename in sorted(EDF_EXAMPLES_PATH.joinpath('test_DUBBLE', 'Air', 'WAXS').glob('*.edf'))]
+    stack = np.array([fabio.open(filename).data for filename in list_filenames], dtype=np.float64)
+
+    accumulator = accumulate_frames(list_filenames=list_filenames, variance=True, maximum=True)
+    assert accumulator.count == len(list_filenames)
+    assert np.allclose(accumulator.get_sum(), stack.sum(axis=0))
+    assert np.allclose(accumulator.get_mean(), stack.mean(axis=0))
+    assert np.allclose(accumulator.get_variance(), stack.var(axis=0))
+    assert np.allclose(accumulator.get_variance(ddof=1), stack.var(axis=0, ddof=1))
+    assert np.array_equal(accumulator.get_max(), stack.max(axis=0))
+
+    mean = accumulate_frames(list_filenames=list_filenames, max_workers=3).get_mean()
+    assert np.array_equal(mean, np.average(stack, axis=0))
+
+    # The reading threads give frames already in memory, not memory-maps
+    list_frames = []
+    accumulator_add = frame_methods.FrameAccumulator.add
+    def add(self, frame=None):
+        list_frames.append(frame)
+        accumulator_add(self, frame=frame)
+    monkeypatch.setattr(frame_methods.FrameAccumulator, 'add', add)
+    accumulate_frames(list_filenames=list_filenames, max_workers=3)
+    assert len(list_frames) == len(list_filenames)
+    assert not any(isinstance(frame, np.memmap) for frame in list_frames)
+
+    accumulator = accumulate_frames(list_filenames=list_filenames, kahan=True)
+    assert accumulator.get_sum().dtype == np.float32
+    assert np.allclose(accumulator.get_mean(), stack.mean(axis=0), rtol=1e-6)
+
+
+@pytest.mark.parametrize('dtype', [np.int32, np.uint16, np.int64])
+def test_cbf_reader(tmp_path, monkeypatch, dtype):
+    filename = str(tmp_path.joinpath('frame.cbf'))
+    random = np.random.RandomState(0)
+    data = random.poisson(5, (97, 83)).astype(dtype)
+    data[:, 40:45] = 0 if dtype == np.uint16 else -1
+    data.flat[::37] = np.iinfo(dtype).max // 3
+    if dtype == np.int64:
+        data.flat[::11] = 2**40
+    fabio.cbfimage.CbfImage(data=data).write(filename)
+    fabio_image = fabio.open(filename)
+
+    cbf_header = read_cbf_header(filename=filename)
+    assert cbf_header.header == dict(fabio_image.header)
+    assert cbf_header.shape == data.shape
+    frame = load_frame(filename=filename)
+    assert frame.dtype == data.dtype
+    assert np.array_equal(frame, data)
+
+    # Header scans do not decode the pixels
+    monkeypatch.setattr(fabio, 'open', None)
+    assert FullHeader(filename=filename).get_raw_header() == dict(fabio_image.header)
+
+
+def test_tiff_reader(tmp_path):
+    filename = str(tmp_path.joinpath('frame.tif'))
+    data = np.arange(120 * 100, dtype=np.uint16).reshape(120, 100)
+    fabio.tifimage.TifImage(data=data, header={'Exposure' : '1'}).write(filename)
+    fabio_header = fabio.open(filename).header
+
+    tiff_header = read_tiff_header(filename=filename)
+    for key in ('nRows', 'nColumns', 'nBits', 'compression', 'compression_type', 'imageDescription',
+                'stripOffsets', 'rowsPerStrip', 'stripByteCounts', 'sampleFormat', 'photometricInterpretation'):
+        assert tiff_header.header[key] == fabio_header[key]
+
+    frame = load_frame(filename=filename)
+    assert isinstance(frame, np.memmap)
+    assert np.array_equal(frame, data)
@@ -0,0 +1,290 @@
+from pyxscat.gi_integrator import GIIntegrator, UNIT_GI
+from pyxscat.other.cache_methods import MeshCache
+from pyxscat.other.mask_methods import MaskEngine, apply_mask
+from pathlib import Path
+import fabio
+import numpy as np
+import pytest
+
+TEST_PATH = Path(__file__).parent
+
+EDF_EXAMPLES_PATH = 'test_edf'
+DUBBLE_PATH = 'test_DUBBLE'
+
+DUBBLE_EXAMPLE_PATH = TEST_PATH.joinpath(EDF_EXAMPLES_PATH, DUBBLE_PATH)
+DUBBLE_PONIFILE = DUBBLE_EXAMPLE_PATH.joinpath('AgBh_2.poni').as_posix()
+DUBBLE_SAXS_FILES = sorted(DUBBLE_EXAMPLE_PATH.joinpath('Air', 'SAXS').glob('*.edf'))
+
+INCIDENT_ANGLE = 0.15
+
+DICT_AZIMUTHAL = {
+    'integration' : 'cake',
+    'name' : 'test_azimuthal',
+    'suffix' : 'azim',
+    'unit' : 'q_nm^-1',
+    'type' : 'azimuthal',
+    'radial_range' : [0.1, 3.0],
+    'azimuth_range' : [-180, 180],
+    'azim_bins' : 300,
+}
+
+DICT_RADIAL = {
+    'integration' : 'cake',
+    'name' : 'test_radial',
+    'suffix' : 'rad',
+    'unit' : 'q_nm^-1',
+    'type' : 'radial',
+    'radial_range' : [0.2, 1.0],
+    'azimuth_range' : [-180, 0],
+    'azim_bins' : 180,
+}
+
+DICT_BOX = {
+    'integration' : 'box',
+    'name' : 'test_box',
+    'suffix' : 'box',
+    'direction' : 'vertical',
+    'input_unit' : 'q_nm^-1',
+    'output_unit' : 'q_A^-1',
+    'ip_range' : [-0.5, 0.5],
+    'oop_range' : [0.1, 3.0],
+}
+
+LIST_DICT_INTEGRATION = [DICT_AZIMUTHAL, DICT_RADIAL, DICT_BOX]
+
+
+def get_integrator(use_lut=True):
+    gi = GIIntegrator(use_lut=use_lut)
+    gi.update_poni(poni=DUBBLE_PONIFILE)
+    gi.update_incident_angle(incident_angle=INCIDENT_ANGLE)
+    gi.update_orientation(qz_parallel=True, qr_parallel=False)
+    return gi
+
+
+@pytest.fixture(scope='module')
+def data():
+    return fabio.open(DUBBLE_SAXS_FILES[0]).data
+
+
+@pytest.fixture(scope='module')
+def gi_lut():
+    return get_integrator(use_lut=True)
+
+
+@pytest.fixture(scope='module')
+def gi_pygix():
+    return get_integrator(use_lut=False)
+
+
+@pytest.mark.parametrize('dict_integration', LIST_DICT_INTEGRATION)
+def test_lut_integration(gi_lut, gi_pygix, data, dict_integration):
+    res_lut = gi_lut.raw_integration(data=data, norm_factor=2.0, dict_integration=dict_integration)
+    res_pygix = gi_pygix.raw_integration(data=data, norm_factor=2.0, dict_integration=dict_integration)
+
+    assert res_lut.shape == res_pygix.shape
+    assert np.allclose(res_lut[0], res_pygix[0], rtol=1e-5, atol=1e-6)
+    assert np.allclose(res_lut[1], res_pygix[1], rtol=1e-4, atol=1e-6 * np.abs(res_pygix[1]).max())
+
+
+def test_lut_cache(data):
+    gi = get_integrator(use_lut=True)
+    for _ in range(2):
+        gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    assert len(gi._lut_cache) == 1
+
+    # A new geometry needs a new matrix
+    gi.update_incident_angle(incident_angle=2 * INCIDENT_ANGLE)
+    gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    assert len(gi._lut_cache) == 2
+
+
+def test_lut_mask(data):
+    gi = get_integrator(use_lut=True)
+    gi.use_result_cache = False
+    res = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    list_fused = gi.fused_integration(data=data, norm_factor=1.0, list_dict_integration=LIST_DICT_INTEGRATION)
+
+    # Half of the detector masked: new matrices, new results
+    mask_detector = np.array(gi.mask, dtype=bool)
+    mask = mask_detector.copy()
+    mask[:data.shape[0] // 2] = True
+    gi.set_mask(mask)
+    res_mask = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    list_fused_mask = gi.fused_integration(data=data, norm_factor=1.0, list_dict_integration=LIST_DICT_INTEGRATION)
+    assert len(gi._lut_cache) == 2 * len(LIST_DICT_INTEGRATION)
+    assert len(gi._fused_cache) == 2
+    assert not np.allclose(res[1], res_mask[1])
+    assert not all(np.allclose(a[1], b[1]) for a, b in zip(list_fused, list_fused_mask))
+
+    # The same mask changed in place is also detected
+    mask[:] = mask_detector
+    gi.set_mask(mask)
+    res_unmask = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    assert np.allclose(res[1], res_unmask[1])
+
+
+def test_result_cache(data):
+    gi = get_integrator(use_lut=True)
+    res = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_BOX)
+    res[1] *= 0.0
+
+    res_cache = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_BOX)
+    assert gi._result_cache.hits == 1
+    assert np.abs(res_cache[1]).max() > 0.0
+
+    # Different frame, different result
+    gi.raw_integration(data=data[::-1].copy(), norm_factor=1.0, dict_integration=DICT_BOX)
+    assert gi._result_cache.hits == 1
+    assert len(gi._result_cache) == 2
+
+
+@pytest.mark.parametrize('use_lut', [True, False])
+def test_result_cache_mask(data, use_lut):
+    gi = get_integrator(use_lut=use_lut)
+    res = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+
+    # Same frame, new mask: the cached result is not used
+    mask = np.array(gi.mask, dtype=bool)
+    mask[:data.shape[0] // 2] = True
+    gi.set_mask(mask)
+    res_mask = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    assert gi._result_cache.hits == 0
+    assert len(gi._result_cache) == 2
+    assert not np.allclose(res[1], res_mask[1], equal_nan=True)
+
+
+def test_fused_integration(gi_lut, data):
+    gi = get_integrator(use_lut=True)
+    gi.use_result_cache = False
+    list_fused = list(gi.generate_integration(data=data, norm_factor=2.0, list_dict_integration=LIST_DICT_INTEGRATION, fused=True))
+    list_single = list(gi.generate_integration(data=data, norm_factor=2.0, list_dict_integration=LIST_DICT_INTEGRATION, fused=False))
+
+    assert len(gi._fused_cache) == 1
+    for res_fused, res_single in zip(list_fused, list_single):
+        assert np.allclose(res_fused, res_single)
+
+
+def test_mesh_cache(data, tmp_path):
+    gi = get_integrator(use_lut=True)
+    gi._mesh_cache = MeshCache(directory=tmp_path)
+    scat_horz, scat_vert = gi.get_mesh_matrix(unit='q_nm^-1', shape=data.shape)
+    assert scat_horz.shape == data.shape
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    # Reopening reuses the meshes stored on disk
+    gi._mesh_cache = MeshCache(directory=tmp_path)
+    scat_horz_disk, scat_vert_disk = gi.get_mesh_matrix(unit='q_nm^-1', shape=data.shape)
+    assert isinstance(scat_horz_disk, np.memmap)
+    assert np.array_equal(scat_horz, scat_horz_disk)
+    assert np.array_equal(scat_vert, scat_vert_disk)
+
+
+def test_mesh_cache_disk(tmp_path, monkeypatch):
+    mesh = (np.zeros((100, 100)), np.ones((100, 100)))
+    nbytes = sum(arr.nbytes for arr in mesh)
+    cache = MeshCache(directory=tmp_path, maxbytes=int(2.5 * nbytes))
+    for index in range(3):
+        cache.set(key=('mesh', index), mesh=mesh)
+        cache.clear()
+    # Only the two last meshes fit in the disk budget
+    assert len(list(tmp_path.glob('*.npy'))) == 4
+    assert cache.get(key=('mesh', 0)) is None
+    assert cache.get(key=('mesh', 2)) is not None
+
+    # A failed write does not leave temporary files
+    def save_error(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(np, 'save', save_error)
+    cache.set(key=('mesh', 3), mesh=mesh)
+    assert not list(tmp_path.glob('*.tmp'))
+    assert cache.get(key=('mesh', 3)) is not None
+
+
+def test_geometry_pool(data):
+    gi = get_integrator(use_lut=True)
+    gi.use_result_cache = False
+    res = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    absq_cen = gi._absq_cen
+
+    # The angle is quantized to the tolerance
+    gi.update_incident_angle(incident_angle=2 * INCIDENT_ANGLE + 0.0001)
+    assert gi._incident_angle == 2 * INCIDENT_ANGLE
+    gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+
+    # Back to the first angle, the arrays come from the pool
+    gi.update_incident_angle(incident_angle=INCIDENT_ANGLE)
+    assert gi._absq_cen is absq_cen
+    gi._lut_cache.clear()
+    res_pool = gi.raw_integration(data=data, norm_factor=1.0, dict_integration=DICT_AZIMUTHAL)
+    assert np.allclose(res, res_pool)
+
+
+def test_unit_conversion(gi_lut):
+    q = np.linspace(0.1, 3.0, 50)
+    wavelength_nm = gi_lut._wavelength * 1e9
+
+    twotheta = gi_lut.transform_q_units(x_vector=q, input_unit='q_nm^-1', output_unit='2th_deg')
+    assert np.allclose(twotheta, np.rad2deg(2 * np.arcsin(q * wavelength_nm / (4 * np.pi))))
+    assert np.allclose(gi_lut.transform_q_units(x_vector=q, input_unit='q_nm^-1', output_unit='q_A^-1'), q / 10)
+
+    alpha_inc = np.radians(INCIDENT_ANGLE)
+    q_vert = gi_lut.twotheta_to_q(twotheta=twotheta, degree_input=True, direction='vertical')
+    assert np.allclose(q_vert, 2 * np.pi / wavelength_nm * np.cos(alpha_inc) * np.sin(np.radians(twotheta)))
+
+    list_q = [q, q[:10], q[::-1]]
+    list_batch = gi_lut.transform_q_units_batch(list_vectors=list_q, input_unit='q_nm^-1', output_unit='2th_rad')
+    for vector, vector_batch in zip(list_q, list_batch):
+        assert np.allclose(vector_batch, gi_lut.q_to_twotheta(q=vector, unit='q_nm^-1'))
+
+
+def test_integration_mask(gi_lut, data):
+    engine = MaskEngine()
+    mask = engine.integration_mask(geometry=gi_lut, dict_integration=DICT_AZIMUTHAL, shape=data.shape)
+    assert mask.dtype == bool
+    assert engine.integration_mask(geometry=gi_lut, dict_integration=DICT_AZIMUTHAL, shape=data.shape) is mask
+    assert engine.stats()['hits'] == 1
+
+    chi, pos0 = gi_lut.giarray_from_unit(data.shape, "sector", "center", 'q_nm^-1')
+    radial_range = [position / 100 for position in DICT_AZIMUTHAL['radial_range']]
+    azimuth_range = [np.deg2rad(angle) + np.pi for angle in DICT_AZIMUTHAL['azimuth_range']]
+    inside = (pos0 > radial_range[0]) & (pos0 < radial_range[1]) & (chi > azimuth_range[0]) & (chi < azimuth_range[1])
+    assert np.array_equal(mask, ~inside)
+
+    data_mask = apply_mask(data=data, mask=mask)
+    assert np.all(np.isnan(data_mask[mask]))
+    assert np.array_equal(data_mask[~mask], data[~mask])
+
+    mask_box = engine.integration_mask(geometry=gi_lut, dict_integration=DICT_BOX, shape=data.shape)
+    assert mask_box.shape == data.shape
+    assert 0 < mask_box.sum() < mask_box.size
+
+
+@pytest.mark.parametrize('unit', ['2th_deg', '2th_rad'])
+def test_integration_mask_2theta(gi_lut, data, unit):
+    # The units of the dictionaries are pygix units ('2th_deg' is '2theta_deg' for pygix)
+    scale = 180 / np.pi if unit == '2th_deg' else 1.0
+    ip_range, oop_range = [0.0, 0.01 * scale], [-0.01 * scale, 0.0]
+    dict_box = dict(DICT_BOX, input_unit=unit, ip_range=ip_range, oop_range=oop_range)
+    mask_box = MaskEngine().integration_mask(geometry=gi_lut, dict_integration=dict_box, shape=data.shape)
+
+    horz, vert = gi_lut.giarray_from_unit(data.shape, "opbox", "center", UNIT_GI[unit])
+    inside = (horz > 0.0) & (horz < 0.01) & (vert > -0.01) & (vert < 0.0)
+    assert np.array_equal(mask_box, ~inside)
+    assert 0 < mask_box.sum() < mask_box.size
+
+    dict_cake = dict(DICT_AZIMUTHAL, unit=unit, radial_range=[0.005 * scale, 0.015 * scale])
+    mask_cake = MaskEngine().integration_mask(geometry=gi_lut, dict_integration=dict_cake, shape=data.shape)
+    assert 0 < mask_cake.sum() < mask_cake.size
+
+
+def test_reshape_cache(gi_lut, data):
+    data_reshape, q, chi = gi_lut.map_reshaping(data=data, npt_rad=500, npt_azim=180)
+    assert data_reshape.shape == (180, 500)
+
+    hits = gi_lut._reshape_cache.hits
+    data_cache, _, _ = gi_lut.map_reshaping(data=data, npt_rad=500, npt_azim=180)
+    assert gi_lut._reshape_cache.hits == hits + 1
+    assert data_cache is data_reshape
+
+    data_reshape_2, _, _ = gi_lut.map_reshaping(data=data, npt_rad=200, npt_azim=180)
+    assert data_reshape_2.shape == (180, 200)
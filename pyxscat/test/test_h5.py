@@ -378,4 +378,27 @@ class TestH5GI:
             norm_factor=1.0,
             list_dict_integration=list_dict_integration,
             ):
-            assert res is not None
\ No newline at end of file
+            assert res is not None
+
+def test_update_new_data_fast(tmp_path):
+    import numpy as np
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    data = np.zeros((8, 8), dtype=np.uint16)
+    fabio.edfimage.EdfImage(data=data, header={'Exposure' : 1}).write(str(entry.joinpath('frame_0.edf')))
+    broken = entry.joinpath('frame_1.edf')
+    broken.write_bytes(b'not an edf file')
+
+    h5 = H5GIIntegrator(root_directory=str(tmp_path), output_filename_h5=str(tmp_path.joinpath('sample.h5')))
+    dict_new_data = h5.update_new_data_fast(pattern='*.edf', processes=1)
+
+    # The broken file is reported, it does not stop the update
+    assert dict_new_data[str(entry)]['filenames'] == [str(entry.joinpath('frame_0.edf'))]
+    assert list(h5.get_failed_files()) == [str(broken)]
+
+    # Only the failed file is read again
+    fabio.edfimage.EdfImage(data=data, header={'Exposure' : 2}).write(str(broken))
+    dict_new_data = h5.update_new_data_fast(pattern='*.edf', processes=1)
+    assert dict_new_data[str(entry)]['filenames'] == [str(broken)]
+    assert h5.dict_data[str(entry)]['Exposure'] == [1.0, 2.0]
+    assert not h5.get_failed_files()
@@ -0,0 +1,385 @@
+from pyxscat.metadata import MetadataBase, FILENAMES
+from pyxscat.other.column_methods import MetadataColumn
+from pyxscat.other.frame_methods import FrameCache
+from pyxscat.other.header_methods import HeaderCache
+from pyxscat.other.source_methods import FrameSourcePool, frame_address, open_frame_source
+from pyxscat.other.walk_methods import DirectoryWalker
+import fabio
+import gc
+import h5py
+import numpy as np
+import os
+import pytest
+
+NFRAMES = 5
+SHAPE = (16, 12)
+
+
+@pytest.fixture(autouse=True)
+def json_file(tmp_path_factory, monkeypatch):
+    # The metadatabases (and their header caches) are written in a temporary folder
+    json_file = tmp_path_factory.mktemp('metadatabases').joinpath('test_pyxscat_mdb.json')
+    monkeypatch.setattr(MetadataBase, '_get_json_file', lambda self: json_file)
+    return json_file
+
+
+@pytest.fixture
+def stack():
+    return np.arange(NFRAMES * SHAPE[0] * SHAPE[1], dtype=np.uint16).reshape((NFRAMES,) + SHAPE)
+
+
+@pytest.fixture
+def container_directory(tmp_path, stack):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    with h5py.File(entry.joinpath('master.h5'), 'w') as f:
+        f.create_dataset('entry/data/data_000001', data=stack[:3], chunks=(1,) + SHAPE, compression='gzip')
+        f.create_dataset('entry/data/data_000002', data=stack[3:], chunks=(1,) + SHAPE, compression='gzip')
+        f.create_dataset('entry/instrument/detector/count_time', data=0.5)
+        f.create_dataset('entry/instrument/detector/exposure', data=np.arange(NFRAMES) * 10.0)
+    return tmp_path
+
+
+def test_hdf5_frame_source(container_directory, stack):
+    filename = container_directory.joinpath('sample', 'master.h5')
+    source = open_frame_source(filename=filename)
+    assert len(source) == NFRAMES
+    for index in range(NFRAMES):
+        assert np.array_equal(source.get_frame(index=index), stack[index])
+    header = source.get_header(index=4)
+    assert header['count_time'] == 0.5
+    assert header['exposure'] == 40.0
+    assert (header['Dim_1'], header['Dim_2']) == (SHAPE[1], SHAPE[0])
+    with pytest.raises(IndexError):
+        source.get_frame(index=NFRAMES)
+    source.close()
+
+
+def test_multiframe_edf_source(tmp_path, stack):
+    filename = tmp_path.joinpath('multi.edf')
+    image = fabio.edfimage.EdfImage(data=stack[0], header={'Exposure' : 0})
+    for index in range(1, NFRAMES):
+        image.append_frame(data=stack[index], header={'Exposure' : index})
+    image.write(str(filename))
+
+    source = open_frame_source(filename=filename)
+    assert len(source) == NFRAMES
+    assert np.array_equal(source.get_frame(index=2), stack[2])
+    assert source.get_header(index=3)['Exposure'] == '3'
+
+
+def test_source_pool_close(container_directory, stack):
+    filename = container_directory.joinpath('sample', 'master.h5')
+    filename_copy = container_directory.joinpath('sample', 'copy.h5')
+    filename_copy.write_bytes(filename.read_bytes())
+
+    # The least recently used source is closed when it leaves the pool
+    pool = FrameSourcePool(maxsize=1)
+    source = pool.get_source(filename=filename)
+    assert np.array_equal(pool.get_frame(address=frame_address(filename=filename, index=1)), stack[1])
+    pool.get_source(filename=filename_copy)
+    assert not source._file.id.valid
+    assert len(pool) == 1
+
+    # A modified file replaces its source, the old one is closed
+    pool = FrameSourcePool(maxsize=4)
+    source_copy = pool.get_source(filename=filename_copy)
+    stat = os.stat(filename_copy)
+    os.utime(filename_copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert pool.get_source(filename=filename_copy) is not source_copy
+    assert not source_copy._file.id.valid
+    assert len(pool) == 1
+
+    source_copy = pool.get_source(filename=filename_copy)
+    pool.clear()
+    assert not source_copy._file.id.valid
+    assert len(pool) == 0
+
+    # A source in use is closed by its last reader, not when it leaves the pool
+    pool = FrameSourcePool(maxsize=1)
+    with pool.use_source(filename=filename) as source:
+        with pool.use_source(filename=filename) as source_again:
+            assert source_again is source
+        pool.get_source(filename=filename_copy)
+        assert source._file.id.valid
+        assert np.array_equal(source.get_frame(index=2), stack[2])
+    assert not source._file.id.valid
+
+
+def test_metadata_containers(container_directory, stack):
+    metadata = MetadataBase(directory=str(container_directory), pattern='*.h5')
+    entry = str(container_directory.joinpath('sample'))
+    filename = str(container_directory.joinpath('sample', 'master.h5'))
+
+    list_files = metadata.get_files_in_entry(entry_name=entry)
+    assert list_files == [frame_address(filename=filename, index=index) for index in range(NFRAMES)]
+    assert metadata.get_metadata_in_entry(entry_name=entry, metadata_key='exposure') == [10.0 * index for index in range(NFRAMES)]
+
+    # The container is not added again
+    assert not metadata.update(return_dict=True)
+
+    frame_cache = FrameCache()
+    for index, address in enumerate(list_files):
+        assert np.array_equal(frame_cache.get_frame(filename=address), stack[index])
+
+
+def test_header_cache(container_directory, stack, json_file, monkeypatch):
+    entry = container_directory.joinpath('sample')
+    for index in range(3):
+        fabio.edfimage.EdfImage(data=stack[index], header={'Exposure' : index}).write(str(entry.joinpath(f'frame_{index}.edf')))
+
+    metadata = MetadataBase(directory=str(container_directory), pattern='*.*')
+    assert json_file.with_suffix('.sqlite').is_file()
+    list_files = metadata.get_files_in_entry(entry_name=str(entry))
+    exposure = metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key='Exposure')
+    assert len(list_files) == NFRAMES + 3
+
+    # A rescan of the unchanged files does not open any of them
+    def fail(*args, **kwargs):
+        raise AssertionError('The file was opened.')
+    monkeypatch.setattr('pyxscat.metadata.MetadataBase._read_header', fail)
+    monkeypatch.setattr('pyxscat.metadata.iter_frame_addresses', fail)
+    monkeypatch.setattr('pyxscat.metadata.MetadataBase._index_file', fail)
+    metadata = MetadataBase(directory=str(container_directory), pattern='*.*')
+    assert metadata.get_files_in_entry(entry_name=str(entry)) == list_files
+    assert metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key='Exposure') == exposure
+    assert metadata.header_cache.stats()['misses'] == 0
+
+    # A modified file is read again
+    monkeypatch.undo()
+    monkeypatch.setattr(MetadataBase, '_get_json_file', lambda self: json_file)
+    fabio.edfimage.EdfImage(data=stack[4], header={'Exposure' : 7, 'Comment' : 'rewritten'}).write(str(entry.joinpath('frame_0.edf')))
+    metadata = MetadataBase(directory=str(container_directory), pattern='*.*')
+    assert metadata.header_cache.stats()['misses'] == 1
+    assert metadata.get_metadata(entry_name=str(entry), index=0, metadata_key='Exposure') == 7.0
+
+
+def test_header_cache_close(tmp_path, stack, json_file):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    filename = str(entry.joinpath('frame.edf'))
+    fabio.edfimage.EdfImage(data=stack[0], header={'Exposure' : 3}).write(filename)
+
+    # The headers read outside of an update are written when the MetadataBase is closed
+    with MetadataBase(directory=str(tmp_path), pattern='*.h5') as metadata:
+        header_cache = metadata.header_cache
+        assert metadata._get_header(filename=filename)['Exposure'] == 3.0
+        assert header_cache.stats() == {'hits' : 0, 'misses' : 1}
+    assert metadata.header_cache is None
+    assert header_cache.closed
+
+    header_cache = HeaderCache(filename=json_file.with_suffix('.sqlite'))
+    assert header_cache.get(address=filename)['Exposure'] == 3.0
+    assert header_cache.stats() == {'hits' : 1, 'misses' : 0}
+
+    # Also when the cache is garbage collected
+    header_cache.set(address=frame_address(filename=filename, index=0), header={'Exposure' : 4})
+    del header_cache
+    gc.collect()
+    header_cache = HeaderCache(filename=json_file.with_suffix('.sqlite'))
+    assert len(header_cache) == 2
+    header_cache.close()
+
+
+def test_parallel_headers(tmp_path, stack):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    for index in range(20):
+        fabio.edfimage.EdfImage(data=stack[index % NFRAMES], header={'Exposure' : index}).write(str(entry.joinpath(f'frame_{index:02d}.edf')))
+    entry.joinpath('broken.edf').write_bytes(b'not an edf file')
+
+    sequential = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False, max_workers=1)
+    parallel = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False, max_workers=4)
+    assert dict(parallel.container[str(entry)]) == dict(sequential.container[str(entry)])
+    assert parallel.get_metadata_in_entry(entry_name=str(entry), metadata_key='Exposure') == [float(index) for index in range(20)]
+
+    # The broken file is reported, not added
+    assert list(parallel.get_failed_files()) == [str(entry.joinpath('broken.edf'))]
+    assert str(entry.joinpath('broken.edf')) not in parallel.get_files_in_entry(entry_name=str(entry))
+
+
+def test_process_headers(container_directory, stack):
+    entry = container_directory.joinpath('sample')
+    for index in range(4):
+        fabio.edfimage.EdfImage(data=stack[index], header={'Exposure' : index}).write(str(entry.joinpath(f'frame_{index}.edf')))
+    entry.joinpath('broken.edf').write_bytes(b'not an edf file')
+
+    # The frames of every file are indexed in the same task that reads their headers
+    threads = MetadataBase(directory=str(container_directory), pattern='*.*', header_cache=False, max_workers=2)
+    processes = MetadataBase(directory=str(container_directory), pattern='*.*', header_cache=False, max_workers=2, executor='process')
+    assert dict(processes.container[str(entry)]) == dict(threads.container[str(entry)])
+    assert len(processes.get_files_in_entry(entry_name=str(entry))) == NFRAMES + 4
+    assert list(processes.get_failed_files()) == [str(entry.joinpath('broken.edf'))]
+
+
+def test_metadata_index(tmp_path, stack):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    for index in range(4):
+        fabio.edfimage.EdfImage(data=stack[index], header={'Exposure' : index}).write(str(entry.joinpath(f'frame_{index}.edf')))
+    list_files = [str(entry.joinpath(f'frame_{index}.edf')) for index in range(4)]
+
+    metadata = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False)
+    assert [metadata.get_file_location(filename=filename) for filename in list_files] == [(str(entry), row) for row in range(4)]
+    assert metadata.get_filenames(entry_name=str(entry), index=[3, 1]) == [list_files[1], list_files[3]]
+    assert metadata.get_metadata(entry_name=str(entry), index=2, metadata_key='Exposure') == 2.0
+
+    # The rows after a removed file move up
+    entry.joinpath('frame_1.edf').unlink()
+    metadata.update(removed_files=True)
+    assert metadata.get_file_location(filename=list_files[1]) is None
+    assert metadata.get_file_location(filename=list_files[3]) == (str(entry), 2)
+
+    # Appended files are indexed, the index of a saved metadatabase is built again after loading
+    fabio.edfimage.EdfImage(data=stack[4], header={'Exposure' : 4}).write(str(entry.joinpath('frame_4.edf')))
+    metadata.update()
+    assert metadata.get_file_location(filename=str(entry.joinpath('frame_4.edf'))) == (str(entry), 3)
+    metadata.save(output_directory=str(tmp_path))
+
+    loaded = MetadataBase(json_file=str(tmp_path.joinpath(f'{tmp_path.name}_pyxscat_mdb.json')), update_metadata=False, header_cache=False)
+    for filename in metadata.get_files_in_entry(entry_name=str(entry)):
+        assert loaded.get_file_location(filename=filename) == metadata.get_file_location(filename=filename)
+
+
+def test_directory_walker(tmp_path, stack):
+    for name in ('a', 'b', 'b/c'):
+        tmp_path.joinpath(name).mkdir()
+        fabio.edfimage.EdfImage(data=stack[0], header={}).write(str(tmp_path.joinpath(name, 'frame_0.edf')))
+    tmp_path.joinpath('b', 'calibration.poni').write_text('')
+    tmp_path.joinpath('b', 'notes.txt').write_text('')
+
+    walker = DirectoryWalker(directory=tmp_path, pattern='*.edf')
+    assert walker.scan() == {str(tmp_path.joinpath(name)) for name in ('', 'a', 'b', 'b/c')}
+    assert walker.get_files()[str(tmp_path.joinpath('b'))] == [str(tmp_path.joinpath('b', 'frame_0.edf'))]
+    assert walker.get_ponifiles() == [str(tmp_path.joinpath('b', 'calibration.poni'))]
+
+    # Directories with an old mtime are not listed again
+    for directory in walker.get_directories():
+        os.utime(directory, ns=(0, 0))
+    walker.scan()
+    walker.commit()
+    assert walker.scan() == set()
+
+    metadata = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False)
+    new_file = str(tmp_path.joinpath('b', 'c', 'frame_1.edf'))
+    fabio.edfimage.EdfImage(data=stack[1], header={}).write(new_file)
+    assert walker.scan() == {str(tmp_path.joinpath('b', 'c'))}
+    assert metadata.update(return_dict=True) == {str(tmp_path.joinpath('b', 'c')) : [new_file]}
+    assert metadata.get_ponifiles() == [str(tmp_path.joinpath('b', 'calibration.poni'))]
+
+
+def test_retry_failed_files(tmp_path, stack):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    fabio.edfimage.EdfImage(data=stack[0], header={'Exposure' : 0}).write(str(entry.joinpath('frame_0.edf')))
+    broken = str(entry.joinpath('frame_1.edf'))
+    with open(broken, 'wb') as f:
+        f.write(b'not an edf file')
+    for directory in (tmp_path, entry):
+        os.utime(directory, ns=(0, 0))
+
+    metadata = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False)
+    assert list(metadata.get_failed_files()) == [broken]
+
+    # The failed file is tried again in every update
+    assert metadata.update(return_dict=True) == {str(entry) : [broken]}
+    assert list(metadata.get_failed_files()) == [broken]
+
+    # The file is completed in place: the mtime of the directory does not change, but the file is read again
+    fabio.edfimage.EdfImage(data=stack[1], header={'Exposure' : 1}).write(broken)
+    os.utime(entry, ns=(0, 0))
+    assert metadata._walker.scan() == set()
+    assert metadata.update(return_dict=True) == {str(entry) : [broken]}
+    assert metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key='Exposure') == [0.0, 1.0]
+    assert not metadata.get_failed_files()
+    assert not metadata.update(return_dict=True)
+
+
+def test_columnar_metadata(tmp_path, stack):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    for index in range(6):
+        header = {'Exposure' : index * 0.5, 'Comment' : 'dark' if index % 2 else 'sample'}
+        fabio.edfimage.EdfImage(data=stack[index % NFRAMES], header=header).write(str(entry.joinpath(f'frame_{index}.edf')))
+
+    lists = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False)
+    columns = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False, columnar=True)
+    for metadata_key in lists.get_all_metadata_in_entry(entry_name=str(entry)):
+        assert columns.get_metadata_in_entry(entry_name=str(entry), metadata_key=metadata_key) == lists.get_metadata_in_entry(entry_name=str(entry), metadata_key=metadata_key)
+
+    exposure = columns.get_metadata_in_entry(entry_name=str(entry), metadata_key='Exposure')
+    assert exposure.kind == 'float'
+    # The filenames and names are unique in every row, they are not dictionary-encoded
+    assert type(columns.container[str(entry)][FILENAMES]) is list
+    assert type(columns.container[str(entry)]['names']) is list
+    assert columns.get_metadata_in_entry(entry_name=str(entry), metadata_key='Comment').kind == 'string'
+
+    # The numeric columns of the DataFrame share the memory of the column
+    list_keys = ['Exposure', 'Comment', 'names']
+    dataframe = columns.get_dataframe_metadata(entry_name=str(entry), list_keys=list_keys)
+    assert np.shares_memory(dataframe['Exposure'].to_numpy(), exposure.to_numpy())
+    assert dataframe.astype(object).equals(lists.get_dataframe_metadata(entry_name=str(entry), list_keys=list_keys).astype(object))
+
+    # Same .json file, and the columns are rebuilt after loading
+    columns.save(output_directory=str(tmp_path))
+    json_file = tmp_path.joinpath(f'{tmp_path.name}_pyxscat_mdb.json')
+    loaded = MetadataBase(json_file=str(json_file), update_metadata=False, header_cache=False, columnar=True)
+    assert loaded.get_metadata_in_entry(entry_name=str(entry), metadata_key='Exposure') == [index * 0.5 for index in range(6)]
+    assert type(loaded.container[str(entry)][FILENAMES]) is list
+    lists.save(output_directory=str(tmp_path.joinpath('sample')))
+    assert json_file.read_text() == tmp_path.joinpath('sample', f'{tmp_path.name}_pyxscat_mdb.json').read_text()
+
+
+def test_metadata_column():
+    column = MetadataColumn(values=[1.0, None, 3.0])
+    assert column == [1.0, None, 3.0]
+    assert column.mask.tolist() == [True, False, True]
+    assert np.isnan(column.to_numpy()[1])
+
+    # A string turns the column into dictionary-encoded strings
+    column.append('x')
+    assert column.kind == 'string'
+    assert column == ['1.0', None, '3.0', 'x']
+    del column[0]
+    assert column == [None, '3.0', 'x']
+    assert column[-1] == 'x'
+
+    # The codes grow with the number of categories
+    column.extend(values=[f'value_{index}' for index in range(300)])
+    assert column.to_numpy().dtype == np.int16
+    assert list(column.to_pandas()[-2:]) == ['value_298', 'value_299']
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_heterogeneous_headers(tmp_path, stack, columnar):
+    entry = tmp_path.joinpath('sample')
+    entry.mkdir()
+    list_headers = [
+        {'Exposure' : 1},
+        {'Exposure' : 2, 'Temperature' : 300},
+        {'Exposure' : 3, 'Comment' : 'after'},
+        {'Temperature' : 310},
+    ]
+    for index, header in enumerate(list_headers):
+        fabio.edfimage.EdfImage(data=stack[index], header=header).write(str(entry.joinpath(f'frame_{index}.edf')))
+
+    metadata = MetadataBase(directory=str(tmp_path), pattern='*.edf', header_cache=False, columnar=columnar)
+    nfiles = len(list_headers)
+    schema = metadata.get_schema(entry_name=str(entry))
+    assert all(len(metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key=key)) == nfiles for key in schema)
+    assert schema['Temperature'] == 'float'
+    assert schema['Comment'] == 'string'
+
+    # The value of row i belongs to file i
+    assert metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key='Temperature') == [None, 300.0, None, 310.0]
+    assert metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key='Comment') == [None, None, 'after', None]
+    assert metadata.get_metadata(entry_name=str(entry), index=3, metadata_key='Exposure') is None
+
+    dataframe = metadata.get_dataframe_metadata(entry_name=str(entry), list_keys=['Exposure', 'Temperature'])
+    assert dataframe.shape == (nfiles, 3)
+    assert np.isnan(dataframe['Temperature'].to_numpy(dtype=float)[[0, 2]]).all()
+
+    # Removing a file keeps the table rectangular
+    entry.joinpath('frame_1.edf').unlink()
+    metadata.update(removed_files=True)
+    assert metadata.get_metadata_in_entry(entry_name=str(entry), metadata_key='Temperature') == [None, None, 310.0]
@@ -0,0 +1,68 @@
+from pyxscat.nx_methods import convert_folder_to_h5, ENTRY_KEY, DATA_GROUP_KEY, DATA_KEY, METADATA_GROUP_KEY, FILENAMES_KEY
+from pyxscat.other.source_methods import open_frame_source
+from pathlib import Path
+import fabio
+import h5py
+import numpy as np
+
+TEST_PATH = Path(__file__).parent
+FOLDER = TEST_PATH.joinpath('test_edf', 'test_DUBBLE', 'Air', 'WAXS')
+LIST_FILES = sorted(str(filename) for filename in FOLDER.glob('*.edf'))
+
+
+def test_convert_folder(tmp_path):
+    h5_file = tmp_path.joinpath('waxs.h5')
+    report = convert_folder_to_h5(folder=FOLDER, h5_file=h5_file, max_workers=2, batch_size=4)
+    assert report['converted'] == len(LIST_FILES)
+    assert not report['failed']
+    assert report['files_per_second'] > 0
+
+    with h5py.File(h5_file, 'r') as f:
+        stack = f[ENTRY_KEY][DATA_GROUP_KEY][DATA_KEY]
+        assert stack.shape[0] == len(LIST_FILES)
+        assert stack.chunks == (1,) + stack.shape[1:]
+        assert stack.compression == 'gzip'
+        for index, filename in enumerate(LIST_FILES):
+            assert np.array_equal(stack[index], fabio.open(filename).data)
+
+        filenames = [filename.decode() for filename in f[ENTRY_KEY][FILENAMES_KEY][()]]
+        assert filenames == LIST_FILES
+        metadata = f[ENTRY_KEY][METADATA_GROUP_KEY]
+        header = fabio.open(LIST_FILES[-1]).header
+        assert metadata['Dim_1'][-1] == float(header['Dim_1'])
+
+    # Interrupted conversion: only the recorded files are kept, the rest are converted again
+    with h5py.File(h5_file, 'a') as f:
+        f[ENTRY_KEY][FILENAMES_KEY].resize(2, axis=0)
+    report = convert_folder_to_h5(folder=FOLDER, h5_file=h5_file, max_workers=1)
+    assert (report['converted'], report['skipped']) == (len(LIST_FILES) - 2, 2)
+
+    source = open_frame_source(filename=h5_file)
+    assert len(source) == len(LIST_FILES)
+    assert np.array_equal(source.get_frame(index=3), fabio.open(LIST_FILES[3]).data)
+    assert source.get_header(index=3)[FILENAMES_KEY] == LIST_FILES[3]
+    source.close()
+
+
+def test_convert_heterogeneous(tmp_path):
+    folder = tmp_path.joinpath('series')
+    folder.mkdir()
+    stack = np.arange(4 * 16 * 12, dtype=np.int32).reshape((4, 16, 12))
+    list_counters = ['1.5', '2', 'closed', '4']
+    for index, counter in enumerate(list_counters):
+        fabio.edfimage.EdfImage(data=stack[index], header={'Counter' : counter}).write(str(folder.joinpath(f'frame_{index}.edf')))
+    # Different shape than the first frame
+    fabio.edfimage.EdfImage(data=stack[0, :8], header={'Counter' : '5'}).write(str(folder.joinpath('frame_9.edf')))
+
+    h5_file = tmp_path.joinpath('series.h5')
+    report = convert_folder_to_h5(folder=folder, h5_file=h5_file, max_workers=1, batch_size=2, compression=None)
+    failed_file = str(folder.joinpath('frame_9.edf'))
+    assert report['converted'] == 4
+    assert report['failed'] == [failed_file]
+    assert 'shape' in report['errors'][failed_file]
+
+    with h5py.File(h5_file, 'r') as f:
+        assert np.array_equal(f[ENTRY_KEY][DATA_GROUP_KEY][DATA_KEY][()], stack)
+        # The float column became a string column when 'closed' arrived in the second batch
+        counter = f[ENTRY_KEY][METADATA_GROUP_KEY]['Counter'].asstr()[()].tolist()
+        assert counter == ['1.5', '2.0', 'closed', '4.0']